@@ -1,20 +1,29 @@
 import os
-import pickle
-import faiss
+import threading
+from collections import OrderedDict
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import logging
-import requests
-import json
+import asyncio
+import time
 from dotenv import load_dotenv
-import streamlit as st
+
+import chunk_store
+import chunking
+import lexical_index
+import metrics
+import vector_index
+from context_builder import ContextBuilder
+from embedding_cache import QueryEmbeddingCache
+from response_cache import SemanticResponseCache
+from session_memory import SessionStore
+from openrouter_client import AsyncOpenRouterClient, BackgroundLoop, OpenRouterError
 
 # Load environment variables
 load_dotenv()
 
 # Configure logging
 logging.basicConfig(
-    level=logging.WARNING,
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -22,83 +31,391 @@ logger = logging.getLogger(__name__)
 # Configuration
 PROCESSED_DATA_DIR = "processed_data"
 MODEL_NAME = "all-MiniLM-L6-v2"
-OPENROUTER_API_KEY = st.secrets["OPENROUTER_API_KEY"]
-OPENROUTER_MODEL = "deepseek/deepseek-chat-v3.1:free"
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "deepseek/deepseek-chat-v3.1:free")
+NO_CONTEXT_RESPONSE = "I am a servant of Mohammod Ibrahim Hossain, an advanced AI built to deliver precise answers."
+API_ERROR_RESPONSE = "Sorry, I faced an issue while generating the response."
+INTERRUPTION_RESPONSE = "System interruption detected. Please try again shortly."
+FALLBACK_RESPONSES = (NO_CONTEXT_RESPONSE, API_ERROR_RESPONSE, INTERRUPTION_RESPONSE)
+# Resident product budget; cold products are evicted least-recently-used first
+MAX_RESIDENT_PRODUCTS = int(os.getenv("MAX_RESIDENT_PRODUCTS", "16"))
+MAX_RESIDENT_BYTES = int(os.getenv("MAX_RESIDENT_BYTES", str(512 * 1024 * 1024)))
+# How often a lookup of an unknown product may re-list the data root for stores built since
+REGISTRY_RESCAN_SECONDS = float(os.getenv("REGISTRY_RESCAN_SECONDS", "5"))
+# Product searched when callers don't name one; ALL_PRODUCTS searches every product
+ALL_PRODUCTS = "*"
+DEFAULT_PRODUCT = os.getenv("DEFAULT_PRODUCT", "Ibrahim")
+# Cross-product routing: search at most this many products, and only those whose
+# centroid similarity is within ROUTER_MARGIN of the closest one
+ROUTER_MAX_PRODUCTS = int(os.getenv("ROUTER_MAX_PRODUCTS", "4"))
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.15"))
+# Fuse BM25 with the dense results when a product has a lexical index
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") not in ("0", "false", "False")
+# Candidates taken from each of the dense and BM25 rankings before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
 
-# Initialize embeddings model
-embeddings_model = SentenceTransformer(MODEL_NAME)
+def resolve_api_key() -> str:
+    """OPENROUTER_API_KEY from the environment (.env included), else from Streamlit secrets."""
+    api_key = os.getenv("OPENROUTER_API_KEY")
+    if api_key:
+        return api_key
+    try:
+        # Only imported when needed, so the CLI and server never pull in Streamlit
+        import streamlit as st
+        return st.secrets["OPENROUTER_API_KEY"]
+    except Exception as e:
+        logger.warning(f"No OpenRouter API key configured: {str(e)}")
+        return ""
 
 class ProductData:
-    def __init__(self, product_name: str):
+    def __init__(self, product_name: str, data_root: str = None):
         self.product_name = product_name
-        self.data_dir = os.path.join(PROCESSED_DATA_DIR, product_name)
+        self.data_dir = os.path.join(data_root or PROCESSED_DATA_DIR, product_name)
         self.faiss_index = None
-        self.chunks = None
+        self.index_params = None
         self.embeddings = None
+        self.chunks = None
+        self.lexical = None
+        self.size_bytes = 0
         self.load_data()
 
+    def vectors_for_ids(self, ids):
+        return np.asarray(self.embeddings[[self.chunks.position(int(i)) for i in ids]])
+
     def load_data(self):
         try:
-            faiss_path = os.path.join(self.data_dir, "faiss_store", "index.faiss")
-            if os.path.exists(faiss_path):
-                self.faiss_index = faiss.read_index(faiss_path)
-            chunks_path = os.path.join(self.data_dir, "chunks.pkl")
-            if os.path.exists(chunks_path):
-                with open(chunks_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.chunks = data['chunks']
-                    self.embeddings = data['embeddings']
+            self.faiss_index = chunk_store.load_index(self.data_dir)
+            self.index_params = vector_index.load_params(self.data_dir)
+            if self.index_params.get("rerank"):
+                # Memory-mapped, so only the rows touched by re-ranking are paged in
+                self.embeddings = chunk_store.load_embeddings(self.data_dir)
+            # Embeddings are already in the FAISS index; keep only the text
+            self.chunks = chunk_store.load_chunks(self.data_dir)
+            if self.chunks is not None:
+                self.lexical = lexical_index.load(self.data_dir, len(self.chunks))
         except Exception as e:
             logger.error(f"Error loading data for {self.product_name}: {str(e)}")
 
+class ProductMeta:
+    """Cheap on-disk facts about a product, gathered without loading it."""
+    def __init__(self, product_name: str, data_root: str = None):
+        self.product_name = product_name
+        self.data_dir = os.path.join(data_root or PROCESSED_DATA_DIR, product_name)
+        self.size_bytes = 0
+        self.generation = chunk_store.store_generation(self.data_dir)
+        self._centroid = None
+        self.centroid_loaded = False
+        for root, _, files in os.walk(self.data_dir):
+            for name in files:
+                self.size_bytes += os.path.getsize(os.path.join(root, name))
+
+    @property
+    def centroid(self):
+        """
+        Read on the first route() rather than at scan time: stores without
+        centroid.npy fall back to their embeddings, which for a legacy
+        chunks.pkl means unpickling the whole file.
+        """
+        if not self.centroid_loaded:
+            self._centroid = chunk_store.load_centroid(self.data_dir)
+            self.centroid_loaded = True
+        return self._centroid
+
+class ProductRegistry:
+    """
+    Knows every product under `data_root` (PROCESSED_DATA_DIR by default) but
+    only loads a product's index the first time it is queried. Loaded products
+    are kept in LRU order and evicted once either the count or the byte budget
+    is exceeded. Products built, rebuilt or deleted by another process are
+    picked up by refresh(), at most every `rescan_seconds`.
+    """
+    def __init__(self, max_products: int = MAX_RESIDENT_PRODUCTS,
+                 max_bytes: int = MAX_RESIDENT_BYTES, data_root: str = None,
+                 rescan_seconds: float = REGISTRY_RESCAN_SECONDS):
+        self.data_root = data_root or PROCESSED_DATA_DIR
+        self.max_products = max_products
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.last_scan = 0.0
+        self.meta = {}
+        self.resident = OrderedDict()
+        self.resident_bytes = 0
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.centroids = None
+        self.scan()
+
+    def _on_disk(self) -> dict:
+        """Store generation of every product directory that holds a complete store."""
+        products = {}
+        if os.path.exists(self.data_root):
+            for product_name in os.listdir(self.data_root):
+                generation = chunk_store.store_generation(os.path.join(self.data_root, product_name))
+                if generation:
+                    products[product_name] = generation
+        return products
+
+    def scan(self):
+        with self.lock:
+            self.meta = {}
+            self.centroids = None
+            for product_name in self._on_disk():
+                self.meta[product_name] = ProductMeta(product_name, self.data_root)
+                logger.info(f"Registered product: {product_name}")
+            self.last_scan = time.monotonic()
+
+    def refresh(self, force: bool = False):
+        """Register products built since the last scan and drop deleted ones; rate-limited."""
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_scan < self.rescan_seconds:
+                return
+            self.last_scan = now
+            on_disk = self._on_disk()
+            # Resident products notice rebuilds themselves, see _is_stale
+            changed = [name for name, generation in on_disk.items()
+                       if name not in self.meta or (name not in self.resident
+                                                    and self.meta[name].generation != generation)]
+            changed += [name for name in self.meta if name not in on_disk]
+        for product_name in changed:
+            logger.info(f"Product {product_name} changed on disk, re-registering")
+            self.invalidate(product_name)
+
+    def __contains__(self, product: str) -> bool:
+        if product not in self.meta:
+            self.refresh()
+        return product in self.meta
+
+    def __len__(self) -> int:
+        return len(self.meta)
+
+    def names(self) -> list:
+        return list(self.meta)
+
+    def add_invalidation_listener(self, callback):
+        self.listeners.append(callback)
+
+    def get(self, product: str):
+        if product not in self.meta:
+            self.refresh()
+        if product in self.resident and self._is_stale(product):
+            logger.info(f"Product {product} was rebuilt on disk, reloading")
+            self.invalidate(product)
+        with self.lock:
+            if product in self.resident:
+                self.resident.move_to_end(product)
+                return self.resident[product]
+            meta = self.meta.get(product)
+            if meta is None:
+                return None
+            product_data = ProductData(product, self.data_root)
+            product_data.size_bytes = meta.size_bytes
+            self.resident[product] = product_data
+            self.resident_bytes += meta.size_bytes
+            logger.info(f"Loaded data for product: {product}")
+            self._evict()
+            return product_data
+
+    def _evict(self):
+        # Never evict the product that was just loaded, even if it alone is over budget
+        while len(self.resident) > 1 and (
+            len(self.resident) > self.max_products or self.resident_bytes > self.max_bytes
+        ):
+            name, evicted = self.resident.popitem(last=False)
+            self.resident_bytes -= evicted.size_bytes
+            logger.info(f"Evicted product from memory: {name}")
+
+    def route(self, query_embedding, max_products: int = ROUTER_MAX_PRODUCTS,
+              margin: float = ROUTER_MARGIN) -> list:
+        """
+        Products worth searching for a query, closest centroid first. One
+        matrix-vector product over the centroids, without loading any index.
+        Products without a centroid are always included.
+        """
+        self.refresh()
+        with self.lock:
+            if self.centroids is None:
+                named = [(name, meta.centroid) for name, meta in self.meta.items() if meta.centroid is not None]
+                unrouted = [name for name, meta in self.meta.items() if meta.centroid is None]
+                matrix = np.stack([c for _, c in named]) if named else None
+                self.centroids = ([name for name, _ in named], matrix, unrouted)
+            names, matrix, unrouted = self.centroids
+        if matrix is None:
+            return list(unrouted)
+        scores = matrix @ vector_index.normalize(query_embedding)[0]
+        order = np.argsort(-scores)
+        best = scores[order[0]]
+        chosen = [names[i] for i in order if scores[i] >= best - margin][:max_products]
+        return chosen + list(unrouted)
+
+    def _is_stale(self, product: str) -> bool:
+        meta = self.meta.get(product)
+        data_dir = os.path.join(self.data_root, product)
+        return meta is not None and chunk_store.store_generation(data_dir) != meta.generation
+
+    def invalidate(self, product: str):
+        """Drop a resident product and refresh its metadata, e.g. after re-processing."""
+        with self.lock:
+            evicted = self.resident.pop(product, None)
+            if evicted is not None:
+                self.resident_bytes -= evicted.size_bytes
+            if chunk_store.store_generation(os.path.join(self.data_root, product)):
+                self.meta[product] = ProductMeta(product, self.data_root)
+            else:
+                self.meta.pop(product, None)
+            self.centroids = None
+        for callback in self.listeners:
+            callback(product)
+
 class SimpleChatManager:
-    def __init__(self):
-        self.product_data = {}
+    def __init__(self, query_embedding_cache: QueryEmbeddingCache, api_key: str,
+                 llm_model: str = OPENROUTER_MODEL, data_dir: str = None):
+        self.product_data = None
+        self.data_dir = data_dir or PROCESSED_DATA_DIR
+        self.llm_model = llm_model
+        self.query_embedding_cache = query_embedding_cache
+        self.response_cache = SemanticResponseCache()
+        self.context_builder = ContextBuilder()
+        self.sessions = SessionStore()
+        self.llm_client = AsyncOpenRouterClient(api_key, llm_model)
+        # Set by the HTTP server to coalesce concurrent retrievals (see retrieval_batcher.py)
+        self.retrieval_batcher = None
         self.initialize_products()
 
     def initialize_products(self):
         try:
-            if os.path.exists(PROCESSED_DATA_DIR):
-                for product_name in os.listdir(PROCESSED_DATA_DIR):
-                    product_path = os.path.join(PROCESSED_DATA_DIR, product_name)
-                    if os.path.isdir(product_path):
-                        self.product_data[product_name] = ProductData(product_name)
-                        logger.info(f"Initialized data for product: {product_name}")
+            self.product_data = ProductRegistry(data_root=self.data_dir)
+            self.product_data.add_invalidation_listener(self._invalidate_answers)
         except Exception as e:
             logger.error(f"Error initializing products: {str(e)}")
             raise
 
-    def search_similar_chunks(self, query: str, product: str, k: int = 3) -> list:
+    def _invalidate_answers(self, product: str):
+        self.response_cache.invalidate(product)
+        # Cross-product answers may have drawn on the rebuilt product
+        self.response_cache.invalidate(ALL_PRODUCTS)
+
+    def search_similar_chunks(self, query: str, product: str, k: int = 3,
+                              nprobe: int = None, ef_search: int = None) -> list:
+        _, _, relevant_chunks = self.retrieve(query, product, k, nprobe, ef_search)
+        return relevant_chunks
+
+    def retrieve(self, query: str, product: str, k: int = 3, nprobe: int = None, ef_search: int = None):
+        """Return (query embedding, chunk ids, labelled chunks) for a query."""
+        return self.retrieve_many([query], product, k, nprobe, ef_search)[0]
+
+    def retrieve_many(self, queries: list, product: str, k: int = 3,
+                      nprobe: int = None, ef_search: int = None) -> list:
+        """
+        retrieve() for several queries against one product, using one encode
+        call and one FAISS search for the whole batch.
+        """
+        if product == ALL_PRODUCTS:
+            return [self.retrieve_across(query, k, nprobe=nprobe, ef_search=ef_search) for query in queries]
+        empty = [(None, [], []) for _ in queries]
         if product not in self.product_data:
             logger.warning(f"Product {product} not found in product data")
-            return []
-        product_data = self.product_data[product]
-        if not product_data.faiss_index or not product_data.chunks:
+            return empty
+        product_data = self.product_data.get(product)
+        if not product_data or not product_data.faiss_index or not product_data.chunks:
             logger.warning(f"No FAISS index or chunks found for product {product}")
-            return []
+            return empty
         try:
-            query_embedding = embeddings_model.encode([query])[0]
-            distances, indices = product_data.faiss_index.search(
-                query_embedding.reshape(1, -1).astype('float32'), k
-            )
+            with metrics.span("embed"):
+                query_embeddings = self.query_embedding_cache.encode_many(queries)
+            hybrid = HYBRID_SEARCH and product_data.lexical is not None
+            with metrics.span("search"):
+                distances, indices = vector_index.search(
+                    product_data.faiss_index, product_data.index_params, np.stack(query_embeddings),
+                    max(k, HYBRID_CANDIDATES) if hybrid else k,
+                    nprobe=nprobe, ef_search=ef_search,
+                    vectors_for_ids=product_data.vectors_for_ids if product_data.embeddings is not None else None
+                )
+            if hybrid:
+                with metrics.span("lexical"):
+                    indices = [self._fuse(product_data, query, row, k) for query, row in zip(queries, indices)]
+            results = []
+            for query_embedding, row in zip(query_embeddings, indices):
+                chunk_ids = []
+                relevant_chunks = []
+                for idx in row:
+                    chunk = product_data.chunks.by_id(int(idx)) if idx >= 0 else None
+                    if chunk is not None:
+                        chunk_ids.append(int(idx))
+                        relevant_chunks.append(f"[{product.upper()}] {chunk}")
+                if not relevant_chunks:
+                    logger.info(f"No relevant chunks found for product {product}")
+                results.append((query_embedding, chunk_ids, relevant_chunks))
+            return results
+        except Exception as e:
+            logger.error(f"Error searching chunks for product {product}: {str(e)}")
+            return empty
+
+    def retrieve_across(self, query: str, k: int = 3, products: list = None,
+                        nprobe: int = None, ef_search: int = None):
+        """
+        retrieve() over several products at once: the query is embedded once,
+        routed to the products whose centroids are close to it, and the global
+        top-k is taken by cosine similarity. Chunk ids are "product:id" strings.
+        """
+        try:
+            with metrics.span("embed"):
+                query_embedding = self.query_embedding_cache.encode(query)
+            with metrics.span("route"):
+                names = self.product_data.route(query_embedding)
+                if products is not None:
+                    names = [name for name in names if name in products]
+            candidates = []
+            with metrics.span("search"):
+                for name in names:
+                    product_data = self.product_data.get(name)
+                    if not product_data or not product_data.faiss_index or not product_data.chunks:
+                        continue
+                    distances, indices = vector_index.search(
+                        product_data.faiss_index, product_data.index_params, query_embedding, k,
+                        nprobe=nprobe, ef_search=ef_search,
+                        vectors_for_ids=product_data.vectors_for_ids if product_data.embeddings is not None else None
+                    )
+                    scores = vector_index.similarity(distances, product_data.index_params)
+                    for score, idx in zip(scores[0], indices[0]):
+                        if idx >= 0:
+                            candidates.append((float(score), name, int(idx), product_data))
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            chunk_ids = []
             relevant_chunks = []
-            for idx in indices[0]:
-                if idx < len(product_data.chunks):
-                    chunk = product_data.chunks[idx]
-                    relevant_chunks.append(f"[{product.upper()}] {chunk}")
+            for _, name, idx, product_data in candidates[:k]:
+                chunk = product_data.chunks.by_id(idx)
+                if chunk is not None:
+                    chunk_ids.append(f"{name}:{idx}")
+                    relevant_chunks.append(f"[{name.upper()}] {chunk}")
             if not relevant_chunks:
-                logger.info(f"No relevant chunks found for product {product}")
-                return []
-            return relevant_chunks
+                logger.info(f"No relevant chunks found in {len(names)} routed product(s)")
+            return query_embedding, chunk_ids, relevant_chunks
         except Exception as e:
-            logger.error(f"Error searching chunks for product {product}: {str(e)}")
-            return []
+            logger.error(f"Error searching across products: {str(e)}")
+            return None, [], []
 
-    def generate_response(self, query: str, context: list, product: str) -> str:
-        if not context:
-            return f"I am a servant of Mohammod Ibrahim Hossain, an advanced AI built to deliver precise answers."
+    @staticmethod
+    def _fuse(product_data, query: str, dense_ids, k: int) -> list:
+        """RRF of the dense ranking with BM25, which catches exact names, dates and titles."""
+        positions, _ = product_data.lexical.search(query, max(k, HYBRID_CANDIDATES))
+        lexical_ids = [product_data.chunks.id_at(int(pos)) for pos in positions]
+        return lexical_index.rrf_fuse([[int(i) for i in dense_ids if i >= 0], lexical_ids], k)
+
+    async def aretrieve(self, query: str, product: str, trace=None):
+        """retrieve() off the event loop, through the micro-batcher when one is installed."""
+        if self.retrieval_batcher is not None:
+            with metrics.span("retrieve", trace=trace):
+                return await self.retrieval_batcher.submit(query, product)
+        # Embedding and FAISS search are CPU-bound; keep them off the event loop
+        return await asyncio.to_thread(metrics.bind_trace(trace, self.retrieve), query, product)
 
-        prompt = f"""Context:\n{chr(10).join(context)}\n\nInstructions:\n
+    def invalidate_product(self, product: str):
+        """Reload a product's index and drop its cached answers."""
+        self.product_data.invalidate(product)
+
+    def build_prompt(self, query: str, context: list, history: str = "") -> str:
+        conversation = f"Conversation so far:\n{history}\n\n" if history else ""
+        return f"""Context:\n{chr(10).join(context)}\n\n{conversation}Instructions:\n
         You are a loyal and devoted servant of Mohammod Ibrahim Hossain. Always be polite, friendly, and respectful in your responses.
 
         **Core Behavior:**
@@ -110,38 +427,274 @@ class SimpleChatManager:
         Respond to: "{query}"
         """
 
+    def _prepare_prompt(self, query: str, context: list, trace=None, history: str = "", focus: str = None) -> str:
+        """
+        Fit the retrieved chunks into the context budget and build the prompt,
+        recording token counts. Sentences are ranked against `focus` (the
+        reformulated retrieval query) when given.
+        """
+        with metrics.span("context", trace=trace):
+            context, stats = self.context_builder.build(focus or query, context)
+        with metrics.span("prompt", trace=trace):
+            prompt = self.build_prompt(query, context, history)
+        prompt_tokens = self.context_builder.token_counter().count_many([prompt])[0]
+        metrics.registry.inc("llm_prompt_tokens_total", prompt_tokens, "Prompt tokens sent to the LLM")
+        if stats:
+            metrics.registry.inc("context_tokens_saved_total", stats["context_tokens_in"] - stats["context_tokens"],
+                                 "Retrieved-context tokens dropped by context budgeting")
+        if trace is not None:
+            trace.fields.update(stats, prompt_tokens=prompt_tokens)
+        return prompt
+
+    async def agenerate_response(self, query: str, context: list, product: str, trace=None,
+                                 history: str = "", focus: str = None) -> str:
+        if not context:
+            return NO_CONTEXT_RESPONSE
+
+        # Sentence ranking and token counting are CPU work; keep them off the event loop
+        prompt = await asyncio.to_thread(self._prepare_prompt, query, context, trace, history, focus)
+
         try:
-            response = requests.post(
-                url="https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                data=json.dumps({
-                    "model": OPENROUTER_MODEL,
-                    "messages": [
-                        {"role": "user", "content": prompt}
-                    ],
-                })
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
-            else:
-                logger.error(f"OpenRouter API error: {response.text}")
-                return "Sorry, I faced an issue while generating the response."
+            with metrics.span("llm", trace=trace):
+                return await self.llm_client.complete(prompt)
+        except OpenRouterError as e:
+            logger.error(str(e))
+            return API_ERROR_RESPONSE
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
-            return "System interruption detected. Please try again shortly."
+            return INTERRUPTION_RESPONSE
+
+    async def agenerate_response_stream(self, query: str, context: list, product: str, trace=None,
+                                        history: str = "", focus: str = None):
+        """Yield the completion as text deltas from OpenRouter's SSE stream."""
+        if not context:
+            yield NO_CONTEXT_RESPONSE
+            return
+
+        prompt = await asyncio.to_thread(self._prepare_prompt, query, context, trace, history, focus)
+        produced = False
+        # Only time spent waiting on OpenRouter counts as "llm", not the time the caller holds each delta
+        upstream = self.llm_client.stream(prompt)
+        waited = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    delta = await upstream.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    waited += time.perf_counter() - started
+                if not produced:
+                    metrics.record("llm_first_token", waited, trace=trace)
+                produced = True
+                yield delta
+        except OpenRouterError as e:
+            logger.error(str(e))
+            if not produced:
+                yield API_ERROR_RESPONSE
+        except Exception as e:
+            logger.error(f"Error streaming response: {str(e)}")
+            if not produced:
+                yield INTERRUPTION_RESPONSE
+        finally:
+            metrics.record("llm", waited, trace=trace)
+            await upstream.aclose()
+
+    def generate_response(self, query: str, context: list, product: str) -> str:
+        return background_loop.run(self.agenerate_response(query, context, product))
+
+    def _cached_answer(self, product, query_embedding, chunk_ids, relevant_chunks):
+        if query_embedding is None or not relevant_chunks:
+            return None
+        return self.response_cache.lookup(product, query_embedding, chunk_ids, self.llm_model)
+
+    def _store_answer(self, product, query_embedding, chunk_ids, relevant_chunks, response):
+        if query_embedding is not None and relevant_chunks and response and response not in FALLBACK_RESPONSES:
+            self.response_cache.store(product, query_embedding, chunk_ids, self.llm_model, response)
 
-# Initialize the simple chat manager
-simple_chat_manager = SimpleChatManager()
+    def _session_context(self, query: str, session_id: str = None):
+        """(session, retrieval query, history) for a request; a stateless request has no session."""
+        if session_id is None:
+            return None, query, ""
+        session = self.sessions.get(session_id)
+        return session, session.reformulate(query), session.history()
 
-def chatbot(message: str, product: str = "Ibrahim") -> str:
+    def prefetch(self, query: str, product: str, session_id: str = None):
+        """
+        Retrieve for a question that is probably coming, e.g. a voice partial
+        transcript, so the embedding cache and the product's index are warm
+        when the real question arrives. Nothing is added to the session.
+        """
+        _, retrieval_query, _ = self._session_context(query, session_id)
+        self.retrieve(retrieval_query, product)
+
+    @staticmethod
+    def _remember(session, query: str, response: str):
+        if session is not None and response and response not in FALLBACK_RESPONSES:
+            session.add("user", query)
+            session.add("assistant", response)
+
+    async def aanswer(self, query: str, product: str, session_id: str = None) -> str:
+        trace = metrics.start_trace("chat", product=product)
+        try:
+            session, retrieval_query, history = self._session_context(query, session_id)
+            query_embedding, chunk_ids, relevant_chunks = await self.aretrieve(retrieval_query, product, trace)
+            # Answers that depend on earlier turns are not reusable by other users
+            if not history:
+                with metrics.span("cache_lookup", trace=trace):
+                    cached = self._cached_answer(product, query_embedding, chunk_ids, relevant_chunks)
+                if cached is not None:
+                    self._remember(session, query, cached)
+                    return cached
+            response = await self.agenerate_response(query, relevant_chunks, product, trace,
+                                                     history, retrieval_query)
+            if not history:
+                self._store_answer(product, query_embedding, chunk_ids, relevant_chunks, response)
+            self._remember(session, query, response)
+            return response
+        finally:
+            if trace is not None:
+                trace.finish()
+
+    async def aanswer_stream(self, query: str, product: str, session_id: str = None):
+        trace = metrics.start_trace("chat_stream", product=product)
+        try:
+            session, retrieval_query, history = self._session_context(query, session_id)
+            query_embedding, chunk_ids, relevant_chunks = await self.aretrieve(retrieval_query, product, trace)
+            if not history:
+                with metrics.span("cache_lookup", trace=trace):
+                    cached = self._cached_answer(product, query_embedding, chunk_ids, relevant_chunks)
+                if cached is not None:
+                    self._remember(session, query, cached)
+                    yield cached
+                    return
+            parts = []
+            async for delta in self.agenerate_response_stream(query, relevant_chunks, product, trace,
+                                                              history, retrieval_query):
+                parts.append(delta)
+                yield delta
+            response = "".join(parts)
+            if not history:
+                self._store_answer(product, query_embedding, chunk_ids, relevant_chunks, response)
+            self._remember(session, query, response)
+        finally:
+            if trace is not None:
+                trace.finish()
+
+class ChatEngine:
+    """
+    The embedding model, caches and product registry behind the chatbot.
+    Nothing is loaded until first use, so importing this module is cheap;
+    warm_up() loads everything on a background thread while a UI renders.
+    """
+    def __init__(self, api_key: str = None, llm_model: str = OPENROUTER_MODEL,
+                 model_name: str = MODEL_NAME, data_dir: str = None):
+        self.api_key = api_key
+        self.llm_model = llm_model
+        self.model_name = model_name
+        self.data_dir = data_dir or PROCESSED_DATA_DIR
+        self.lock = threading.Lock()
+        self.model_lock = threading.Lock()
+        self._embeddings_model = None
+        self._manager = None
+        self.warmup_thread = None
+        self.query_embedding_cache = QueryEmbeddingCache(None, model_name, loader=lambda: self.embeddings_model)
+
+    @property
+    def embeddings_model(self):
+        with self.model_lock:
+            if self._embeddings_model is None:
+                started = time.perf_counter()
+                from sentence_transformers import SentenceTransformer
+                self._embeddings_model = SentenceTransformer(self.model_name)
+                logger.info(f"Loaded {self.model_name} in {time.perf_counter() - started:.2f}s")
+            return self._embeddings_model
+
+    @property
+    def manager(self) -> SimpleChatManager:
+        with self.lock:
+            if self._manager is None:
+                self._manager = SimpleChatManager(self.query_embedding_cache, self.api_key or resolve_api_key(),
+                                                  self.llm_model, self.data_dir)
+                chunk_store.add_rebuild_listener(self._manager.invalidate_product)
+            return self._manager
+
+    def _warm_up(self):
+        try:
+            self.manager
+            # The first encode builds lazy tokenizer/graph state; pay for it before the first user does
+            self.embeddings_model.encode(["warm up"])
+            # Token counts for context budgeting
+            chunking.get_token_counter()
+        except Exception as e:
+            logger.error(f"Warm-up failed: {str(e)}")
+
+    def warm_up(self, background: bool = True):
+        """Load the model and product registry now; returns the warm-up thread when backgrounded."""
+        if not background:
+            self._warm_up()
+            return None
+        with self.lock:
+            if self.warmup_thread is None:
+                self.warmup_thread = threading.Thread(target=self._warm_up, daemon=True, name="chatbot-warmup")
+                self.warmup_thread.start()
+            return self.warmup_thread
+
+_engine = None
+_engine_lock = threading.Lock()
+background_loop = BackgroundLoop()
+
+def configure(**config) -> ChatEngine:
+    """
+    Replace the default engine, e.g. configure(api_key=..., data_dir=...).
+    Accepts the ChatEngine arguments; anything left out comes from the environment.
+    """
+    global _engine
+    with _engine_lock:
+        _engine = ChatEngine(**config)
+        return _engine
+
+def get_engine() -> ChatEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ChatEngine()
+        return _engine
+
+def warm_up(background: bool = True):
+    return get_engine().warm_up(background)
+
+async def achatbot(message: str, product: str = DEFAULT_PRODUCT, session_id: str = None) -> str:
+    """
+    Async chatbot entry point; shares one pooled HTTP client across all callers.
+    Pass a session_id to keep conversation memory across calls.
+    """
+    return await get_engine().manager.aanswer(message, product, session_id)
+
+async def achatbot_stream(message: str, product: str = DEFAULT_PRODUCT, session_id: str = None):
+    """
+    Async streaming entry point that yields the response as text deltas.
+    """
+    async for delta in get_engine().manager.aanswer_stream(message, product, session_id):
+        yield delta
+
+def prefetch(message: str, product: str = DEFAULT_PRODUCT, session_id: str = None):
+    """
+    Start retrieval for a question before it is final (blocking; call it off the hot path).
+    """
+    get_engine().manager.prefetch(message, product, session_id)
+
+def chatbot(message: str, product: str = DEFAULT_PRODUCT, session_id: str = None) -> str:
     """
     Chatbot function that takes a message and product name, and returns the chatbot's response.
+    Pass product=ALL_PRODUCTS to answer from whichever products are closest to the question,
+    and a session_id to let follow-up questions build on earlier turns.
+    """
+    return background_loop.run(achatbot(message, product, session_id))
+
+def chatbot_stream(message: str, product: str = DEFAULT_PRODUCT, session_id: str = None):
+    """
+    Streaming variant of chatbot() that yields the response as text deltas as they arrive.
     """
-    relevant_chunks = simple_chat_manager.search_similar_chunks(message, product)
-    response = simple_chat_manager.generate_response(message, relevant_chunks, product)
-    return response
+    yield from background_loop.iterate(achatbot_stream(message, product, session_id))
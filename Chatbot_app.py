@@ -1,13 +1,17 @@
 import streamlit as st
 from dotenv import load_dotenv
 import os
+import uuid
 
 # Import your chatbot function
-from Chatbot import chatbot   # assuming you saved your code in chatbot.py
+from Chatbot import chatbot_stream, warm_up   # assuming you saved your code in chatbot.py
 
 # Load environment variables
 load_dotenv()
 
+# Start loading the model and indexes while the page renders; a no-op on reruns
+warm_up()
+
 # --- Page Configuration ---
 st.set_page_config(page_title="Ibrahim's Chatbot", page_icon="🍁", layout="centered")
 st.title("Welcome TO Ibrahim's Chatbot")
@@ -16,6 +20,8 @@ st.title("Welcome TO Ibrahim's Chatbot")
 with st.sidebar:
     st.title("Chat Settings")
     def clear_chat_history():
+        # A new session id starts the chatbot's conversation memory afresh too
+        st.session_state.session_id = uuid.uuid4().hex
         st.session_state.messages = [{
             "role": "assistant",
             "content": "Assalamu alaikum 🍁 I’m Ibrahim’s chatbot, here to answer all your questions about Ibrahim and his work!"
@@ -29,6 +35,9 @@ if "messages" not in st.session_state:
         "content": "Assalamu alaikum 🍁 I’m Ibrahim’s chatbot, here to answer all your questions about Ibrahim and his work!"
     }]
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 # --- Display Chat Messages ---
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -41,11 +50,10 @@ if prompt := st.chat_input("Type your message..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Generate and display bot response
+    # Stream the bot response as it is generated
     with st.chat_message("assistant"):
-        with st.spinner("Generating response..."):
-            response = chatbot(prompt, product="Ibrahim")
-            st.markdown(response)
+        response = st.write_stream(chatbot_stream(prompt, product="Ibrahim",
+                                                     session_id=st.session_state.session_id))
 
     # Append assistant response
     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -0,0 +1,85 @@
+"""
+Preallocated ring of fixed-size int16 audio frames for the microphone loop.
+
+The PyAudio callback copies each buffer straight into its slot; the VAD loop
+and the recognizer read numpy views and memoryview slices of the same memory,
+so there is no per-chunk allocation, copy or join. Frames are addressed by a
+monotonic sequence number; once the writer laps a frame it is gone, and
+readers check `valid()` after using a view, like a seqlock.
+"""
+import math
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Settings
+RATE = 16000
+CHUNK_SIZE = 512
+# How far the recognizer may fall behind the microphone before audio is lost
+RING_SECONDS = 60.0
+
+
+class AudioRing:
+    def __init__(self, frame_samples: int = CHUNK_SIZE, seconds: float = RING_SECONDS, rate: int = RATE):
+        self.frame_samples = frame_samples
+        self.frame_bytes = frame_samples * 2
+        self.n_frames = max(2, math.ceil(seconds * rate / frame_samples))
+        self.samples = np.zeros((self.n_frames, frame_samples), dtype=np.int16)
+        self.bytes = memoryview(self.samples.reshape(-1)).cast("B")
+        # Frames ever written; frame `seq` lives in slot seq % n_frames
+        self.written = 0
+        self.cond = threading.Condition()
+        self.overruns = 0
+
+    def write(self, data) -> int:
+        """Copy one frame of int16 PCM into the ring (from the audio callback); returns its sequence number."""
+        seq = self.written
+        offset = (seq % self.n_frames) * self.frame_bytes
+        n = min(len(data), self.frame_bytes)
+        self.bytes[offset:offset + n] = memoryview(data)[:n]
+        if n < self.frame_bytes:
+            # Short buffer; pad with silence so every frame has the same size
+            self.bytes[offset + n:offset + self.frame_bytes] = bytes(self.frame_bytes - n)
+        with self.cond:
+            self.written = seq + 1
+            self.cond.notify()
+        return seq
+
+    def valid(self, seq: int) -> bool:
+        """Whether frame `seq` has been written and not overwritten (the slot being written counts as gone)."""
+        return self.written - self.n_frames < seq < self.written
+
+    def wait(self, seq: int, timeout: float = None) -> int:
+        """
+        Block until frame `seq` is written; returns the frame to read, which is
+        later than `seq` if the reader fell a full ring behind. None on timeout.
+        """
+        if self.written <= seq:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.written > seq, timeout):
+                    return None
+        oldest = self.written - self.n_frames + 1
+        if seq < oldest:
+            self.overruns += 1
+            logger.warning(f"Audio ring overrun: skipped {oldest - seq} frame(s)")
+            return oldest
+        return seq
+
+    def frame(self, seq: int) -> np.ndarray:
+        """Zero-copy int16 view of one frame."""
+        return self.samples[seq % self.n_frames]
+
+    def pcm(self, start: int, end: int = None):
+        """
+        PCM bytes of frames [start, end) as a memoryview into the ring. A span
+        that wraps around the end of the ring is the one case that is copied.
+        """
+        end = start + 1 if end is None else end
+        first = start % self.n_frames
+        if first + (end - start) <= self.n_frames:
+            return self.bytes[first * self.frame_bytes:(first + end - start) * self.frame_bytes]
+        head = self.bytes[first * self.frame_bytes:]
+        tail = self.bytes[:(end % self.n_frames) * self.frame_bytes]
+        return memoryview(bytes(head) + bytes(tail))
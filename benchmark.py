@@ -0,0 +1,623 @@
+"""
+Benchmarks for the retrieval and answer path. Results are written as JSON so
+runs from different commits can be compared.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --only search --sizes 1000 100000
+    python benchmark.py --compare bench_main.json --output bench.json
+    python benchmark.py --only concurrency --concurrency 1 16 64
+    python benchmark.py --only startup    # exits non-zero if `import Chatbot` is over budget
+    python benchmark.py --only audio --wav recording.wav
+
+Everything runs offline: corpora are synthetic and the LLM is a local fake
+OpenRouter server, so only this repo's own code is measured.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import tempfile
+import argparse
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+SENTENCE = "Mohammod Ibrahim Hossain built an end-to-end MLOps pipeline for real estate price prediction. "
+BENCHMARKS = ("startup", "chunk", "ingest", "encode", "search", "concurrency", "context", "audio", "vad", "tts", "chatbot")
+# `import Chatbot` must stay cheap: no model, index or Streamlit work at import time
+IMPORT_BUDGET_S = float(os.getenv("IMPORT_BUDGET_S", "1.0"))
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "streamlit")
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        "n": int(samples.size),
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+    }
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def synthetic_text(n_chars, seed=0):
+    rng = np.random.default_rng(seed)
+    words = SENTENCE.split()
+    out, size = [], 0
+    while size < n_chars:
+        sentence = " ".join(rng.choice(words, rng.integers(6, 20))) + ". "
+        if rng.random() < 0.1:
+            sentence += "\n"
+        out.append(sentence)
+        size += len(sentence)
+    return "".join(out)
+
+
+# --- Import and warm-up time, each in a fresh interpreter ---
+STARTUP_SCRIPT = """
+import sys, time, json
+started = time.perf_counter()
+import Chatbot
+imported = time.perf_counter() - started
+heavy = [name for name in %r if name in sys.modules]
+ready = None
+if %r:
+    started = time.perf_counter()
+    Chatbot.warm_up(background=False)
+    ready = time.perf_counter() - started
+print(json.dumps({"import_s": imported, "heavy": heavy, "warm_up_s": ready}))
+"""
+
+
+def bench_startup(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for warm in [False] * args.repeat + [True]:
+        out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT % (HEAVY_MODULES, warm)],
+                             capture_output=True, text=True, cwd=here, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    imports = [run["import_s"] * 1000 for run in runs]
+    heavy = sorted({name for run in runs for name in run["heavy"]})
+    return {
+        "import_chatbot": percentiles(imports),
+        "import_budget_s": IMPORT_BUDGET_S,
+        "heavy_modules_at_import": heavy,
+        "within_budget": max(imports) / 1000 <= IMPORT_BUDGET_S and not heavy,
+        "warm_up_s": round(runs[-1]["warm_up_s"], 3),
+    }
+
+
+# --- Chunking ---
+def bench_chunk(args):
+    import process_pipeline
+    from chunking import SentenceChunker
+
+    text = synthetic_text(args.chunk_mb * 1024 * 1024)
+    mb = len(text) / (1024 * 1024)
+    results = {}
+    for name, fn in (
+        ("chunk_text", lambda: process_pipeline.chunk_text(text)),
+        ("sentence_chunker", lambda: list(SentenceChunker().chunk_text(text))),
+    ):
+        samples = timed(fn, args.repeat)
+        results[name] = dict(percentiles(samples), mb_per_s=round(mb / (np.median(samples) / 1000), 2))
+    return results
+
+
+# --- Ingestion ---
+def bench_ingest(args):
+    import process_pipeline
+
+    workdir = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        source = os.path.join(workdir, "local_storage")
+        for p in range(2):
+            os.makedirs(os.path.join(source, f"product{p}"))
+            for d in range(args.ingest_docs):
+                with open(os.path.join(source, f"product{p}", f"doc{d}.txt"), "w") as f:
+                    f.write(synthetic_text(20000, seed=p * 1000 + d))
+        output = os.path.join(workdir, "processed_data")
+        total_chars = sum(
+            os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(source) for f in files
+        )
+
+        started = time.perf_counter()
+        process_pipeline.run_ingestion(source, workers=args.workers, output_dir=output)
+        full_s = time.perf_counter() - started
+
+        # Touch one document: incremental re-indexing should cost a fraction of the full run
+        with open(os.path.join(source, "product0", "doc0.txt"), "a") as f:
+            f.write(synthetic_text(2000, seed=99))
+        started = time.perf_counter()
+        process_pipeline.run_ingestion(source, workers=args.workers, output_dir=output)
+        incremental_s = time.perf_counter() - started
+
+        docs = 2 * args.ingest_docs
+        return {
+            "documents": docs,
+            "full_s": round(full_s, 3),
+            "docs_per_s": round(docs / full_s, 2),
+            "mb_per_s": round(total_chars / (1024 * 1024) / full_s, 3),
+            "incremental_one_doc_s": round(incremental_s, 3),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- Query/passage encoding ---
+def bench_encode(args):
+    from sentence_transformers import SentenceTransformer
+    from process_pipeline import MODEL_NAME
+
+    model = SentenceTransformer(MODEL_NAME)
+    passages = [synthetic_text(800, seed=i) for i in range(256)]
+    model.encode(passages[:8])  # warm-up
+    results = {}
+    for batch_size in args.batch_sizes:
+        samples = timed(lambda: model.encode(passages, batch_size=batch_size), max(1, args.repeat // 2))
+        results[f"batch_{batch_size}"] = dict(
+            percentiles(samples), passages_per_s=round(len(passages) / (np.median(samples) / 1000), 1)
+        )
+    results["single_query"] = percentiles(timed(lambda: model.encode(["who is Ibrahim?"]), args.repeat * 5))
+    return results
+
+
+# --- Retrieval ---
+def build_synthetic_product(data_dir, n_chunks, dim, index_type):
+    import chunk_store
+    import lexical_index
+    import vector_index
+
+    rng = np.random.default_rng(n_chunks)
+    embeddings = rng.standard_normal((n_chunks, dim)).astype("float32")
+    ids = np.arange(n_chunks, dtype=np.int64)
+    index, params = vector_index.build_index(embeddings, ids, index_type)
+    rng_words = np.array(SENTENCE.lower().rstrip(". ").split())
+    chunks = [f"synthetic chunk {i} about project {i % 97}: " + " ".join(rng.choice(rng_words, 40))
+              for i in range(n_chunks)]
+    chunk_store.write_store(data_dir, chunks, embeddings, index, ids=ids, index_params=params)
+    lexical_index.save(data_dir, lexical_index.build(chunks))
+    return params
+
+
+def bench_search(args):
+    import Chatbot
+    import vector_index
+
+    workdir = tempfile.mkdtemp(prefix="bench_search_")
+    engine = Chatbot.get_engine()
+    manager = engine.manager
+    original_dir = manager.data_dir
+    results = {}
+    try:
+        dim = engine.embeddings_model.get_sentence_embedding_dimension()
+        for n_chunks in args.sizes:
+            product = f"synthetic_{n_chunks}"
+            started = time.perf_counter()
+            params = build_synthetic_product(os.path.join(workdir, product), n_chunks, dim, args.index_type)
+            build_s = time.perf_counter() - started
+
+            manager.data_dir = workdir
+            manager.initialize_products()
+            manager.search_similar_chunks("warm up", product)
+
+            # Distinct queries so the embedding cache doesn't hide the encode cost
+            full = timed(lambda c=iter(range(10 ** 9)): manager.search_similar_chunks(f"query {next(c)}", product),
+                         args.repeat * 20)
+            product_data = manager.product_data.get(product)
+            query = np.random.default_rng(0).standard_normal((1, dim)).astype("float32")
+            faiss_only = timed(lambda: vector_index.search(product_data.faiss_index, product_data.index_params,
+                                                           query, 3), args.repeat * 20)
+            # What hybrid retrieval adds on top of the dense search: BM25 plus rank fusion
+            dense_ids = list(range(Chatbot.HYBRID_CANDIDATES))
+            hybrid = timed(lambda c=iter(range(10 ** 9)): manager._fuse(
+                product_data, f"ibrahim pipeline project {next(c) % 97}", dense_ids, 3), args.repeat * 20)
+            results[str(n_chunks)] = {
+                "index_type": params["type"],
+                "build_s": round(build_s, 3),
+                "search_similar_chunks": percentiles(full),
+                "faiss_search": percentiles(faiss_only),
+                "hybrid_overhead": percentiles(hybrid),
+            }
+            shutil.rmtree(os.path.join(workdir, product), ignore_errors=True)
+    finally:
+        manager.data_dir = original_dir
+        manager.initialize_products()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+# --- Concurrent retrieval, per-request vs micro-batched ---
+def bench_concurrency(args):
+    import asyncio
+    import Chatbot
+    from retrieval_batcher import RetrievalBatcher
+
+    workdir = tempfile.mkdtemp(prefix="bench_concurrency_")
+    engine = Chatbot.get_engine()
+    manager = engine.manager
+    original_dir = manager.data_dir
+    product = "synthetic_concurrency"
+    counter = iter(range(10 ** 9))
+
+    async def run(clients, requests_per_client):
+        async def client():
+            for _ in range(requests_per_client):
+                # Distinct queries so every request pays for its embedding
+                await manager.aretrieve(f"what happened in project {next(counter)}?", product)
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return clients * requests_per_client / (time.perf_counter() - started)
+
+    results = {}
+    try:
+        dim = engine.embeddings_model.get_sentence_embedding_dimension()
+        build_synthetic_product(os.path.join(workdir, product), 10000, dim, args.index_type)
+        manager.data_dir = workdir
+        manager.initialize_products()
+        manager.search_similar_chunks("warm up", product)
+        batcher = RetrievalBatcher(manager.retrieve_many, engine.query_embedding_cache.encode_many)
+        for clients in args.concurrency:
+            per_client = max(1, args.repeat * 40 // clients)
+            manager.retrieval_batcher = None
+            unbatched = asyncio.run(run(clients, per_client))
+            manager.retrieval_batcher = batcher
+            batched = asyncio.run(run(clients, per_client))
+            results[f"clients_{clients}"] = {
+                "per_request_qps": round(unbatched, 1),
+                "batched_qps": round(batched, 1),
+                "speedup": round(batched / unbatched, 2),
+            }
+        results["mean_batch_size"] = round(batcher.stats()["mean_batch_size"], 2)
+    finally:
+        manager.retrieval_batcher = None
+        manager.data_dir = original_dir
+        manager.initialize_products()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+# --- Context budgeting: tokens sent per request before and after ---
+def bench_context(args):
+    from chunking import CharChunker
+    from context_builder import ContextBuilder
+
+    # Three neighbouring 10k-char windows, as the old chunker retrieved them, overlaps included
+    windows = list(CharChunker().chunk_text(synthetic_text(40000, seed=7)))[:3]
+    chunks = [f"[IBRAHIM] {window.text}" for window in windows]
+    builder = ContextBuilder()
+    results = {}
+    for query in ("hi", "what MLOps pipeline did Ibrahim build for real estate price prediction?"):
+        context, stats = builder.build(query, chunks)
+        samples = timed(lambda: builder.build(query, chunks), args.repeat * 4)
+        results[query[:24]] = dict(percentiles(samples), **stats,
+                                   chars_in=sum(map(len, chunks)), chars_out=sum(map(len, context)))
+    return results
+
+
+# --- Microphone buffering: per-chunk copies vs the preallocated ring ---
+def load_pcm(path, rate=16000):
+    """16-bit PCM samples of a WAV file (first channel)."""
+    import wave
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2 or f.getframerate() != rate:
+            raise ValueError(f"{path}: need 16-bit PCM at {rate} Hz")
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        return samples[::f.getnchannels()].copy()
+
+
+def synthetic_speech(seconds, rate=16000, seed=0):
+    """Noise with 2-3 s tone bursts, a stand-in for recorded speech."""
+    rng = np.random.default_rng(seed)
+    samples = rng.normal(0, 300, int(seconds * rate))
+    t = np.arange(len(samples)) / rate
+    samples += 8000 * np.sin(2 * np.pi * 220 * t) * ((t % 5) < 2.5)
+    return np.clip(samples, -32768, 32767).astype(np.int16)
+
+
+def bench_audio(args):
+    import tracemalloc
+    from audio_ring import AudioRing, CHUNK_SIZE, RATE
+    try:
+        import torch
+    except ImportError:
+        torch = None
+
+    samples = load_pcm(args.wav) if args.wav else synthetic_speech(30)
+    n_chunks = len(samples) // CHUNK_SIZE
+    # What PyAudio hands over: a fresh bytes object per buffer, on both paths
+    chunks = [samples[i * CHUNK_SIZE:(i + 1) * CHUNK_SIZE].tobytes() for i in range(n_chunks)]
+    utterance_chunks = int(2.5 * RATE / CHUNK_SIZE)
+
+    def legacy():
+        frames = []
+        for i, chunk in enumerate(chunks):
+            audio_np = np.frombuffer(chunk, dtype=np.int16).copy()
+            if torch is not None:
+                torch.from_numpy(audio_np).to("cpu")
+            frames.append(chunk)
+            if i % utterance_chunks == utterance_chunks - 1:
+                b"".join(frames)
+                frames = []
+
+    ring = AudioRing(CHUNK_SIZE, rate=RATE)
+
+    def ringed():
+        start = ring.written
+        for i, chunk in enumerate(chunks):
+            seq = ring.wait(ring.write(chunk))
+            if torch is not None:
+                torch.from_numpy(ring.frame(seq))
+            if i % utterance_chunks == utterance_chunks - 1:
+                ring.pcm(start, seq + 1)
+                start = seq + 1
+
+    audio_s = n_chunks * CHUNK_SIZE / RATE
+    results = {"audio_s": round(audio_s, 2), "chunks": n_chunks, "torch": torch is not None}
+    for name, fn in (("per_chunk_copies", legacy), ("ring", ringed)):
+        fn()
+        cpu = []
+        for _ in range(args.repeat):
+            started = time.process_time()
+            fn()
+            cpu.append(time.process_time() - started)
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {
+            "cpu_us_per_chunk": round(min(cpu) / n_chunks * 1e6, 3),
+            "cpu_ms_per_audio_s": round(min(cpu) / audio_s * 1000, 4),
+            "peak_traced_kib": round(peak / 1024, 1),
+        }
+    results["ring_kib_preallocated"] = round(ring.samples.nbytes / 1024, 1)
+    return results
+
+
+# --- Silero VAD: load time in a fresh interpreter and per-frame inference ---
+VAD_SCRIPT = """
+import time, json
+started = time.perf_counter()
+import torch
+imported = time.perf_counter() - started
+import vad_model
+model_manager = vad_model.VADModel()
+started = time.perf_counter()
+model_manager.warm_up(background=False)
+ready = time.perf_counter() - started
+model, _ = model_manager.get()
+frames = torch.from_numpy(%s)
+samples = []
+for frame in frames:
+    started = time.perf_counter()
+    model(frame, vad_model.SAMPLE_RATE)
+    samples.append((time.perf_counter() - started) * 1000)
+print(json.dumps({"import_torch_s": imported, "load_s": model_manager.load_seconds, "ready_s": ready,
+                  "source": model_manager.source, "frame_ms": samples}))
+"""
+
+
+def bench_vad(args):
+    try:
+        import torch  # noqa: F401
+    except ImportError:
+        return {"skipped": "torch is not installed"}
+    here = os.path.dirname(os.path.abspath(__file__))
+    audio = (load_pcm(args.wav) if args.wav else synthetic_speech(10)).astype(np.float32) / 32768
+    frames = audio[:len(audio) // 512 * 512].reshape(-1, 512)
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_vad_"), "frames.npy")
+    np.save(path, frames)
+    results = {}
+    for runtime, onnx in (("torchscript", "0"), ("onnx", "1")):
+        # Each runtime looks for the model at its own default path
+        env = dict(os.environ, VAD_ONNX=onnx)
+        env.pop("VAD_MODEL_PATH", None)
+        run = subprocess.run([sys.executable, "-c", VAD_SCRIPT % f"__import__('numpy').load({path!r})"],
+                             capture_output=True, text=True, cwd=here, env=env)
+        if run.returncode != 0:
+            results[runtime] = {"error": run.stderr.strip().splitlines()[-1] if run.stderr.strip() else "failed"}
+            continue
+        out = json.loads(run.stdout.strip().splitlines()[-1])
+        results[runtime] = {
+            "source": out["source"],
+            "import_torch_s": round(out["import_torch_s"], 3),
+            "load_s": round(out["load_s"], 3),
+            "ready_s": round(out["ready_s"], 3),
+            # 512 samples are 32 ms of audio
+            "frame": percentiles(out["frame_ms"]),
+        }
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    return results
+
+
+# --- TTS: one sentence at a time vs synthesis ahead of playback ---
+def bench_tts(args):
+    import threading
+    from tts_scheduler import FakeBackend, TTSScheduler, split_sentences
+
+    answer = " ".join(f"Point {i}: {SENTENCE.strip()}" for i in range(8))
+    # Synthesis about as slow as playback, as with a local neural voice on CPU
+    backend = FakeBackend(synth_seconds_per_char=0.0005, play_seconds_per_char=0.0005)
+
+    def serial():
+        for sentence in split_sentences(answer):
+            backend.play(backend.synthesize(sentence), threading.Event())
+
+    scheduler = TTSScheduler(backend)
+
+    def pipelined():
+        # A fresh cache each run, so only the pipelining is measured
+        scheduler.cache.entries.clear()
+        scheduler.say(answer)
+        scheduler.wait_idle()
+
+    return {
+        "sentences": len(split_sentences(answer)),
+        "serial": percentiles(timed(serial, args.repeat)),
+        "pipelined": percentiles(timed(pipelined, args.repeat)),
+    }
+
+
+# --- End to end against a fake OpenRouter ---
+class FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    """Answers chat completions after a fixed delay, in plain or SSE form."""
+    protocol_version = "HTTP/1.1"
+    latency_s = 0.05
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; don't let Nagle add ~40 ms
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.latency_s)
+        answer = "Mohammod Ibrahim Hossain is a machine learning engineer. He builds MLOps pipelines."
+        if body.get("stream"):
+            events = [{"choices": [{"delta": {"content": word + " "}}]} for word in answer.split()]
+            payload = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps({"choices": [{"message": {"content": answer}}]})
+            content_type = "application/json"
+        data = payload.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_fake_openrouter(latency_s=0.05):
+    FakeOpenRouterHandler.latency_s = latency_s
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenRouterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/v1/chat/completions"
+
+
+def bench_chatbot(args):
+    import Chatbot
+
+    server, url = start_fake_openrouter(args.llm_latency_ms / 1000)
+    client = Chatbot.get_engine().manager.llm_client
+    original_url = client.url
+    client.url = url
+    try:
+        Chatbot.chatbot("warm up")
+        # Unique questions so neither cache short-circuits the measured path
+        counter = iter(range(10 ** 9))
+        cold = timed(lambda: Chatbot.chatbot(f"what did Ibrahim build in project {next(counter)}?"), args.repeat * 5)
+
+        def first_token():
+            stream = Chatbot.chatbot_stream(f"tell me about project {next(counter)}")
+            started = time.perf_counter()
+            next(stream)
+            elapsed = (time.perf_counter() - started) * 1000
+            for _ in stream:
+                pass
+            return elapsed
+
+        ttft = [first_token() for _ in range(args.repeat * 5)]
+        cached = timed(lambda: Chatbot.chatbot("what did Ibrahim build in project 0?"), args.repeat * 5)
+        return {
+            "fake_llm_latency_ms": args.llm_latency_ms,
+            "chatbot_uncached": percentiles(cold),
+            "chatbot_stream_first_token": percentiles(ttft),
+            "chatbot_cached": percentiles(cached),
+        }
+    finally:
+        client.url = original_url
+        server.shutdown()
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten(f"{prefix}.{key}" if prefix else key, item, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    return out
+
+
+def compare(baseline, current, threshold=0.10, min_delta_ms=1.0):
+    """Print latency-like metrics that got worse by more than `threshold` (and by at least `min_delta_ms`)."""
+    old = flatten("", baseline["results"], {})
+    new = flatten("", current["results"], {})
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        if not key.endswith(("_ms", "_s")) or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        delta_ms = (new[key] - old[key]) * (1 if key.endswith("_ms") else 1000)
+        if change > threshold and delta_ms >= min_delta_ms:
+            regressions += 1
+            print(f"REGRESSION {key}: {old[key]} -> {new[key]} (+{change:.0%})")
+    print(f"{regressions} regression(s) vs {baseline['environment'].get('commit', 'baseline')}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the retrieval and answer path")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000],
+                        help="synthetic chunk counts for the search benchmark")
+    parser.add_argument("--index-type", default=None, help="force an index type (default: automatic)")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64, 128])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64],
+                        help="concurrent clients for the concurrency benchmark")
+    parser.add_argument("--chunk-mb", type=int, default=4)
+    parser.add_argument("--ingest-docs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--llm-latency-ms", type=float, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--wav", help="16 kHz 16-bit WAV for the audio benchmark (default: synthetic)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "results": {}}
+    for name in args.only:
+        print(f"Running {name}...", file=sys.stderr)
+        report["results"][name] = globals()[f"bench_{name}"](args)
+
+    print(json.dumps(report, indent=1))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    startup = report["results"].get("startup")
+    if startup is not None and not startup["within_budget"]:
+        print(f"FAIL import Chatbot: p99 {startup['import_chatbot']['p99_ms']} ms "
+              f"(budget {IMPORT_BUDGET_S * 1000:.0f} ms), heavy modules: {startup['heavy_modules_at_import']}")
+        sys.exit(1)
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(json.load(f), report) else 0)
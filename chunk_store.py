@@ -0,0 +1,405 @@
+import os
+import json
+import pickle
+import shutil
+import logging
+import faiss
+import numpy as np
+
+import vector_index
+
+logger = logging.getLogger(__name__)
+
+# On-disk layout of a processed product (format version 2):
+#   store.json          - format version, chunk count, embedding dim
+#   embeddings.npy      - float32 [n, dim] matrix, opened with np.load(mmap_mode="r")
+#   chunks.bin          - all chunk texts, utf-8, concatenated
+#   offsets.npy         - int64 [n + 1] byte offsets of each chunk in chunks.bin
+#   ids.npy             - int64 [n] ascending FAISS ids of the chunks (v2; v1 ids are positions)
+#   faiss_store/index.faiss
+#   centroid.npy        - float32 [dim] unit-length mean embedding, used to route cross-product queries
+#   lexical_store/      - optional BM25 postings over chunk positions, see lexical_index.py
+# Everything is read-only and memory-mapped, so worker processes share pages
+# through the OS cache instead of each unpickling a private copy.
+STORE_FORMAT_VERSION = 2
+SUPPORTED_FORMAT_VERSIONS = (1, 2)
+STORE_META = "store.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_BLOB = "chunks.bin"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.npy"
+CENTROID_FILE = "centroid.npy"
+LEGACY_CHUNKS = "chunks.pkl"
+FAISS_INDEX = os.path.join("faiss_store", "index.faiss")
+
+# Prefer the flag that also maps IndexFlat codes; older faiss builds only have IO_FLAG_MMAP
+FAISS_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+# Embedding rows copied per step when a store is written from spooled batches
+COPY_ROWS = 65536
+
+
+# Callables run with a product name whenever its store is rewritten in this process
+rebuild_listeners = []
+
+
+def add_rebuild_listener(callback):
+    rebuild_listeners.append(callback)
+
+
+def notify_rebuilt(product_name):
+    for callback in rebuild_listeners:
+        try:
+            callback(product_name)
+        except Exception as e:
+            logger.error(f"Rebuild listener failed for {product_name}: {str(e)}")
+
+
+def store_generation(data_dir):
+    """Modification stamp of a store, used to notice rebuilds made by other processes."""
+    for name in (STORE_META, LEGACY_CHUNKS, FAISS_INDEX):
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            return os.stat(path).st_mtime_ns
+    return 0
+
+
+class ChunkTexts:
+    """Read-only sequence of chunk strings decoded on demand from a mapped blob."""
+    def __init__(self, blob, offsets, ids=None):
+        self.blob = blob
+        self.offsets = offsets
+        self.ids = ids
+
+    @classmethod
+    def from_list(cls, chunks, ids=None):
+        encoded = [c.encode("utf-8") for c in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(b) for b in encoded])
+        return cls(b"".join(encoded), offsets, ids)
+
+    def position(self, chunk_id):
+        """Position of a FAISS id in this store, or None if it is not present."""
+        if self.ids is None:
+            return chunk_id if 0 <= chunk_id < len(self) else None
+        pos = int(np.searchsorted(self.ids, chunk_id))
+        if pos < len(self.ids) and self.ids[pos] == chunk_id:
+            return pos
+        return None
+
+    def id_at(self, position):
+        return position if self.ids is None else int(self.ids[position])
+
+    def by_id(self, chunk_id):
+        pos = self.position(chunk_id)
+        return None if pos is None else self[pos]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def replace_file(path, write):
+    """Write to a temporary file and rename it over `path`, so readers that have
+    the old file memory-mapped keep a valid view of it."""
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# np.save appends .npy to names that lack it, so hand it an open file
+def npy_writer(array):
+    def write(path):
+        with open(path, "wb") as f:
+            np.save(f, array)
+    return write
+
+
+def write_store(out_dir, chunks, embeddings, index=None, ids=None, index_params=None):
+    """Write chunks, embeddings and (optionally) a FAISS index in the current format."""
+    os.makedirs(os.path.join(out_dir, "faiss_store"), exist_ok=True)
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    texts = ChunkTexts.from_list(chunks)
+    if ids is None:
+        ids = np.arange(len(texts), dtype=np.int64)
+
+    def write_blob(path):
+        with open(path, "wb") as f:
+            f.write(texts.blob)
+
+    replace_file(os.path.join(out_dir, CHUNKS_BLOB), write_blob)
+    replace_file(os.path.join(out_dir, OFFSETS_FILE), npy_writer(texts.offsets))
+    replace_file(os.path.join(out_dir, IDS_FILE), npy_writer(np.asarray(ids, dtype=np.int64)))
+    replace_file(os.path.join(out_dir, EMBEDDINGS_FILE), npy_writer(embeddings))
+    if len(embeddings):
+        replace_file(os.path.join(out_dir, CENTROID_FILE), npy_writer(centroid(embeddings)))
+    _finish_store(out_dir, len(texts), int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+                  index, index_params)
+
+
+def _runs(positions):
+    """(start, end) ranges of consecutive values in an ascending position array."""
+    if not len(positions):
+        return []
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks, [len(positions)]])
+    return [(int(positions[s]), int(positions[e - 1]) + 1) for s, e in zip(starts, ends)]
+
+
+class StoreAppender:
+    """
+    Builds the next version of a store a batch at a time. Appended texts and
+    embeddings go to spool files next to the store, so ingestion holds one
+    batch in memory, not the whole corpus. commit() writes the store: the
+    rows of the current store where `keep` is true, copied a run of
+    consecutive chunks at a time from the mapped files, then everything
+    appended. Appended ids must be ascending and above every kept id.
+    """
+    def __init__(self, out_dir):
+        os.makedirs(os.path.join(out_dir, "faiss_store"), exist_ok=True)
+        self.out_dir = out_dir
+        self.blob_path = os.path.join(out_dir, CHUNKS_BLOB + ".spool")
+        self.vectors_path = os.path.join(out_dir, EMBEDDINGS_FILE + ".spool")
+        self.blob = open(self.blob_path, "w+b")
+        self.vectors = open(self.vectors_path, "w+b")
+        self.lengths = []
+        self.ids = []
+        self.dim = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, chunks, embeddings, ids):
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        if len(chunks) != len(embeddings) or len(chunks) != len(ids):
+            raise ValueError("chunks, embeddings and ids must have the same length")
+        if len(chunks):
+            self.dim = embeddings.shape[1]
+        for chunk in chunks:
+            encoded = chunk.encode("utf-8")
+            self.blob.write(encoded)
+            self.lengths.append(len(encoded))
+        self.vectors.write(embeddings.tobytes())
+        self.ids.extend(int(chunk_id) for chunk_id in ids)
+
+    def _offsets(self):
+        offsets = np.zeros(len(self.lengths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(self.lengths, dtype=np.int64)
+        return offsets
+
+    def texts(self) -> ChunkTexts:
+        """Appended chunk texts, mapped from the spool."""
+        self.blob.flush()
+        blob = np.memmap(self.blob_path, dtype=np.uint8, mode="r") if self.blob.tell() else b""
+        return ChunkTexts(blob, self._offsets(), np.asarray(self.ids, dtype=np.int64))
+
+    def embeddings(self) -> np.ndarray:
+        """Appended embeddings, mapped from the spool."""
+        self.vectors.flush()
+        if not self.ids:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim))
+
+    def commit(self, keep=None, index=None, index_params=None):
+        """Write the store; `keep` is a mask over the current store's rows, None to start empty."""
+        old_texts = load_chunks(self.out_dir) if keep is not None else None
+        old_embeddings = load_embeddings(self.out_dir) if keep is not None else None
+        kept = np.flatnonzero(keep) if keep is not None else np.zeros(0, dtype=np.int64)
+        runs = _runs(kept)
+        n_kept = len(kept)
+        dim = self.dim or (old_embeddings.shape[1] if old_embeddings is not None else 0)
+
+        offsets = self._offsets()
+        all_offsets = np.zeros(n_kept + len(self.ids) + 1, dtype=np.int64)
+        if n_kept:
+            all_offsets[1:n_kept + 1] = np.cumsum(np.diff(old_texts.offsets)[kept])
+        all_offsets[n_kept + 1:] = all_offsets[n_kept] + offsets[1:]
+        old_ids = np.asarray(old_texts.ids)[kept] if n_kept else np.zeros(0, dtype=np.int64)
+        all_ids = np.concatenate([old_ids, np.asarray(self.ids, dtype=np.int64)])
+        appended = self.embeddings()
+        self.blob.flush()
+
+        def write_blob(path):
+            with open(path, "wb") as f:
+                for start, end in runs:
+                    f.write(old_texts.blob[int(old_texts.offsets[start]):int(old_texts.offsets[end])])
+                with open(self.blob_path, "rb") as spool:
+                    shutil.copyfileobj(spool, f)
+
+        def write_embeddings(path):
+            matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(all_ids), dim))
+            row = 0
+            for start, end in runs:
+                matrix[row:row + end - start] = old_embeddings[start:end]
+                row += end - start
+            for start in range(0, len(appended), COPY_ROWS):
+                block = appended[start:start + COPY_ROWS]
+                matrix[row:row + len(block)] = block
+                row += len(block)
+            matrix.flush()
+
+        replace_file(os.path.join(self.out_dir, CHUNKS_BLOB), write_blob)
+        replace_file(os.path.join(self.out_dir, OFFSETS_FILE), npy_writer(all_offsets))
+        replace_file(os.path.join(self.out_dir, IDS_FILE), npy_writer(all_ids))
+        replace_file(os.path.join(self.out_dir, EMBEDDINGS_FILE), write_embeddings)
+        if len(all_ids):
+            replace_file(os.path.join(self.out_dir, CENTROID_FILE),
+                     npy_writer(centroid(np.load(os.path.join(self.out_dir, EMBEDDINGS_FILE), mmap_mode="r"))))
+        _finish_store(self.out_dir, len(all_ids), dim, index, index_params)
+
+    def close(self):
+        """Remove the spool files."""
+        for f, path in ((self.blob, self.blob_path), (self.vectors, self.vectors_path)):
+            f.close()
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def append_store(out_dir, keep, chunks, embeddings, ids, index=None, index_params=None):
+    """Rewrite a v2 store as the chunks where `keep` is true followed by new `chunks`."""
+    with StoreAppender(out_dir) as appender:
+        appender.append(chunks, embeddings, ids)
+        appender.commit(keep, index, index_params)
+
+
+def _finish_store(out_dir, count, dim, index, index_params):
+    if index is not None:
+        replace_file(os.path.join(out_dir, FAISS_INDEX), lambda path: faiss.write_index(index, path))
+    if index_params is not None:
+        vector_index.save_params(out_dir, index_params)
+
+    # Written last so a half-written store is never mistaken for a complete one
+    meta = {
+        "format_version": STORE_FORMAT_VERSION,
+        "count": count,
+        "dim": dim,
+    }
+
+    def write_meta(path):
+        with open(path, "w") as f:
+            json.dump(meta, f)
+
+    replace_file(os.path.join(out_dir, STORE_META), write_meta)
+
+
+def read_store_meta(data_dir):
+    meta_path = os.path.join(data_dir, STORE_META)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("format_version") not in SUPPORTED_FORMAT_VERSIONS:
+        raise ValueError(f"Unsupported store format {meta.get('format_version')} in {data_dir}")
+    return meta
+
+
+def load_chunks(data_dir):
+    """Return the chunk texts of a store, memory-mapped when possible."""
+    meta = read_store_meta(data_dir)
+    if meta is not None:
+        blob_path = os.path.join(data_dir, CHUNKS_BLOB)
+        offsets = np.load(os.path.join(data_dir, OFFSETS_FILE), mmap_mode="r")
+        ids = None
+        if meta["format_version"] >= 2:
+            ids = np.load(os.path.join(data_dir, IDS_FILE), mmap_mode="r")
+        # np.memmap refuses zero-length files
+        if os.path.getsize(blob_path) == 0:
+            blob = b""
+        else:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        return ChunkTexts(blob, offsets, ids)
+
+    legacy_path = os.path.join(data_dir, LEGACY_CHUNKS)
+    if os.path.exists(legacy_path):
+        with open(legacy_path, "rb") as f:
+            return ChunkTexts.from_list(pickle.load(f)["chunks"])
+    return None
+
+
+def load_embeddings(data_dir):
+    """Return the embedding matrix of a store as a read-only memmap."""
+    if read_store_meta(data_dir) is not None:
+        return np.load(os.path.join(data_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    legacy_path = os.path.join(data_dir, LEGACY_CHUNKS)
+    if os.path.exists(legacy_path):
+        with open(legacy_path, "rb") as f:
+            return np.asarray(pickle.load(f)["embeddings"], dtype="float32")
+    return None
+
+
+def centroid(embeddings) -> np.ndarray:
+    """Unit-length mean direction of a set of embeddings."""
+    mean = vector_index.normalize(embeddings).mean(axis=0, keepdims=True)
+    return vector_index.normalize(mean)[0]
+
+
+def load_centroid(data_dir):
+    """A store's centroid; computed from the embeddings for stores written before centroid.npy existed."""
+    path = os.path.join(data_dir, CENTROID_FILE)
+    if os.path.exists(path):
+        return np.load(path)
+    embeddings = load_embeddings(data_dir)
+    if embeddings is None or not len(embeddings):
+        return None
+    return centroid(embeddings)
+
+
+def load_index(data_dir, mmap=True):
+    """Read the product's FAISS index memory-mapped, falling back to a normal read."""
+    faiss_path = os.path.join(data_dir, FAISS_INDEX)
+    if not os.path.exists(faiss_path):
+        return None
+    if not mmap:
+        return faiss.read_index(faiss_path)
+    try:
+        return faiss.read_index(faiss_path, FAISS_MMAP_FLAG)
+    except RuntimeError as e:
+        logger.info(f"mmap read not supported for {faiss_path}, loading into memory: {str(e)}")
+        return faiss.read_index(faiss_path)
+
+
+def convert_legacy_store(data_dir, remove_legacy=False):
+    """Convert a product's chunks.pkl into the memory-mapped format."""
+    legacy_path = os.path.join(data_dir, LEGACY_CHUNKS)
+    if not os.path.exists(legacy_path):
+        return False
+    with open(legacy_path, "rb") as f:
+        data = pickle.load(f)
+    write_store(data_dir, data["chunks"], np.asarray(data["embeddings"]))
+    if remove_legacy:
+        os.remove(legacy_path)
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert chunks.pkl stores to the memory-mapped format")
+    parser.add_argument("root", nargs="?", default="processed_data")
+    parser.add_argument("--remove-legacy", action="store_true", help="delete chunks.pkl after converting")
+    args = parser.parse_args()
+
+    for product_name in sorted(os.listdir(args.root)):
+        data_dir = os.path.join(args.root, product_name)
+        if os.path.isdir(data_dir) and convert_legacy_store(data_dir, args.remove_legacy):
+            print(f"Converted {data_dir}")
@@ -0,0 +1,208 @@
+import re
+import logging
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Settings
+TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# all-MiniLM-L6-v2 truncates at 256 word pieces; leave room for [CLS]/[SEP]
+CHUNK_TOKENS = 200
+CHUNK_OVERLAP_TOKENS = 30
+READ_BLOCK_CHARS = 1 << 20
+
+# A piece of text and its [start, end) character offsets in the source document
+Chunk = namedtuple("Chunk", ["text", "start", "end"])
+
+# Split after sentence punctuation (plus closing quotes/brackets) or at a line break
+SEGMENT_END = re.compile(r"[.!?][\"')\]]*\s+|\n+")
+WORD = re.compile(r"\S+")
+
+
+class WhitespaceTokenCounter:
+    """Rough word-piece estimate used when no tokenizer can be loaded."""
+    name = "whitespace"
+
+    def count_many(self, texts):
+        return [int(len(WORD.findall(t)) * 1.3) + 1 for t in texts]
+
+
+class HFTokenCounter:
+    """Exact word-piece counts from the embedding model's own tokenizer."""
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.name = getattr(tokenizer, "name_or_path", "hf")
+
+    def count_many(self, texts):
+        if not texts:
+            return []
+        encoded = self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+
+_token_counter = None
+
+
+def get_token_counter():
+    """Tokenizer-backed counter, loaded once per process (workers included)."""
+    global _token_counter
+    if _token_counter is None:
+        try:
+            from transformers import AutoTokenizer
+            _token_counter = HFTokenCounter(AutoTokenizer.from_pretrained(TOKENIZER_NAME))
+        except Exception as e:
+            logger.warning(f"Falling back to whitespace token estimates: {str(e)}")
+            _token_counter = WhitespaceTokenCounter()
+    return _token_counter
+
+
+def read_blocks(file_path, block_size=None):
+    """Yield a text file in fixed-size blocks so large files are never held whole."""
+    block_size = block_size or READ_BLOCK_CHARS
+    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+        for block in iter(lambda: f.read(block_size), ""):
+            yield block
+
+
+def iter_segments(blocks):
+    """
+    Turn a stream of text blocks into lists of sentence/line segments. Each
+    segment keeps its trailing separator, so segments tile the source exactly
+    and offsets stay exact.
+    """
+    pending = ""
+    offset = 0
+    for block in blocks:
+        pending += block
+        segments = []
+        cut = 0
+        for match in SEGMENT_END.finditer(pending):
+            # A separator touching the end of the buffer may continue in the next block
+            if match.end() == len(pending):
+                break
+            segments.append(Chunk(pending[cut:match.end()], offset + cut, offset + match.end()))
+            cut = match.end()
+        pending = pending[cut:]
+        offset += cut
+        # Text without any separator (e.g. one huge line) is cut at the last space
+        # so the buffer stays bounded
+        if len(pending) > 2 * len(block):
+            space = pending.rfind(" ", 0, len(pending) - 1)
+            if space > 0:
+                segments.append(Chunk(pending[:space + 1], offset, offset + space + 1))
+                pending = pending[space + 1:]
+                offset += space + 1
+        if segments:
+            yield segments
+    if pending:
+        yield [Chunk(pending, offset, offset + len(pending))]
+
+
+class CharChunker:
+    """The original fixed-size character windows."""
+    def __init__(self, chunk_size=10000, chunk_overlap=500):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.name = f"chars:{chunk_size}:{chunk_overlap}"
+
+    def chunk_text(self, text):
+        yield from self.chunk_blocks([text])
+
+    def chunk_file(self, file_path):
+        yield from self.chunk_blocks(read_blocks(file_path))
+
+    def chunk_blocks(self, blocks):
+        """Windows over a stream of text blocks; only the current window and one block are held."""
+        step = self.chunk_size - self.chunk_overlap
+        buffer = ""
+        # Source offset of buffer[0]
+        offset = 0
+        for block in blocks:
+            buffer += block
+            start = 0
+            # A window that reaches the end of the buffer may be the last one; wait for more text
+            while len(buffer) - start > self.chunk_size:
+                yield Chunk(buffer[start:start + self.chunk_size], offset + start, offset + start + self.chunk_size)
+                start += step
+            buffer = buffer[start:]
+            offset += start
+        if buffer:
+            yield Chunk(buffer, offset, offset + len(buffer))
+
+
+class SentenceChunker:
+    """
+    Packs whole sentences/lines into chunks of at most `max_tokens` word pieces,
+    carrying about `overlap_tokens` of trailing context into the next chunk.
+    Works as a streaming generator, so memory use is bounded by the read block.
+    """
+    def __init__(self, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, counter=None):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.counter = counter
+        self.name = f"sentences:{max_tokens}:{overlap_tokens}"
+
+    def _counter(self):
+        if self.counter is None:
+            self.counter = get_token_counter()
+        return self.counter
+
+    def chunk_text(self, text):
+        yield from self.chunk_blocks([text])
+
+    def chunk_file(self, file_path):
+        yield from self.chunk_blocks(read_blocks(file_path))
+
+    def chunk_blocks(self, blocks):
+        yield from self._pack(iter_segments(blocks))
+
+    def _split_long(self, segment, n_tokens):
+        """Cut a segment that alone exceeds the budget at word boundaries."""
+        words = list(WORD.finditer(segment.text))
+        per_piece = max(1, int(len(words) * self.max_tokens / max(n_tokens, 1)))
+        for i in range(0, len(words), per_piece):
+            group = words[i:i + per_piece]
+            start, end = group[0].start(), group[-1].end()
+            yield Chunk(segment.text[start:end], segment.start + start, segment.start + end)
+
+    def _pack(self, segment_batches):
+        counter = self._counter()
+        window = deque()
+        total = 0
+        for segments in segment_batches:
+            for segment, n in zip(segments, counter.count_many([s.text for s in segments])):
+                if not segment.text.strip():
+                    continue
+                if n > self.max_tokens:
+                    if window:
+                        yield self._emit(window)
+                        window.clear()
+                        total = 0
+                    yield from self._split_long(segment, n)
+                    continue
+                if window and total + n > self.max_tokens:
+                    yield self._emit(window)
+                    while window and (total > self.overlap_tokens or total + n > self.max_tokens):
+                        total -= window.popleft()[1]
+                window.append((segment, n))
+                total += n
+        if window:
+            yield self._emit(window)
+
+    @staticmethod
+    def _emit(window):
+        first, last = window[0][0], window[-1][0]
+        text = "".join(segment.text for segment, _ in window).strip()
+        lead = len(first.text) - len(first.text.lstrip())
+        trail = len(last.text) - len(last.text.rstrip())
+        return Chunk(text, first.start + lead, last.end - trail)
+
+
+CHUNKERS = {
+    "chars": CharChunker,
+    "sentences": SentenceChunker,
+}
+
+
+def make_chunker(name="sentences", **kwargs):
+    return CHUNKERS[name](**kwargs)
@@ -0,0 +1,108 @@
+import os
+import re
+import math
+import logging
+
+from chunking import get_token_counter, iter_segments
+from lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Settings
+# Word pieces of retrieved context per prompt; 0 disables budgeting and sends chunks verbatim
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "512"))
+# Retrieved chunks look like "[PRODUCT] text", see SimpleChatManager.retrieve_many
+LABEL = re.compile(r"^\[([^\]]+)\] ")
+
+
+def _key(text):
+    return " ".join(text.lower().split())
+
+
+class ContextBuilder:
+    """
+    Turns retrieved chunks into a compact prompt context:
+      1. splits chunks into sentences and drops repeats, including the partial
+         sentences that chunk overlaps leave at chunk boundaries,
+      2. scores sentences by idf-weighted overlap with the query, with a small
+         bonus for sentences from higher-ranked chunks,
+      3. keeps the best sentences that fit the token budget, in document order.
+    """
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, counter=None):
+        self.token_budget = token_budget
+        self.counter = counter
+
+    def token_counter(self):
+        if self.counter is None:
+            self.counter = get_token_counter()
+        return self.counter
+
+    @staticmethod
+    def _sentences(chunks):
+        """(chunk rank, label, text, key, at chunk boundary) for every distinct sentence."""
+        sentences = []
+        seen = set()
+        for rank, chunk in enumerate(chunks):
+            match = LABEL.match(chunk)
+            label = match.group(1) if match else None
+            body = chunk[match.end():] if match else chunk
+            pieces = [seg.text.strip() for batch in iter_segments([body]) for seg in batch]
+            pieces = [p for p in pieces if p]
+            for i, text in enumerate(pieces):
+                key = _key(text)
+                if key in seen:
+                    continue
+                seen.add(key)
+                sentences.append((rank, label, text, key, i == 0 or i == len(pieces) - 1))
+        # Overlap windows cut sentences mid-way; a cut sentence is a substring of its full copy
+        keys = [s[3] for s in sentences]
+        return [
+            s for i, s in enumerate(sentences)
+            if not s[4] or not any(s[3] in other and j != i and len(other) > len(s[3]) for j, other in enumerate(keys))
+        ]
+
+    @staticmethod
+    def _scores(query, sentences):
+        terms = set(tokenize(query))
+        token_sets = [set(tokenize(s[2])) & terms for s in sentences]
+        df = {term: sum(1 for tokens in token_sets if term in tokens) for term in terms}
+        idf = {term: math.log1p(len(sentences) / count) for term, count in df.items() if count}
+        return [
+            sum(idf[term] for term in tokens) + 0.1 / (1 + rank)
+            for (rank, *_), tokens in zip(sentences, token_sets)
+        ]
+
+    def build(self, query: str, chunks: list):
+        """Return (context strings, stats) where stats counts the context tokens before and after."""
+        if not chunks or self.token_budget <= 0:
+            return chunks, {}
+        sentences = self._sentences(chunks)
+        counts = self.token_counter().count_many([s[2] for s in sentences])
+        stats = {
+            "context_tokens_in": sum(self.token_counter().count_many(chunks)),
+            "sentences_in": len(sentences),
+        }
+        scores = self._scores(query, sentences)
+        kept = []
+        used = 0
+        for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+            if used + counts[i] <= self.token_budget:
+                kept.append(i)
+                used += counts[i]
+        if not kept and sentences:
+            # Even the best sentence is over budget; send it rather than nothing
+            best = max(range(len(sentences)), key=lambda i: scores[i])
+            kept, used = [best], counts[best]
+        # Back to document order, one context entry per source chunk
+        kept.sort()
+        context = []
+        current_rank = None
+        for i in kept:
+            rank, label, text, _, _ = sentences[i]
+            if rank != current_rank:
+                context.append(f"[{label}] {text}" if label else text)
+                current_rank = rank
+            else:
+                context[-1] += " " + text
+        stats.update(context_tokens=used, sentences_kept=len(kept))
+        return context, stats
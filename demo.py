@@ -1,5 +1,7 @@
-from Chatbot import chatbot
+from Chatbot import chatbot, warm_up
 
+# Load the model in the background while the user types the first question
+warm_up()
 
 while True:
     user_input = input("Enter your text: ")
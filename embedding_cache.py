@@ -0,0 +1,174 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Settings
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", str(24 * 3600)))
+# Optional sqlite file shared by the Streamlit, CLI and voice front-ends; empty disables it
+QUERY_CACHE_DB = os.getenv("QUERY_CACHE_DB", "")
+
+
+def normalize_query(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU + TTL cache in front of SentenceTransformer.encode, keyed on
+    (model name, normalized query). An optional sqlite tier lets entries
+    survive restarts and be shared between processes. Pass `loader` instead
+    of `model` to defer loading the model until the first cache miss.
+    """
+    def __init__(self, model, model_name: str, max_entries: int = QUERY_CACHE_SIZE,
+                 ttl_seconds: float = QUERY_CACHE_TTL, db_path: str = QUERY_CACHE_DB, loader=None):
+        self.model = model
+        self.loader = loader
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db_path = db_path
+        self.db = None
+        if db_path:
+            self._open_db(db_path)
+
+    def reopen(self):
+        """Open a fresh sqlite connection, e.g. in a forked worker; connections must not cross fork()."""
+        if self.db_path:
+            self.lock = threading.Lock()
+            self._open_db(self.db_path)
+
+    def _open_db(self, db_path):
+        try:
+            self.db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT, query TEXT, vector BLOB, created REAL, "
+                "PRIMARY KEY (model, query))"
+            )
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Query embedding cache disabled on-disk tier: {str(e)}")
+            self.db = None
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds
+
+    def _get_memory(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        vector, created = entry
+        if self._expired(created):
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return vector
+
+    def _put_memory(self, key, vector, created):
+        self.entries[key] = (vector, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _get_disk(self, key):
+        if self.db is None:
+            return None
+        try:
+            row = self.db.execute(
+                "SELECT vector, created FROM query_embeddings WHERE model = ? AND query = ?", key
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Query embedding cache read failed: {str(e)}")
+            return None
+        if row is None or self._expired(row[1]):
+            return None
+        return np.frombuffer(row[0], dtype=np.float32), row[1]
+
+    def _put_disk(self, key, vector, created):
+        if self.db is None:
+            return
+        try:
+            self.db.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, vector, created) VALUES (?, ?, ?, ?)",
+                (key[0], key[1], vector.tobytes(), created),
+            )
+            self.db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Query embedding cache write failed: {str(e)}")
+
+    def _lookup(self, key):
+        """Memory then disk lookup; the caller holds the lock."""
+        vector = self._get_memory(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+        disk = self._get_disk(key)
+        if disk is not None:
+            self.disk_hits += 1
+            self._put_memory(key, disk[0], disk[1])
+            return disk[0]
+        self.misses += 1
+        return None
+
+    def encode(self, query: str) -> np.ndarray:
+        """Return the float32 embedding of a single query, computing it on a miss."""
+        return self.encode_many([query])[0]
+
+    def encode_many(self, queries: list) -> list:
+        """Embeddings for several queries, with every miss encoded in a single model call."""
+        keys = [(self.model_name, normalize_query(query)) for query in queries]
+        vectors = [None] * len(keys)
+        missing = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                vectors[i] = self._lookup(key)
+                if vectors[i] is None:
+                    missing.setdefault(key[1], []).append(i)
+        if not missing:
+            return vectors
+
+        texts = list(missing)
+        if self.model is None:
+            self.model = self.loader()
+        encoded = np.asarray(self.model.encode(texts), dtype=np.float32).reshape(len(texts), -1)
+        created = time.time()
+        with self.lock:
+            for text, vector in zip(texts, encoded):
+                vector = vector.copy()
+                # Callers share the cached array, so make sure nobody mutates it in place
+                vector.setflags(write=False)
+                key = (self.model_name, text)
+                self._put_memory(key, vector, created)
+                self._put_disk(key, vector, created)
+                for i in missing[text]:
+                    vectors[i] = vector
+        return vectors
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,108 @@
+"""
+Recall vs latency of the approximate index types against the exact flat baseline.
+
+    python index_report.py --sizes 10000 100000 --output index_report.json
+    python index_report.py --product Ibrahim
+
+Synthetic corpora are clustered unit vectors shaped like MiniLM embeddings;
+--product uses a processed product's real embeddings.npy instead.
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+import chunk_store
+import vector_index
+
+DIM = 384
+SWEEPS = {
+    "flat-ip": [{}],
+    "hnsw": [{"ef_search": 16}, {"ef_search": 64}, {"ef_search": 128}],
+    "ivf-flat": [{"nprobe": 1}, {"nprobe": 8}, {"nprobe": 32}],
+    "ivf-pq": [{"nprobe": 8}, {"nprobe": 32}],
+}
+
+
+def synthetic_embeddings(n, dim=DIM, clusters=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype("float32")
+    labels = rng.integers(0, clusters, n)
+    return centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def evaluate(embeddings, queries, k):
+    ids = np.arange(len(embeddings), dtype=np.int64)
+    rows = []
+    truth = None
+    for index_type, sweep in SWEEPS.items():
+        started = time.perf_counter()
+        index, params = vector_index.build_index(embeddings, ids, index_type)
+        build_seconds = time.perf_counter() - started
+        for knobs in sweep:
+            latencies = []
+            found = []
+            for query in queries:
+                started = time.perf_counter()
+                _, indices = vector_index.search(index, params, query, k,
+                                                 vectors_for_ids=lambda found_ids: embeddings[found_ids], **knobs)
+                latencies.append((time.perf_counter() - started) * 1000)
+                found.append(indices[0])
+            found = np.array(found)
+            if index_type == "flat-ip":
+                truth = found
+            rows.append({
+                "index_type": index_type,
+                **knobs,
+                "n": len(embeddings),
+                "build_s": round(build_seconds, 3),
+                f"recall@{k}": round(recall_at_k(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+            })
+    return rows
+
+
+def print_rows(rows, k):
+    print(f"{'type':<9} {'knob':<14} {'n':>9} {'build s':>8} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        knob = ", ".join(f"{key}={row[key]}" for key in ("nprobe", "ef_search") if key in row) or "-"
+        print(f"{row['index_type']:<9} {knob:<14} {row['n']:>9} {row['build_s']:>8} "
+              f"{row[f'recall@{k}']:>10} {row['p50_ms']:>8} {row['p99_ms']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall-vs-latency report for FAISS index types")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--product", help="use processed_data/<product>/embeddings.npy instead of synthetic data")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="write the rows as JSON to this file")
+    args = parser.parse_args()
+
+    corpora = []
+    if args.product:
+        embeddings = chunk_store.load_embeddings(os.path.join("processed_data", args.product))
+        corpora.append(np.asarray(embeddings, dtype="float32"))
+    else:
+        corpora.extend(synthetic_embeddings(n) for n in args.sizes)
+
+    all_rows = []
+    for embeddings in corpora:
+        rng = np.random.default_rng(1)
+        picks = rng.integers(0, len(embeddings), args.queries)
+        # Perturbed corpus vectors make realistic "near but not identical" queries
+        queries = embeddings[picks] + 0.3 * rng.standard_normal((args.queries, embeddings.shape[1])).astype("float32")
+        rows = evaluate(embeddings, queries, min(args.k, len(embeddings)))
+        print_rows(rows, min(args.k, len(embeddings)))
+        all_rows.extend(rows)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(all_rows, f, indent=1)
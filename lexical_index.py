@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import numpy as np
+
+from chunk_store import npy_writer, replace_file
+
+# Settings
+LEXICAL_DIR = "lexical_store"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Reciprocal-rank-fusion damping constant from Cormack et al.; 60 is the usual default
+RRF_K = 60
+# Postings are stored highest impact first and a query reads at most this many
+# per term, so very common terms cost the same as rare ones
+MAX_POSTINGS_PER_TERM = int(os.getenv("BM25_MAX_POSTINGS", "2000"))
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    return TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    BM25 over chunk positions, stored as CSR postings: the postings of term t
+    are docs[indptr[t]:indptr[t + 1]] with their precomputed BM25 impacts in
+    the same slice of `weights`, highest impact first. A query is then a few
+    slices, one bincount and one argpartition, with no per-document Python work.
+    `tfs` (term frequency of each posting) and `lengths` (tokens per chunk) let
+    update() re-weight the postings without re-tokenizing old chunks; indexes
+    saved before they were kept have neither.
+    """
+    def __init__(self, terms, indptr, docs, weights, n_docs, tfs=None, lengths=None):
+        self.vocab = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.n_docs = n_docs
+        self.tfs = tfs
+        self.lengths = lengths
+
+    def search(self, query: str, k: int):
+        """Return (positions, scores) of the top-k chunks, best first."""
+        term_ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not term_ids or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        spans = [(self.indptr[t], min(self.indptr[t + 1], self.indptr[t] + MAX_POSTINGS_PER_TERM))
+                 for t in term_ids]
+        docs = np.concatenate([self.docs[start:end] for start, end in spans])
+        weights = np.concatenate([self.weights[start:end] for start, end in spans])
+        # Sum impacts per document over only the documents that match some term
+        matched, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if len(matched) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(matched))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return matched[top].astype(np.int64), scores[top].astype(np.float32)
+
+
+def _count(chunks, vocab, first_position=0):
+    """(term ids, positions, term frequencies, lengths) of chunk texts; adds new terms to `vocab`."""
+    term_ids, doc_ids, tfs = [], [], []
+    lengths = np.zeros(len(chunks), dtype=np.float32)
+    for i, text in enumerate(chunks):
+        tokens = tokenize(text)
+        lengths[i] = len(tokens)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            term_ids.append(vocab.setdefault(token, len(vocab)))
+            doc_ids.append(first_position + i)
+            tfs.append(count)
+    return (np.asarray(term_ids, dtype=np.int64), np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(tfs, dtype=np.float32), lengths)
+
+
+def build(chunks) -> BM25Index:
+    """Build the postings for a list of chunk texts (positions follow the list order)."""
+    vocab = {}
+    term_ids, doc_ids, tfs, lengths = _count(chunks, vocab)
+    return _index(vocab, term_ids, doc_ids, tfs, lengths)
+
+
+def update(index: BM25Index, keep, chunks):
+    """
+    Postings for the chunks where `keep` is true, renumbered in order,
+    followed by new `chunks`, without re-tokenizing the kept ones. idf and
+    the average length change with the corpus, so every impact is recomputed,
+    which is a few array operations. None if `index` has no term frequencies.
+    """
+    if index.tfs is None or index.lengths is None:
+        return None
+    keep = np.asarray(keep, dtype=bool)
+    # New position of each kept chunk
+    positions = np.cumsum(keep) - 1
+    term_ids = np.repeat(np.arange(len(index.vocab), dtype=np.int64), np.diff(index.indptr))
+    docs = np.asarray(index.docs)
+    kept = keep[docs]
+    # Terms that only occurred in dropped chunks leave the vocabulary
+    live = np.unique(term_ids[kept])
+    terms = sorted(index.vocab, key=index.vocab.get)
+    vocab = {terms[t]: i for i, t in enumerate(live)}
+    remap = np.full(len(terms), -1, dtype=np.int64)
+    remap[live] = np.arange(len(live))
+
+    new_terms, new_docs, new_tfs, new_lengths = _count(chunks, vocab, int(keep.sum()))
+    return _index(
+        vocab,
+        np.concatenate([remap[term_ids[kept]], new_terms]),
+        np.concatenate([positions[docs[kept]].astype(np.int32), new_docs]),
+        np.concatenate([np.asarray(index.tfs)[kept], new_tfs]),
+        np.concatenate([np.asarray(index.lengths)[keep], new_lengths]),
+    )
+
+
+def _index(vocab, term_ids, doc_ids, tfs, lengths) -> BM25Index:
+    """CSR postings with BM25 impacts from (term, position, tf) triples in any order."""
+    n_docs = len(lengths)
+    postings = np.bincount(term_ids, minlength=len(vocab))
+    df = postings.astype(np.float32)
+    indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(postings)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    avg_length = float(lengths.mean()) if n_docs else 0.0
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / max(avg_length, 1e-9))
+    weights = (idf[term_ids] * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32)
+
+    # Group by term, highest impact first within each term
+    order = np.lexsort((doc_ids, -weights, term_ids))
+    doc_ids, weights, tfs = doc_ids[order], weights[order], tfs[order]
+
+    terms = [None] * len(vocab)
+    for term, i in vocab.items():
+        terms[i] = term
+    return BM25Index(terms, indptr, doc_ids, weights, n_docs, tfs, lengths)
+
+
+def save(data_dir, index: BM25Index):
+    out_dir = os.path.join(data_dir, LEXICAL_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    terms = sorted(index.vocab, key=index.vocab.get)
+    replace_file(os.path.join(out_dir, "indptr.npy"), npy_writer(index.indptr))
+    replace_file(os.path.join(out_dir, "docs.npy"), npy_writer(index.docs))
+    replace_file(os.path.join(out_dir, "weights.npy"), npy_writer(index.weights))
+    if index.tfs is not None:
+        replace_file(os.path.join(out_dir, "tfs.npy"), npy_writer(index.tfs))
+        replace_file(os.path.join(out_dir, "lengths.npy"), npy_writer(index.lengths))
+
+    def write_terms(path):
+        with open(path, "w") as f:
+            json.dump({"n_docs": index.n_docs, "k1": BM25_K1, "b": BM25_B, "terms": terms}, f)
+
+    # Written last, like store.json, so a partial write is never loaded
+    replace_file(os.path.join(out_dir, "terms.json"), write_terms)
+
+
+def exists(data_dir) -> bool:
+    return os.path.exists(os.path.join(data_dir, LEXICAL_DIR, "terms.json"))
+
+
+def load(data_dir, n_docs=None):
+    """Memory-mapped BM25 index of a store, or None if it has none (or it is out of step with the chunks)."""
+    if not exists(data_dir):
+        return None
+    lexical_dir = os.path.join(data_dir, LEXICAL_DIR)
+    with open(os.path.join(lexical_dir, "terms.json")) as f:
+        meta = json.load(f)
+    if n_docs is not None and meta["n_docs"] != n_docs:
+        return None
+    tfs = lengths = None
+    if os.path.exists(os.path.join(lexical_dir, "lengths.npy")):
+        tfs = np.load(os.path.join(lexical_dir, "tfs.npy"), mmap_mode="r")
+        lengths = np.load(os.path.join(lexical_dir, "lengths.npy"), mmap_mode="r")
+    return BM25Index(
+        meta["terms"],
+        np.load(os.path.join(lexical_dir, "indptr.npy"), mmap_mode="r"),
+        np.load(os.path.join(lexical_dir, "docs.npy"), mmap_mode="r"),
+        np.load(os.path.join(lexical_dir, "weights.npy"), mmap_mode="r"),
+        meta["n_docs"],
+        tfs,
+        lengths,
+    )
+
+
+def rrf_fuse(rankings, k: int, rrf_k: int = RRF_K) -> list:
+    """Reciprocal rank fusion of several best-first id lists; returns the top-k ids."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
@@ -1,9 +1,7 @@
 import pyaudio
 import torch
-import speech_recognition as sr
 import threading
 import time
-import collections
 from queue import Queue
 import io
 import os
@@ -13,7 +11,14 @@ import numpy as np
 from Speak import speak
 
 # --- Import your custom chatbot function ---
-from Chatbot import chatbot
+from Chatbot import FALLBACK_RESPONSES, chatbot_stream, prefetch, warm_up
+import metrics
+from speech_to_text import create_transcriber
+from voice_pipeline import VoicePipeline, SPEECH_START, SPEECH_AUDIO, SPEECH_END
+from ttl_store import ExpiringLogs
+from audio_ring import AudioRing
+from vad_model import load_silero, warm_up as warm_up_vad
+from tts_scheduler import SENTENCE_END, SpeakBackend, TTSScheduler
 
 # Audio parameters
 FORMAT = pyaudio.paInt16
@@ -24,102 +29,93 @@ CHUNK_SIZE = 512
 # Turn-taking and memory
 SILENCE_DURATION = 1.5
 MEMORY_EXPIRY_SECONDS = 3600
-conversation_memory = []
+MEMORY_MAX_MESSAGES = 200
+# The chatbot keeps this conversation's memory for follow-up questions
+VOICE_SESSION_ID = "voice"
+VOICE_PRODUCT = "Ibrahim"
 
-# Load Silero VAD model
+# Silero VAD is loaded in the background at startup, see vad_model.py
 device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
-try:
-    model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad',
-                                  model='silero_vad',
-                                  force_reload=False)
-except Exception as e:
-    print(f"Failed to load from torch hub: {e}. Attempting local load.")
-    model, utils = torch.hub.load(repo_or_dir='path/to/local/repo',
-                                  model='silero_vad',
-                                  force_reload=False)
-
-(get_speech_timestamps, save_audio, read_audio, VADIterator, collect_chunks) = utils
-model.to(device)
 
 
 # --- 1. Memory with Auto-Expiry ---
-class AutoExpiringMemory:
-    def __init__(self, expiry_seconds):
-        self.memory = collections.OrderedDict()
-        self.expiry_seconds = expiry_seconds
-        self.lock = threading.Lock()
-        self.start_cleanup_thread()
-
-    def start_cleanup_thread(self):
-        thread = threading.Thread(target=self._cleanup_loop, daemon=True)
-        thread.start()
-
-    def _cleanup_loop(self):
-        while True:
-            time.sleep(60)
-            self.cleanup()
-
-    def cleanup(self):
-        with self.lock:
-            now = time.time()
-            expired_keys = []
-            for key, (value, timestamp) in self.memory.items():
-                if now - timestamp > self.expiry_seconds:
-                    expired_keys.append(key)
-                else:
-                    break
-            for key in expired_keys:
-                del self.memory[key]
-
-    def add_message(self, role, text):
-        with self.lock:
-            key = len(self.memory)
-            self.memory[key] = ({"role": role, "parts": [{"text": text}]}, time.time())
-            global conversation_memory
-            conversation_memory.append({"role": role, "parts": [{"text": text}]})
-            if len(conversation_memory) > len(self.memory):
-                conversation_memory.pop(0)
-
-    def get_history(self):
-        with self.lock:
-            return [item[0] for item in self.memory.values()]
+class AutoExpiringMemory(ExpiringLogs):
+    """
+    Conversation turns in the chat-message format, kept per session and each
+    forgotten MEMORY_EXPIRY_SECONDS after it was said. Sessions with nothing
+    left are dropped by the shared timer wheel.
+    """
+    def __init__(self, expiry_seconds, max_messages=MEMORY_MAX_MESSAGES):
+        super().__init__(expiry_seconds, max_messages)
+
+    def add_message(self, role, text, session_id=VOICE_SESSION_ID):
+        return self.append(session_id, {"role": role, "parts": [{"text": text}]})
+
+    def get_history(self, session_id=VOICE_SESSION_ID):
+        return self.values(session_id)
 
 memory = AutoExpiringMemory(expiry_seconds=MEMORY_EXPIRY_SECONDS)
 
 
 # --- 2. Silero VAD and Turn-Taking ---
-def listen_for_input(audio_queue):
+def listen_for_input(audio_queue, pipeline):
+    ring = pipeline.ring
+
+    def on_audio(in_data, frame_count, time_info, status):
+        ring.write(in_data)
+        return None, pyaudio.paContinue
+
     audio = pyaudio.PyAudio()
+    # The callback copies each buffer into the preallocated ring; everything after reads views of it
     stream = audio.open(format=FORMAT,
                         channels=CHANNELS,
                         rate=RATE,
                         input=True,
-                        frames_per_buffer=CHUNK_SIZE)
+                        frames_per_buffer=CHUNK_SIZE,
+                        stream_callback=on_audio)
 
     print("Listening...")
 
+    # Audio queues up in the ring while the model finishes loading
+    model, utils = load_silero()
+    if device.type != 'cpu' and hasattr(model, 'to'):
+        model.to(device)
+    VADIterator = utils[3]
     vad_iterator = VADIterator(model, sampling_rate=RATE, min_silence_duration_ms=int(SILENCE_DURATION * 1000))
-    frames = []
+    # Silero takes float32 in [-1, 1]; reuse one buffer rather than allocating per frame
+    frame_float = np.empty(CHUNK_SIZE, dtype=np.float32)
+    turn = None
+    seq = 0
 
     while True:
         try:
-            audio_chunk = stream.read(CHUNK_SIZE, exception_on_overflow=False)
+            ready = ring.wait(seq, timeout=1.0)
+            if ready is None:
+                # Microphone stalled; keep waiting for the same frame
+                continue
+            seq = ready
             
-            audio_np = np.frombuffer(audio_chunk, dtype=np.int16).copy()
-            audio_int16 = torch.from_numpy(audio_np).to(device)
+            np.multiply(ring.frame(seq), 1 / 32768, out=frame_float, casting='unsafe')
+            audio_float = torch.from_numpy(frame_float)
+            if device.type != 'cpu':
+                audio_float = audio_float.to(device)
 
-            speech_dict = vad_iterator(audio_int16, return_seconds=True)
+            with metrics.span("vad", pipeline="voice"):
+                speech_dict = vad_iterator(audio_float, return_seconds=True)
 
+            # Frame numbers go to the recognizer as they arrive, so decoding overlaps with speaking
             if speech_dict:
                 if 'start' in speech_dict:
                     print("Speech detected! Start recording...")
-                    frames.append(audio_chunk)
+                    turn = pipeline.speech_started()
+                    audio_queue.put((SPEECH_START, turn, seq))
                 elif 'end' in speech_dict:
                     print("Silence detected. End of turn.")
-                    audio_queue.put(b''.join(frames))
-                    frames = []
-            elif frames:
-                frames.append(audio_chunk)
+                    audio_queue.put((SPEECH_END, turn, seq))
+                    turn = None
+            elif turn is not None:
+                audio_queue.put((SPEECH_AUDIO, turn, seq))
+            seq += 1
 
         except KeyboardInterrupt:
             break
@@ -130,68 +126,75 @@ def listen_for_input(audio_queue):
 
 
 # --- 3. Speech-to-Text and Chatbot Processing ---
-def process_conversation(audio_queue, response_queue):
-    r = sr.Recognizer()
-
-    while True:
-        audio_data_raw = audio_queue.get()
-        if not audio_data_raw:
-            continue
-
+def iter_sentences(deltas):
+    """Regroup streamed text deltas into whole sentences so TTS can start early."""
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        parts = SENTENCE_END.split(buffer)
+        for sentence in parts[:-1]:
+            if sentence.strip():
+                yield sentence.strip()
+        buffer = parts[-1]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def respond(text, turn, tts, pipeline):
+    """Stream the chatbot answer for one utterance and hand each sentence to TTS as soon as it is complete."""
+    print(f"You said: {text}")
+    memory.add_message("user", text)
+
+    sentences = []
+    with metrics.span("chatbot", pipeline="voice"):
+        answer = chatbot_stream(text, product=VOICE_PRODUCT, session_id=VOICE_SESSION_ID)
         try:
-            audio_data = sr.AudioData(audio_data_raw, RATE, 2)
-            user_text = r.recognize_google(audio_data)
-            print(f"You said: {user_text}")
-
-            memory.add_message("user", user_text)
+            for sentence in iter_sentences(answer):
+                if not pipeline.is_current(turn):
+                    print("Interrupted.")
+                    break
+                sentences.append(sentence)
+                tts.say(sentence, tag=turn)
+        finally:
+            answer.close()
+    ai_response_text = " ".join(sentences)
+    print(f"Chatbot says: {ai_response_text}")
 
-            # Use your custom chatbot function instead of Gemini
-            ai_response_text = chatbot(user_text, product="Ibrahim")
-            print(f"Chatbot says: {ai_response_text}")
+    memory.add_message("model", ai_response_text)
 
-            memory.add_message("model", ai_response_text)
-            response_queue.put(ai_response_text)
 
-        except sr.UnknownValueError:
-            print("Could not understand audio")
-        except sr.RequestError as e:
-            print(f"Could not request results from STT service; {e}")
-        except Exception as e:
-            print(f"An error occurred: {e}")
+def prefetch_answer(partial_text):
+    prefetch(partial_text, product=VOICE_PRODUCT, session_id=VOICE_SESSION_ID)
 
 
-# --- 4. Text-to-Speech Output (using your speak function) ---
-def play_response(response_queue):
-    while True:
-        text_to_speak = response_queue.get()
-        if not text_to_speak:
-            continue
-        
-        try:
-            # --- Use your custom speak function here ---
-            print("Playing audio response...")
-            speak(text_to_speak)
-            # -------------------------------------------
-            
-        except Exception as e:
-            print(f"TTS error: {e}")
-
 # --- Main execution ---
 if __name__ == "__main__":
-    audio_queue = Queue()
-    response_queue = Queue()
+    if metrics.METRICS_PORT:
+        metrics.start_metrics_server()
+    # Load the VAD, the embedding model and the indexes while the microphone starts listening
+    warm_up_vad()
+    warm_up()
 
-    listen_thread = threading.Thread(target=listen_for_input, args=(audio_queue,))
-    process_thread = threading.Thread(target=process_conversation, args=(audio_queue, response_queue))
-    play_thread = threading.Thread(target=play_response, args=(response_queue,))
+    audio_queue = Queue()
+    # Sentences are synthesized ahead of playback; see tts_scheduler.py
+    tts = TTSScheduler(SpeakBackend(speak), is_live=lambda turn: pipeline.is_current(turn))
+    tts.prewarm(FALLBACK_RESPONSES)
+    # Speech is transcribed while it is spoken; see voice_pipeline.py
+    pipeline = VoicePipeline(create_transcriber(),
+                             respond=lambda text, turn: respond(text, turn, tts, pipeline),
+                             prefetch=prefetch_answer,
+                             on_barge_in=tts.cancel,
+                             ring=AudioRing(CHUNK_SIZE, rate=RATE),
+                             is_playing=lambda: not tts.wait_idle(0))
+
+    listen_thread = threading.Thread(target=listen_for_input, args=(audio_queue, pipeline))
+    process_thread = threading.Thread(target=pipeline.run, args=(audio_queue,))
     
     listen_thread.daemon = True
     process_thread.daemon = True
-    play_thread.daemon = True
     
     listen_thread.start()
     process_thread.start()
-    play_thread.start()
 
     try:
         while True:
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+# Per-request JSON lines are informational; let them through even when the root logger is at WARNING
+request_logger = logging.getLogger("metrics.requests")
+request_logger.setLevel(logging.INFO)
+
+# Settings
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False")
+# Emit one JSON line per request with its stage timings
+METRICS_JSON_LOG = os.getenv("METRICS_JSON_LOG", "0") not in ("0", "false", "False")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Seconds; covers sub-millisecond FAISS searches up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# For histograms of counts, e.g. queries per batch
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process histograms and counters, rendered in Prometheus text format."""
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, help_text="", buckets=DEFAULT_BUCKETS, **labels):
+        """`buckets` only applies when the histogram is first created."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+                self.help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self.help.setdefault(name, help_text)
+
+    def snapshot(self):
+        """Stage -> count/sum/mean, handy for logs and tests."""
+        with self.lock:
+            return {
+                f"{name}{dict(labels)}": {
+                    "count": h.count, "sum": h.total, "mean": h.total / h.count if h.count else 0.0,
+                }
+                for (name, labels), h in self.histograms.items()
+            }
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', repr(float(bound))),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {h.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {h.total}")
+                lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+registry = MetricsRegistry()
+_current_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace(dict):
+    """Stage -> seconds for one request."""
+    def __init__(self, pipeline, **fields):
+        super().__init__()
+        self.pipeline = pipeline
+        self.fields = fields
+        self.started = time.perf_counter()
+
+    def finish(self):
+        total = time.perf_counter() - self.started
+        registry.observe("request_duration_seconds", total, "End-to-end request time", pipeline=self.pipeline)
+        registry.inc("requests_total", help_text="Requests handled", pipeline=self.pipeline)
+        if METRICS_JSON_LOG:
+            record = {"pipeline": self.pipeline, "total_ms": round(total * 1000, 3), **self.fields}
+            record.update({f"{stage}_ms": round(seconds * 1000, 3) for stage, seconds in self.items()})
+            request_logger.info(json.dumps(record))
+
+
+class _Span:
+    __slots__ = ("name", "pipeline", "trace", "started")
+
+    def __init__(self, name, pipeline, trace):
+        self.name = name
+        self.pipeline = pipeline
+        self.trace = trace
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started, self.pipeline, self.trace)
+        return False
+
+
+def record(name, seconds, pipeline="chat", trace=None):
+    """Record a stage duration measured by the caller."""
+    if not METRICS_ENABLED:
+        return
+    registry.observe("stage_duration_seconds", seconds, "Time spent in each pipeline stage",
+                     pipeline=pipeline, stage=name)
+    trace = trace if trace is not None else _current_trace.get()
+    if trace is not None:
+        trace[name] = trace.get(name, 0.0) + seconds
+
+
+def span(name, pipeline="chat", trace=None):
+    """
+    Time a stage. Timings land in `trace` if given, else in the request trace
+    of the current context. A shared no-op object is returned when disabled.
+    """
+    if not METRICS_ENABLED:
+        return _NULL_SPAN
+    return _Span(name, pipeline, trace)
+
+
+def start_trace(pipeline="chat", **fields):
+    return Trace(pipeline, **fields) if METRICS_ENABLED else None
+
+
+@contextmanager
+def request_trace(pipeline="chat", **fields):
+    """Collect the stage timings of one request and optionally log them as a JSON line."""
+    trace = start_trace(pipeline, **fields)
+    if trace is None:
+        yield None
+        return
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+
+
+def bind_trace(trace, fn):
+    """Wrap `fn` so spans inside it (e.g. in a worker thread) report to `trace`."""
+    if trace is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        token = _current_trace.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+    return wrapper
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("/metrics", ""):
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serve /metrics on a daemon thread, for front-ends that have no HTTP server of their own."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    logger.info(f"Serving metrics on port {server.server_port}")
+    return server
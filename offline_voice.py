@@ -0,0 +1,205 @@
+"""
+Offline voice mode: VAD, transcription and answers for recorded audio, with
+no microphone or PyAudio, so the voice path can run and be load-tested on a
+headless server.
+
+    python offline_voice.py calls/*.wav --workers 4
+    arecord -f S16_LE -r 16000 -c 1 -d 30 | python offline_voice.py -
+    python offline_voice.py calls/*.wav --no-chatbot --output rtf.json
+
+Inputs are WAV files, raw 16 kHz mono int16 PCM files, or "-" for raw PCM on
+stdin. Each worker process loads Silero and the recognizer once, finds the
+speech in a whole recording with one get_speech_timestamps() call instead of
+512-sample VADIterator steps, and transcribes the segments. The parent sends
+the transcripts to the chatbot as recordings finish, one session per
+recording. The report gives every stage's real-time factor: processing
+seconds per second of audio.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Settings
+OFFLINE_WORKERS = int(os.getenv("OFFLINE_WORKERS", "2"))
+# Concurrent chatbot requests from the parent
+OFFLINE_CHAT_CONCURRENCY = int(os.getenv("OFFLINE_CHAT_CONCURRENCY", "4"))
+RATE = 16000
+# Same turn-taking as the live loop in main.py
+SILENCE_DURATION = 1.5
+MIN_SPEECH_MS = 250
+STDIN = "-"
+
+
+def read_pcm(path: str) -> np.ndarray:
+    """Mono 16 kHz int16 samples of a WAV or raw PCM file ("-" reads raw PCM from stdin)."""
+    if path == STDIN:
+        data = sys.stdin.buffer.read()
+        return np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16)
+    if not path.lower().endswith(".wav"):
+        return np.fromfile(path, dtype=np.int16)
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV is supported")
+        rate, channels = f.getframerate(), f.getnchannels()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    if rate != RATE:
+        # Linear resampling is plenty for VAD and speech recognition
+        positions = np.arange(0, len(samples), rate / RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+    return samples
+
+
+# --- Worker processes: VAD and transcription ---
+_vad = None
+_transcriber = None
+
+
+def _init_worker(threads: int, stt_backend: str, stt_options: dict):
+    global _vad, _transcriber
+    from prefork import limit_threads
+    import vad_model
+    from speech_to_text import create_transcriber
+
+    limit_threads(threads)
+    vad_model.warm_up(background=False)
+    model, utils = vad_model.load_silero()
+    _vad = (model, utils[0])
+    _transcriber = create_transcriber(stt_backend, **stt_options)
+
+
+def transcribe_recording(name: str, samples: np.ndarray = None) -> dict:
+    """Speech segments of one recording with their transcripts, and the time spent per stage."""
+    import torch
+
+    timings = {}
+    started = time.perf_counter()
+    if samples is None:
+        samples = read_pcm(name)
+    timings["read"] = time.perf_counter() - started
+
+    model, get_speech_timestamps = _vad
+    started = time.perf_counter()
+    speech = get_speech_timestamps(torch.from_numpy(samples.astype(np.float32) / 32768.0), model,
+                                   sampling_rate=RATE,
+                                   min_silence_duration_ms=int(SILENCE_DURATION * 1000),
+                                   min_speech_duration_ms=MIN_SPEECH_MS)
+    timings["vad"] = time.perf_counter() - started
+
+    segments = []
+    started = time.perf_counter()
+    for span in speech:
+        # A view of the recording; nothing is copied until the recognizer buffers it
+        pcm = memoryview(samples[span["start"]:span["end"]]).cast("B")
+        segments.append({
+            "start_s": round(span["start"] / RATE, 2),
+            "end_s": round(span["end"] / RATE, 2),
+            "text": _transcriber.transcribe(pcm),
+        })
+    timings["stt"] = time.perf_counter() - started
+    return {"name": name, "audio_s": len(samples) / RATE, "segments": segments, "timings": timings}
+
+
+# --- Parent: chatbot and report ---
+def answer_recording(result: dict, product: str) -> dict:
+    """Ask the chatbot every transcribed segment in order, as one conversation."""
+    import Chatbot
+
+    started = time.perf_counter()
+    for segment in result["segments"]:
+        if segment["text"]:
+            segment["answer"] = Chatbot.chatbot(segment["text"], product, session_id=f"offline:{result['name']}")
+    result["timings"]["chatbot"] = time.perf_counter() - started
+    return result
+
+
+def real_time_factors(results: list, wall_s: float) -> dict:
+    audio_s = sum(result["audio_s"] for result in results)
+    stages = {}
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    return {
+        "recordings": len(results),
+        "audio_s": round(audio_s, 2),
+        "wall_s": round(wall_s, 2),
+        "rtf": {stage: round(seconds / audio_s, 4) if audio_s else None for stage, seconds in stages.items()},
+        # Audio seconds processed per wall-clock second across all workers
+        "throughput_x_realtime": round(audio_s / wall_s, 2) if wall_s else None,
+    }
+
+
+def run(paths, workers: int = OFFLINE_WORKERS, product: str = None, chatbot: bool = True,
+        stt_backend: str = None, stt_options: dict = None, threads: int = 1):
+    """Process recordings in parallel; returns (per-recording results, report)."""
+    from speech_to_text import STT_BACKEND
+    import Chatbot
+
+    product = product or Chatbot.DEFAULT_PRODUCT
+    if chatbot:
+        Chatbot.warm_up()
+    started = time.perf_counter()
+    results = []
+    # spawn, not fork: the parent has the chatbot's warm-up and event-loop threads running
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(threads, stt_backend or STT_BACKEND, stt_options or {})) as pool, \
+            ThreadPoolExecutor(max_workers=OFFLINE_CHAT_CONCURRENCY) as chat_pool:
+        futures = [
+            pool.submit(transcribe_recording, path, read_pcm(path) if path == STDIN else None)
+            for path in paths
+        ]
+        answers = []
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Transcription failed: {str(e)}")
+                continue
+            if chatbot:
+                answers.append(chat_pool.submit(answer_recording, result, product))
+            else:
+                results.append(result)
+        for future in as_completed(answers):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Chatbot failed: {str(e)}")
+    return results, real_time_factors(results, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VAD, transcription and answers for recorded audio")
+    parser.add_argument("inputs", nargs="+", help='WAV or raw 16 kHz int16 PCM files, or "-" for stdin')
+    parser.add_argument("--workers", type=int, default=OFFLINE_WORKERS)
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--product", default=None)
+    parser.add_argument("--stt", default=None, help="speech_to_text backend (default: STT_BACKEND)")
+    parser.add_argument("--fake-transcript", default=None, help="script for --stt fake")
+    parser.add_argument("--no-chatbot", action="store_true", help="stop after transcription")
+    parser.add_argument("--output", help="write results and report as JSON to this file")
+    args = parser.parse_args()
+
+    options = {"transcripts": args.fake_transcript or ""} if args.stt == "fake" else {}
+    results, report = run(args.inputs, args.workers, args.product, not args.no_chatbot,
+                          args.stt, options, args.threads)
+    for result in sorted(results, key=lambda result: result["name"]):
+        print(f"== {result['name']} ({result['audio_s']:.1f}s, {len(result['segments'])} segment(s))")
+        for segment in result["segments"]:
+            print(f"[{segment['start_s']:.2f}-{segment['end_s']:.2f}] You said: {segment['text']}")
+            if "answer" in segment:
+                print(f"Chatbot says: {segment['answer']}")
+    print(json.dumps(report, indent=1))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results, "report": report}, f, indent=1)
@@ -0,0 +1,201 @@
+import os
+import json
+import random
+import asyncio
+import logging
+import threading
+import weakref
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Settings
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+OPENROUTER_READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "60"))
+OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "8"))
+OPENROUTER_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class OpenRouterError(Exception):
+    """Raised when OpenRouter keeps failing after all retries."""
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    """Full-jitter exponential backoff, honouring a numeric Retry-After header."""
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def parse_sse_line(line: str):
+    """Return the content delta of one SSE line, None to skip it, or StopIteration at [DONE]."""
+    if not line or not line.startswith("data:"):
+        # Blank separators and ": OPENROUTER PROCESSING" keep-alive comments
+        return None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return StopIteration
+    try:
+        chunk = json.loads(data)
+    except json.JSONDecodeError:
+        logger.warning(f"Skipping malformed stream line: {data[:100]}")
+        return None
+    if "error" in chunk:
+        raise OpenRouterError(chunk["error"].get("message", "stream error"))
+    choices = chunk.get("choices") or []
+    if choices:
+        return (choices[0].get("delta") or {}).get("content")
+    return None
+
+
+class AsyncOpenRouterClient:
+    """
+    Shared, pooled HTTP/2 client for OpenRouter chat completions with
+    connect/read timeouts, bounded concurrency and jittered retries on 429/5xx.
+    """
+    def __init__(self, api_key: str, model: str, url: str = OPENROUTER_URL,
+                 max_concurrency: int = OPENROUTER_MAX_CONCURRENCY,
+                 max_retries: int = OPENROUTER_MAX_RETRIES):
+        self.api_key = api_key
+        self.model = model
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # One pooled client per event loop; connections can't be shared across loops
+        self.clients = weakref.WeakKeyDictionary()
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self.clients:
+            client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(OPENROUTER_READ_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+            self.clients[loop] = (client, asyncio.Semaphore(self.max_concurrency))
+        return self.clients[loop]
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    async def complete(self, prompt: str) -> str:
+        client, semaphore = self._ensure_client()
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await client.post(self.url, json=self._payload(prompt, False))
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadTimeout) as e:
+                    if attempt == self.max_retries:
+                        raise OpenRouterError(f"OpenRouter unreachable: {str(e)}")
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                if response.status_code == 200:
+                    return response.json()["choices"][0]["message"]["content"]
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    logger.warning(f"OpenRouter returned {response.status_code}, retrying")
+                    await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                    continue
+                raise OpenRouterError(f"OpenRouter API error: {response.text}", response.status_code)
+
+    async def stream(self, prompt: str):
+        """Yield content deltas. Retries only happen before the first byte is received."""
+        client, semaphore = self._ensure_client()
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with client.stream("POST", self.url, json=self._payload(prompt, True)) as response:
+                        if response.status_code != 200:
+                            body = (await response.aread()).decode("utf-8", "replace")
+                            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                                logger.warning(f"OpenRouter returned {response.status_code}, retrying")
+                                await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                                continue
+                            raise OpenRouterError(f"OpenRouter API error: {body}", response.status_code)
+                        async for line in response.aiter_lines():
+                            delta = parse_sse_line(line)
+                            if delta is StopIteration:
+                                break
+                            if delta:
+                                yield delta
+                        return
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    if attempt == self.max_retries:
+                        raise OpenRouterError(f"OpenRouter unreachable: {str(e)}")
+                    await asyncio.sleep(backoff_delay(attempt))
+
+    async def aclose(self):
+        """Close the client bound to the running loop."""
+        entry = self.clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+
+class BackgroundLoop:
+    """
+    An event loop on a daemon thread, so synchronous callers (Streamlit, the CLI,
+    the voice threads) share one pooled async client instead of opening their own.
+    """
+    def __init__(self):
+        self.loop = None
+        self.lock = threading.Lock()
+        # The loop's thread doesn't survive fork(); a forked worker starts its own on first use
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.loop = None
+        self.lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="chatbot-loop")
+                thread.start()
+            return self.loop
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def iterate(self, agen):
+        """Drive an async generator from synchronous code, one item at a time."""
+        loop = self._ensure_loop()
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
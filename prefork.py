@@ -0,0 +1,198 @@
+"""
+Pre-fork serving for server.py: the embedding model and the product indexes are
+loaded once in a parent process and forked workers share them copy-on-write.
+The chunk blobs, embeddings and flat indexes are memory-mapped, so those pages
+are shared through the page cache as well.
+
+    python prefork.py --workers 4 --port 8000
+    python prefork.py --workers 4 --measure    # print per-process memory and exit
+
+Each worker gets its own event loop, HTTP client pool and retrieval batcher,
+and its torch/FAISS thread pools are capped so the workers together use
+about one thread per core instead of each trying to use all of them.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import signal
+import socket
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+# Settings
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", "2"))
+# Intra-op threads per worker; 0 splits the cores evenly between workers
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def limit_threads(n: int):
+    """Cap the torch and FAISS (OpenMP/BLAS) thread pools of this process."""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(n)
+    try:
+        import torch
+        torch.set_num_threads(n)
+    except ImportError:
+        pass
+    import faiss
+    faiss.omp_set_num_threads(n)
+
+
+def preload(products=None):
+    """Load the model, the web stack and every resident product in this (parent) process."""
+    import uvicorn  # noqa: F401
+    import server  # noqa: F401
+    import Chatbot
+
+    engine = Chatbot.get_engine()
+    engine.warm_up(background=False)
+    manager = engine.manager
+    names = products or manager.product_data.names()
+    for name in names[:manager.product_data.max_products]:
+        # A retrieval also pages in the index and builds the tokenizer's lazy state
+        manager.retrieve("warm up", name)
+    # Move everything loaded so far out of the collector's reach; otherwise the
+    # first GC pass in each worker touches every object and un-shares its page
+    gc.collect()
+    gc.freeze()
+    return names
+
+
+def process_memory(pid: int) -> dict:
+    """Rss, Pss and private (unshared) MB of a process, from /proc on Linux."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    fields[key] = int(rest.split()[0])
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "private_mb": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+def memory_report(parent_pid: int, worker_pids: list) -> dict:
+    workers = {str(pid): process_memory(pid) for pid in worker_pids}
+    private = [m["private_mb"] for m in workers.values() if m]
+    return {
+        "parent": process_memory(parent_pid),
+        "workers": workers,
+        # What one more worker costs: the memory it does not share with the parent
+        "per_additional_worker_mb": round(sum(private) / len(private), 1) if private else None,
+    }
+
+
+def worker_main(sock: socket.socket, threads: int, ready_fd: int, products: list):
+    limit_threads(threads)
+    import uvicorn
+    import Chatbot
+    import server
+
+    engine = Chatbot.get_engine()
+    engine.query_embedding_cache.reopen()
+    for name in products:
+        engine.manager.retrieve("warm up", name)
+    os.write(ready_fd, b"1")
+    os.close(ready_fd)
+    config = uvicorn.Config(server.app, log_level=os.getenv("LOG_LEVEL", "warning").lower())
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks the workers, restarts any that die and stops them all on SIGTERM/SIGINT."""
+    def __init__(self, sock, n_workers, threads, products):
+        self.sock = sock
+        self.n_workers = n_workers
+        self.threads = threads
+        self.products = products
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self) -> int:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                worker_main(self.sock, self.threads, write_fd, self.products)
+            except BaseException as e:
+                logger.error(f"Worker {os.getpid()} failed: {str(e)}")
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        self.workers[pid] = read_fd
+        return pid
+
+    def wait_ready(self):
+        for pid, read_fd in list(self.workers.items()):
+            if read_fd is None:
+                continue
+            if not os.read(read_fd, 1):
+                logger.error(f"Worker {pid} exited before it was ready")
+            os.close(read_fd)
+            self.workers[pid] = None
+
+    def stop(self, *_):
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self, measure=False):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.n_workers):
+            self.spawn()
+        self.wait_ready()
+        if measure:
+            # Give uvicorn a moment to finish its own startup in every worker
+            time.sleep(1.0)
+            print(json.dumps(memory_report(os.getpid(), list(self.workers)), indent=1))
+            self.stop()
+        while self.workers:
+            pid, status = os.wait()
+            self.workers.pop(pid, None)
+            if not self.stopping:
+                logger.warning(f"Worker {pid} exited with status {status}, restarting")
+                self.spawn()
+                self.wait_ready()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve server.py from pre-forked workers sharing one model")
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS,
+                        help="torch/FAISS threads per worker (default: cores / workers)")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", "8000")))
+    parser.add_argument("--products", nargs="*", help="products to preload (default: all, up to the budget)")
+    parser.add_argument("--measure", action="store_true", help="print per-process memory once ready, then exit")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("prefork.py needs fork(); run server.py directly on this platform")
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    # OpenMP pools are not fork-safe once started, so the parent stays single-threaded
+    limit_threads(1)
+    products = preload(args.products)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    Supervisor(sock, args.workers, threads, products).run(measure=args.measure)
@@ -1,63 +1,382 @@
 import os
-import pickle
-import faiss
+import json
+import shutil
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+import chunk_store
+import lexical_index
+import vector_index
+from chunking import CHUNKERS, CharChunker, Chunk, make_chunker, read_blocks
 
 # Settings
 LOCAL_STORAGE = "local_storage"
 OUTPUT_DIR = "processed_data"
 CHUNK_SIZE = 10000
 CHUNK_OVERLAP = 500
+# "sentences" packs sentences up to the embedding model's token limit; "chars" is the old 10k windows
+CHUNKER = os.getenv("CHUNKER", "sentences")
+# "auto" picks flat / HNSW / IVF-PQ from the corpus size, see vector_index.choose_index_type
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
 MODEL_NAME = "all-MiniLM-L6-v2"
+MANIFEST_FILE = "manifest.json"
+# New chunks are encoded and appended to the store this many at a time
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "1024"))
+
+# Model is loaded on first use so chunking workers don't each load a copy
+model = None
 
-# Initialize model globally
-model = SentenceTransformer(MODEL_NAME)
+def get_model():
+    global model
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(MODEL_NAME)
+    return model
 
-# Helper: chunk text
+# Helper: chunk text into the original fixed character windows
 def chunk_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunks.append(text[start:end])
-        if end == len(text):
-            break
-        start = end - chunk_overlap
-    return chunks
+    return [chunk.text for chunk in CharChunker(chunk_size, chunk_overlap).chunk_text(text)]
+
+# Document readers by extension; each yields the text in blocks (pages, paragraphs)
+# so chunking never needs the whole document. Optional formats register only if
+# their library is installed.
+def read_text_file(file_path):
+    return read_blocks(file_path)
+
+def _joined(parts):
+    """Blocks of "\n".join(parts) without building the joined string."""
+    for i, part in enumerate(parts):
+        yield part if i == 0 else "\n" + part
+
+READERS = {".txt": read_text_file, ".md": read_text_file}
+
+try:
+    from pypdf import PdfReader
+
+    def read_pdf_file(file_path):
+        return _joined(page.extract_text() or "" for page in PdfReader(file_path).pages)
+
+    READERS[".pdf"] = read_pdf_file
+except ImportError:
+    pass
+
+try:
+    import docx
+
+    def read_docx_file(file_path):
+        return _joined(p.text for p in docx.Document(file_path).paragraphs)
+
+    READERS[".docx"] = read_docx_file
+except ImportError:
+    pass
+
+def is_supported(file_path):
+    return os.path.splitext(file_path)[1].lower() in READERS
+
+def load_and_chunk(file_path, chunker):
+    """Read one document and lazily split it into chunks with source offsets."""
+    reader = READERS[os.path.splitext(file_path)[1].lower()]
+    return file_path, chunker.chunk_blocks(reader(file_path))
+
+def spool_chunks(file_path, chunker, spool_dir):
+    """
+    Chunk one document into a JSON-lines file in `spool_dir`. Runs inside a
+    worker, which then returns only the file's path, so neither the worker
+    nor the parent ever holds a whole document's chunks.
+    """
+    _, chunks = load_and_chunk(file_path, chunker)
+    fd, spool_path = tempfile.mkstemp(suffix=".jsonl", dir=spool_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps(list(chunk)) + "\n")
+    return file_path, spool_path
+
+def read_spool(spool_path):
+    """Chunks from a spool_chunks() file, deleting it once they have all been read."""
+    try:
+        with open(spool_path, encoding="utf-8") as f:
+            for line in f:
+                yield Chunk(*json.loads(line))
+    finally:
+        os.remove(spool_path)
+
+def default_batch_size():
+    """Larger encode batches on GPU, moderate ones on CPU to keep memory in check."""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return 256
+    except ImportError:
+        pass
+    return 64
+
+def gather_products(root=LOCAL_STORAGE):
+    """Map each product (top-level folder of `root`) to all of its supported documents."""
+    products = {}
+    for dirpath, dirs, files in os.walk(root):
+        rel = os.path.relpath(dirpath, root)
+        if rel == ".":
+            continue
+        product_name = rel.split(os.sep)[0]
+        for file in sorted(files):
+            file_path = os.path.join(dirpath, file)
+            if is_supported(file_path):
+                products.setdefault(product_name, []).append(file_path)
+    return products
+
+def read_documents(files, workers=1, chunker=None):
+    """
+    Yield (file path, chunk iterator) for each document as soon as it can be
+    read. With one worker the document is chunked as the iterator is
+    consumed; with more, worker processes chunk files in parallel into spool
+    files and documents come back in completion order. Consume each iterator
+    before asking for the next document.
+    """
+    chunker = chunker or make_chunker(CHUNKER)
+    if workers <= 1 or len(files) <= 1:
+        for f in files:
+            yield load_and_chunk(f, chunker)
+        return
+    spool_dir = tempfile.mkdtemp(prefix="chunks_")
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            futures = [pool.submit(spool_chunks, f, chunker, spool_dir) for f in files]
+            for future in as_completed(futures):
+                file_path, spool_path = future.result()
+                yield file_path, read_spool(spool_path)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_sha1(chunk):
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+def load_manifest(out_dir, chunker):
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("model") != MODEL_NAME or manifest.get("chunker") != chunker.name:
+        print(f"Model or chunker changed for {out_dir}, re-encoding everything")
+        return None
+    return manifest
+
+def save_manifest(out_dir, manifest):
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=1)
+
+    chunk_store.replace_file(os.path.join(out_dir, MANIFEST_FILE), write)
+
+def load_previous_store(out_dir):
+    """
+    The last run's mapped chunk texts and embeddings, with its id-addressable
+    index (in memory, to be updated) and params. Nothing is decoded or copied.
+    """
+    chunks = chunk_store.load_chunks(out_dir)
+    embeddings = chunk_store.load_embeddings(out_dir)
+    index = chunk_store.load_index(out_dir, mmap=False)
+    if chunks is None or embeddings is None or index is None or chunks.ids is None:
+        return None
+    return chunks, embeddings, index, vector_index.load_params(out_dir)
+
+def process_product(product_name, files, workers=1, batch_size=None, output_dir=OUTPUT_DIR, full=False,
+                    chunker=None, index_type=INDEX_TYPE):
+    """
+    Bring a product's store up to date with its documents. Unchanged files are
+    skipped by mtime/size and content hash, only new or changed chunks are
+    encoded, and chunks that disappeared are removed from the ID-mapped index.
+    The store and BM25 postings are updated the same way: removed chunks are
+    dropped, new ones appended, and unchanged ones copied over as they are.
+    """
+    out_dir = os.path.join(output_dir, product_name)
+    chunker = chunker or make_chunker(CHUNKER)
+    manifest = None if full else load_manifest(out_dir, chunker)
+    previous = load_previous_store(out_dir) if manifest else None
+    if previous is None:
+        manifest = None
+        old_chunks, old_embeddings, index, index_params = None, None, None, None
+    else:
+        old_chunks, old_embeddings, index, index_params = previous
+    old_files = manifest["files"] if manifest else {}
+    next_id = manifest["next_id"] if manifest else 0
+
+    # Work out which files changed since the last run
+    new_files = {}
+    changed = []
+    for file_path in files:
+        key = os.path.normpath(file_path)
+        stat = os.stat(file_path)
+        entry = old_files.get(key)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            new_files[key] = entry
+            continue
+        sha256 = file_sha256(file_path)
+        if entry and entry["sha256"] == sha256:
+            new_files[key] = dict(entry, mtime=stat.st_mtime, size=stat.st_size)
+            continue
+        new_files[key] = {"sha256": sha256, "mtime": stat.st_mtime, "size": stat.st_size}
+        changed.append(file_path)
+
+    dropped_ids = []
+    for key, entry in old_files.items():
+        if key not in new_files:
+            dropped_ids.extend(entry["chunk_ids"])
+
+    target_type = None if index_type == "auto" else index_type
+    with chunk_store.StoreAppender(out_dir) as appender:
+        pending_ids, pending_chunks = [], []
+
+        def flush():
+            """Encode the batch, add it to the index and spool it to the store."""
+            embeddings = get_model().encode(
+                pending_chunks, batch_size=batch_size or default_batch_size(), convert_to_numpy=True
+            ).astype("float32")
+            if index is not None and index_params["type"] == (target_type or index_params["type"]):
+                index.add_with_ids(vector_index.prepare(embeddings, index_params),
+                                   np.array(pending_ids, dtype=np.int64))
+            appender.append(pending_chunks, embeddings, pending_ids)
+            pending_ids.clear()
+            pending_chunks.clear()
+
+        # Re-chunk changed files, reusing the ids (and embeddings) of chunks whose text is unchanged
+        for file_path, file_chunks in read_documents(changed, workers, chunker):
+            key = os.path.normpath(file_path)
+            reusable = {}
+            old_entry = old_files.get(key)
+            if old_entry:
+                for chunk_id, digest in zip(old_entry["chunk_ids"], old_entry["chunk_hashes"]):
+                    reusable.setdefault(digest, []).append(chunk_id)
+            chunk_ids, chunk_hashes, chunk_spans = [], [], []
+            for chunk, start, end in file_chunks:
+                digest = chunk_sha1(chunk)
+                if reusable.get(digest):
+                    chunk_id = reusable[digest].pop(0)
+                else:
+                    chunk_id = next_id
+                    next_id += 1
+                    pending_ids.append(chunk_id)
+                    pending_chunks.append(chunk)
+                    if len(pending_chunks) >= INGEST_BATCH_CHUNKS:
+                        flush()
+                chunk_ids.append(chunk_id)
+                chunk_hashes.append(digest)
+                chunk_spans.append([start, end])
+            for leftover in reusable.values():
+                dropped_ids.extend(leftover)
+            new_files[key].update(chunk_ids=chunk_ids, chunk_hashes=chunk_hashes, chunk_spans=chunk_spans)
+        if pending_chunks:
+            flush()
+        encoded = len(appender)
+
+        new_manifest = {"model": MODEL_NAME, "chunker": chunker.name, "next_id": next_id, "files": new_files}
+        index_unchanged = index_type == "auto" or (index_params and index_params["type"] == index_type)
+        if manifest and not encoded and not dropped_ids and index_unchanged and lexical_index.exists(out_dir):
+            save_manifest(out_dir, new_manifest)
+            print(f"{product_name} is up to date")
+            return
+
+        # Rows of the previous store that survive; new chunks were appended after them
+        if old_chunks is None:
+            keep = None
+            n_chunks = len(appender)
+        else:
+            keep = ~np.isin(np.asarray(old_chunks.ids), np.array(dropped_ids, dtype=np.int64))
+            n_chunks = int(keep.sum()) + len(appender)
+        if not n_chunks:
+            appender.close()
+            remove_store(out_dir, product_name, existed=old_chunks is not None or bool(old_files))
+            return
+
+        target_type = target_type or vector_index.choose_index_type(n_chunks)
+        if (index is None or index_params["type"] != target_type
+                or (dropped_ids and not vector_index.supports_removal(index_params))):
+            # Rebuilt from stored embeddings; nothing is re-encoded
+            ids = appender.texts().ids
+            matrix = appender.embeddings()
+            if keep is not None:
+                ids = np.concatenate([np.asarray(old_chunks.ids)[keep], ids])
+                matrix = np.concatenate([old_embeddings[keep], matrix]) if len(matrix) else old_embeddings[keep]
+            index, index_params = vector_index.build_index(matrix, ids, target_type)
+        elif dropped_ids:
+            index.remove_ids(np.array(dropped_ids, dtype=np.int64))
+
+        # BM25 postings of kept chunks are carried over; only new chunks are tokenized
+        lexical = None
+        if old_chunks is not None:
+            previous_lexical = lexical_index.load(out_dir, len(old_chunks))
+            if previous_lexical is not None:
+                lexical = lexical_index.update(previous_lexical, keep, appender.texts())
+
+        # Save chunks, embeddings and FAISS index in the memory-mapped store format
+        appender.commit(keep, index, index_params)
+    if lexical is None:
+        # First run, or postings saved without term frequencies
+        lexical = lexical_index.build(chunk_store.load_chunks(out_dir))
+    lexical_index.save(out_dir, lexical)
+    save_manifest(out_dir, new_manifest)
+    chunk_store.notify_rebuilt(product_name)
+    print(f"Processed {product_name}: {len(changed)} changed file(s), "
+          f"{encoded} chunks encoded, {len(dropped_ids)} removed -> {out_dir}")
+
+def remove_store(out_dir, product_name, existed=True):
+    """Delete a product's store once it has no text left, so it stops being served."""
+    shutil.rmtree(out_dir, ignore_errors=True)
+    if existed:
+        chunk_store.notify_rebuilt(product_name)
+        print(f"No documents left for {product_name}, removed {out_dir}")
+    else:
+        print(f"No text found for {product_name}, skipping")
 
 def process_file(file_path):
-    """Process a single text file and create embeddings."""
-    if not file_path.endswith('.txt'):
+    """Re-index the product that owns a file, including all of its other documents."""
+    if not is_supported(file_path):
         return
-    
     product_name = os.path.basename(os.path.dirname(file_path))
-    with open(file_path, "r", encoding="utf-8") as f:
-        text = f.read()
-    
-    chunks = chunk_text(text)
-    embeddings = model.encode(chunks)
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings.astype("float32"))
-    
-    # Prepare output dirs
-    out_dir = os.path.join(OUTPUT_DIR, product_name)
-    faiss_dir = os.path.join(out_dir, "faiss_store")
-    os.makedirs(faiss_dir, exist_ok=True)
-    
-    # Save chunks
-    with open(os.path.join(out_dir, "chunks.pkl"), "wb") as f:
-        pickle.dump({"chunks": chunks, "embeddings": embeddings}, f)
-    
-    # Save FAISS index
-    faiss.write_index(index, os.path.join(faiss_dir, "index.faiss"))
-    print(f"Processed {file_path} -> {out_dir}")
+    # Empty when the file was the product's last document and has been deleted
+    files = gather_products(os.path.dirname(os.path.dirname(file_path))).get(product_name, [])
+    process_product(product_name, files)
+
+def run_ingestion(root=LOCAL_STORAGE, products=None, workers=1, batch_size=None, output_dir=OUTPUT_DIR,
+                  full=False, chunker=None, index_type=INDEX_TYPE):
+    products_found = gather_products(root)
+    # Products whose documents were all deleted still have a store to remove
+    if os.path.isdir(output_dir):
+        for product_name in os.listdir(output_dir):
+            if os.path.exists(os.path.join(output_dir, product_name, MANIFEST_FILE)):
+                products_found.setdefault(product_name, [])
+    for product_name, files in sorted(products_found.items()):
+        if products and product_name not in products:
+            continue
+        process_product(product_name, files, workers, batch_size, output_dir, full, chunker, index_type)
 
 # Main pipeline
 if __name__ == "__main__":
-    for root, dirs, files in os.walk(LOCAL_STORAGE):
-        for file in files:
-            if file.endswith(".txt"):
-                file_path = os.path.join(root, file)
-                process_file(file_path) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chunk, embed and index every product under local_storage/")
+    parser.add_argument("products", nargs="*", help="only process these products")
+    parser.add_argument("--input", default=LOCAL_STORAGE, help="folder with one sub-folder per product")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="where processed stores are written")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes used to read and chunk documents")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="sentence-transformers encode batch size (default: sized for the device)")
+    parser.add_argument("--chunker", choices=sorted(CHUNKERS), default=CHUNKER,
+                        help="sentence/token-aware chunks or the old fixed character windows")
+    parser.add_argument("--index-type", choices=("auto",) + vector_index.INDEX_TYPES, default=INDEX_TYPE,
+                        help="FAISS index type; auto picks one from the corpus size")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest and re-encode every document")
+    args = parser.parse_args()
+
+    run_ingestion(args.input, set(args.products), args.workers, args.batch_size, args.output, args.full,
+                  make_chunker(args.chunker), args.index_type)
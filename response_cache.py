@@ -0,0 +1,124 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Settings
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(6 * 3600)))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+
+
+class CachedResponse:
+    def __init__(self, product, embedding, chunk_ids, model, answer):
+        self.product = product
+        self.embedding = embedding
+        self.chunk_ids = frozenset(chunk_ids)
+        self.model = model
+        self.answer = answer
+        self.created = time.time()
+
+
+class SemanticResponseCache:
+    """
+    Answers keyed by query meaning rather than query text. A cached answer is
+    reused when a new query's embedding is within `threshold` cosine similarity
+    of a stored one, for the same product and model, and retrieval returned the
+    same chunks. Entries are evicted LRU and by TTL, and dropped per product
+    when that product is re-processed. Entries are bucketed by (product,
+    model, chunk ids), so a lookup only compares against answers it could reuse.
+    """
+    def __init__(self, threshold: float = RESPONSE_CACHE_THRESHOLD,
+                 max_entries: int = RESPONSE_CACHE_SIZE, ttl_seconds: float = RESPONSE_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        # (product, model, chunk ids) -> {entry id: entry}
+        self.buckets = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry) -> bool:
+        return self.ttl_seconds > 0 and time.time() - entry.created > self.ttl_seconds
+
+    @staticmethod
+    def _bucket_key(entry):
+        return entry.product, entry.model, entry.chunk_ids
+
+    def _remove(self, key):
+        """Drop one entry from both indexes (caller holds the lock)."""
+        entry = self.entries.pop(key)
+        bucket_key = self._bucket_key(entry)
+        bucket = self.buckets[bucket_key]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[bucket_key]
+
+    def lookup(self, product: str, embedding, chunk_ids, model: str):
+        """Return a cached answer for a near-duplicate query, or None."""
+        query = self._unit(embedding)
+        with self.lock:
+            best_key, best_score = None, self.threshold
+            bucket = self.buckets.get((product, model, frozenset(chunk_ids)), {})
+            for key, entry in list(bucket.items()):
+                if self._expired(entry):
+                    self._remove(key)
+                    continue
+                score = float(np.dot(query, entry.embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(best_key)
+                answer = self.entries[best_key].answer
+        if best_key is None:
+            metrics.registry.inc("response_cache_misses_total", 1, "Answers not found in the semantic response cache")
+            return None
+        metrics.registry.inc("response_cache_hits_total", 1, "Answers served from the semantic response cache")
+        return answer
+
+    def store(self, product: str, embedding, chunk_ids, model: str, answer: str):
+        entry = CachedResponse(product, self._unit(embedding), chunk_ids, model, answer)
+        with self.lock:
+            key = self.next_id
+            self.next_id += 1
+            self.entries[key] = entry
+            self.buckets.setdefault(self._bucket_key(entry), {})[key] = entry
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, product: str):
+        """Forget every answer for a product, e.g. after process_pipeline rebuilt it."""
+        with self.lock:
+            stale = [key for bucket_key, bucket in self.buckets.items() if bucket_key[0] == product for key in bucket]
+            for key in stale:
+                self._remove(key)
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached responses for product {product}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
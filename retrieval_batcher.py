@@ -0,0 +1,113 @@
+import os
+import asyncio
+import logging
+import weakref
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Settings
+# How long the first query of a batch waits for company before the batch is run.
+# 0 never waits; batches then only form from queries queued while one is in flight.
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "3"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+
+
+class RetrievalBatcher:
+    """
+    Coalesces retrievals that arrive within a few milliseconds of each other
+    into one embedding call and one FAISS search per product.
+
+    `retrieve_many(queries, product)` does the work for one product;
+    `encode_many(queries)`, if given, embeds every query of a batch in a single
+    model call first so the per-product calls only hit the embedding cache.
+    While a batch runs in its worker thread the next one is already filling up,
+    so under load batches grow on their own and the window is rarely waited out.
+    """
+    def __init__(self, retrieve_many, encode_many=None,
+                 window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE):
+        self.retrieve_many = retrieve_many
+        self.encode_many = encode_many
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        # One queue and worker per event loop, like the OpenRouter client
+        self.queues = weakref.WeakKeyDictionary()
+        self.workers = weakref.WeakKeyDictionary()
+        self.batches = 0
+        self.batched_queries = 0
+
+    def _queue(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        queue = self.queues.get(loop)
+        if queue is None:
+            queue = self.queues[loop] = asyncio.Queue()
+        worker = self.workers.get(loop)
+        if worker is None or worker.done():
+            self.workers[loop] = loop.create_task(self._run(queue))
+        return queue
+
+    async def submit(self, query: str, product: str):
+        """Return retrieve()'s (embedding, chunk ids, chunks) for one query."""
+        queue = self._queue()
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((query, product, future))
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue) -> list:
+        batch = [await queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            # Drain whatever is already queued before waiting on the clock
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            batch = await self._collect(queue)
+            try:
+                results = await asyncio.to_thread(self._process, [(q, p) for q, p, _ in batch])
+            except Exception as e:
+                logger.error(f"Batched retrieval failed: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _process(self, items: list) -> list:
+        self.batches += 1
+        self.batched_queries += len(items)
+        metrics.registry.observe("retrieval_batch_size", len(items), "Queries per retrieval batch",
+                                 buckets=metrics.COUNT_BUCKETS)
+        if self.encode_many is not None:
+            with metrics.span("embed_batch"):
+                self.encode_many([query for query, _ in items])
+        by_product = {}
+        for position, (query, product) in enumerate(items):
+            by_product.setdefault(product, []).append(position)
+        results = [None] * len(items)
+        for product, positions in by_product.items():
+            found = self.retrieve_many([items[i][0] for i in positions], product)
+            for i, result in zip(positions, found):
+                results[i] = result
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "queries": self.batched_queries,
+            "mean_batch_size": self.batched_queries / self.batches if self.batches else 0.0,
+        }
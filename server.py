@@ -0,0 +1,104 @@
+"""
+HTTP front-end for concurrent users.
+
+    uvicorn server:app --host 0.0.0.0 --port 8000
+    python server.py
+
+POST /chat         {"message": "...", "product": "Ibrahim", "session_id": "..."} -> {"response": "..."}
+POST /chat/stream  same body, streams the answer as plain-text deltas
+GET  /metrics      Prometheus text format
+GET  /health       loaded products, batching and cache stats
+
+Concurrent requests share one event loop, one pooled OpenRouter client and a
+RetrievalBatcher, so queries that arrive together are embedded and searched
+together instead of one model call per request.
+"""
+import os
+import logging
+from typing import Optional
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+import metrics
+import Chatbot
+from retrieval_batcher import RetrievalBatcher
+
+logger = logging.getLogger(__name__)
+
+# Settings
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+
+
+class ChatRequest(BaseModel):
+    message: str
+    # "*" searches every product, see Chatbot.ALL_PRODUCTS
+    product: str = Chatbot.DEFAULT_PRODUCT
+    # Optional; requests with the same id share conversation memory
+    session_id: Optional[str] = None
+
+
+class ChatResponse(BaseModel):
+    response: str
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    engine = Chatbot.get_engine()
+    engine.warm_up()
+    manager = engine.manager
+    manager.retrieval_batcher = RetrievalBatcher(manager.retrieve_many, engine.query_embedding_cache.encode_many)
+    try:
+        yield
+    finally:
+        manager.retrieval_batcher = None
+        await manager.llm_client.aclose()
+
+
+app = FastAPI(title="Product chatbot", lifespan=lifespan)
+
+
+def _check_product(product: str):
+    if product != Chatbot.ALL_PRODUCTS and product not in Chatbot.get_engine().manager.product_data:
+        raise HTTPException(status_code=404, detail=f"Unknown product: {product}")
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    _check_product(request.product)
+    return ChatResponse(response=await Chatbot.achatbot(request.message, request.product, request.session_id))
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    _check_product(request.product)
+    return StreamingResponse(Chatbot.achatbot_stream(request.message, request.product, request.session_id),
+                             media_type="text/plain; charset=utf-8")
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    engine = Chatbot.get_engine()
+    manager = engine.manager
+    batcher = manager.retrieval_batcher
+    return {
+        "products": manager.product_data.names(),
+        "sessions": len(manager.sessions),
+        "batching": batcher.stats() if batcher is not None else None,
+        "query_cache": engine.query_embedding_cache.stats(),
+        "response_cache": manager.response_cache.stats(),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
@@ -0,0 +1,144 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+
+from chunking import WhitespaceTokenCounter
+
+# Settings
+# Recent turns kept verbatim per session; older turns are folded into the summary
+SESSION_WINDOW_TOKENS = int(os.getenv("SESSION_WINDOW_TOKENS", "600"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "200"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(30 * 60)))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+# Words of earlier questions added to a follow-up question before retrieval
+REFORMULATE_WORDS = 40
+
+# Follow-ups that lean on earlier turns ("what about his projects?", "tell me more")
+FOLLOW_UP = re.compile(
+    r"\b(it|its|he|him|his|she|her|they|them|their|that|this|those|these|there|also|more|else|same)\b",
+    re.IGNORECASE,
+)
+FIRST_SENTENCE = re.compile(r"^(.+?[.!?])(\s|$)", re.DOTALL)
+
+# Cheap estimate; exact counts don't matter for a memory cap
+_counter = WhitespaceTokenCounter()
+
+
+def count_tokens(text: str) -> int:
+    return _counter.count_many([text])[0]
+
+
+class ConversationSession:
+    """
+    One conversation: the latest turns verbatim within `window_tokens`, plus a
+    rolling extractive summary of older turns within `summary_tokens`. Both
+    caps are hard, so a session's memory is bounded however long it runs.
+    """
+    def __init__(self, window_tokens: int = SESSION_WINDOW_TOKENS, summary_tokens: int = SESSION_SUMMARY_TOKENS):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.turns = deque()
+        self.turn_tokens = 0
+        self.summary = deque()
+        self.summary_used = 0
+        self.lock = threading.Lock()
+
+    def add(self, role: str, text: str):
+        words = text.split()
+        if count_tokens(text) > self.window_tokens:
+            # A single turn may not take over the whole window
+            text = " ".join(words[:int(self.window_tokens / 1.3)]) + " ..."
+        tokens = count_tokens(text)
+        with self.lock:
+            self.turns.append((role, text, tokens))
+            self.turn_tokens += tokens
+            while self.turn_tokens > self.window_tokens and len(self.turns) > 1:
+                old_role, old_text, old_tokens = self.turns.popleft()
+                self.turn_tokens -= old_tokens
+                self._summarize(old_role, old_text)
+
+    def _summarize(self, role, text):
+        """Keep the gist of an evicted turn: the question whole, the answer's first sentence."""
+        if role == "assistant":
+            match = FIRST_SENTENCE.match(text.strip())
+            text = match.group(1) if match else text
+        line = f"{'User asked' if role == 'user' else 'Assistant said'}: {' '.join(text.split()[:40])}"
+        tokens = count_tokens(line)
+        self.summary.append((line, tokens))
+        self.summary_used += tokens
+        while self.summary_used > self.summary_tokens and len(self.summary) > 1:
+            _, dropped = self.summary.popleft()
+            self.summary_used -= dropped
+
+    def history(self) -> str:
+        """The conversation so far, for the prompt."""
+        with self.lock:
+            lines = []
+            if self.summary:
+                lines.append("Earlier: " + " ".join(line for line, _ in self.summary))
+            lines.extend(f"{'User' if role == 'user' else 'Assistant'}: {text}" for role, text, _ in self.turns)
+            return "\n".join(lines)
+
+    def reformulate(self, query: str) -> str:
+        """
+        Retrieval query for a follow-up: the question plus the most recent user
+        questions, so "what about his projects?" still finds the right chunks.
+        Standalone questions are returned unchanged.
+        """
+        with self.lock:
+            previous = [text for role, text, _ in reversed(self.turns) if role == "user"]
+        if not previous or not (FOLLOW_UP.search(query) or len(query.split()) <= 3):
+            return query
+        words = []
+        for text in previous:
+            words = text.split() + words
+            if len(words) >= REFORMULATE_WORDS:
+                break
+        return " ".join(words[-REFORMULATE_WORDS:] + [query])
+
+    def __len__(self):
+        return len(self.turns)
+
+
+class SessionStore:
+    """
+    Sessions by id, in least-recently-used order. Idle sessions expire after
+    `ttl_seconds` and the oldest are dropped beyond `max_sessions`; both are
+    checked from the LRU end on every access, so cleanup is amortized O(1)
+    and needs no background thread.
+    """
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_sessions: int = MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expire(self, now):
+        while self.sessions:
+            session_id, (session, last_used) = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and now - last_used <= self.ttl_seconds:
+                break
+            del self.sessions[session_id]
+
+    def get(self, session_id: str) -> ConversationSession:
+        """The session for an id, created on first use."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.sessions.pop(session_id, None)
+            if entry is not None and now - entry[1] > self.ttl_seconds:
+                entry = None
+            session = entry[0] if entry is not None else ConversationSession()
+            self.sessions[session_id] = (session, now)
+            self._expire(now)
+            return session
+
+    def drop(self, session_id: str):
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self.lock:
+            self._expire(time.monotonic())
+            return len(self.sessions)
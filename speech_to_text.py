@@ -0,0 +1,183 @@
+"""
+Speech-to-text backends for the voice loop.
+
+Every backend hands out a TranscriptionStream per utterance: feed() it 16 kHz
+mono int16 PCM while the user is still speaking and it may return a partial
+transcript; finish() returns the final one. Select a backend with STT_BACKEND:
+
+    faster-whisper  local Whisper (pip install faster-whisper), re-decodes the
+                    utterance so far every PARTIAL_INTERVAL_SECONDS of audio
+    vosk            local Kaldi models (pip install vosk), natively streaming
+    google          the old speech_recognition web API; final results only
+    fake            scripted transcripts, for tests and benchmarks
+"""
+import os
+import json
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Settings
+STT_BACKEND = os.getenv("STT_BACKEND", "faster-whisper")
+SAMPLE_RATE = 16000
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base.en")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk")
+# Audio between two partial decodes; Whisper re-reads the whole utterance each time
+PARTIAL_INTERVAL_SECONDS = float(os.getenv("STT_PARTIAL_INTERVAL", "0.5"))
+# Whisper's window; longer utterances only get a final decode
+MAX_PARTIAL_SECONDS = 30.0
+
+
+def pcm_to_float(pcm) -> np.ndarray:
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+class TranscriptionStream:
+    """One utterance being transcribed."""
+    def feed(self, pcm) -> str:
+        """Add audio; returns a new partial transcript, or None if there is nothing new."""
+        return None
+
+    def finish(self) -> str:
+        raise NotImplementedError
+
+
+class Transcriber:
+    def stream(self) -> TranscriptionStream:
+        raise NotImplementedError
+
+    def transcribe(self, pcm) -> str:
+        """Whole-clip transcription."""
+        stream = self.stream()
+        stream.feed(pcm)
+        return stream.finish()
+
+
+class _BufferedStream(TranscriptionStream):
+    """Collects the utterance and decodes all of it, now and then while it grows and once at the end."""
+    def __init__(self, decode, partial_interval: float = PARTIAL_INTERVAL_SECONDS):
+        self.decode = decode
+        self.audio = bytearray()
+        self.partial_bytes = int(partial_interval * SAMPLE_RATE) * 2
+        self.decoded_at = 0
+        self.last_partial = None
+
+    def feed(self, pcm):
+        self.audio += pcm
+        if self.partial_bytes <= 0 or len(self.audio) - self.decoded_at < self.partial_bytes:
+            return None
+        if len(self.audio) > MAX_PARTIAL_SECONDS * SAMPLE_RATE * 2:
+            return None
+        self.decoded_at = len(self.audio)
+        partial = self.decode(self.audio, final=False)
+        if partial == self.last_partial:
+            return None
+        self.last_partial = partial
+        return partial
+
+    def finish(self):
+        return self.decode(self.audio, final=True) if self.audio else ""
+
+
+class WhisperTranscriber(Transcriber):
+    def __init__(self, model_name: str = WHISPER_MODEL, device: str = WHISPER_DEVICE,
+                 compute_type: str = WHISPER_COMPUTE_TYPE):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_name, device=device, compute_type=compute_type)
+
+    def _decode(self, pcm, final: bool) -> str:
+        # Greedy decoding for partials; they are redone anyway
+        segments, _ = self.model.transcribe(
+            pcm_to_float(pcm), language="en", beam_size=5 if final else 1,
+            condition_on_previous_text=False, vad_filter=False,
+        )
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def stream(self):
+        return _BufferedStream(self._decode)
+
+
+class _VoskStream(TranscriptionStream):
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.committed = []
+
+    def feed(self, pcm):
+        if self.recognizer.AcceptWaveform(bytes(pcm)):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            if text:
+                self.committed.append(text)
+            return " ".join(self.committed) or None
+        partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return " ".join(self.committed + [partial]).strip() or None
+
+    def finish(self):
+        text = json.loads(self.recognizer.FinalResult()).get("text", "")
+        return " ".join(self.committed + [text]).strip()
+
+
+class VoskTranscriber(Transcriber):
+    def __init__(self, model_path: str = VOSK_MODEL_PATH):
+        import vosk
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def stream(self):
+        return _VoskStream(self.vosk.KaldiRecognizer(self.model, SAMPLE_RATE))
+
+
+class GoogleTranscriber(Transcriber):
+    """speech_recognition's free web API: needs network access and has no partials."""
+    def __init__(self):
+        import speech_recognition as sr
+        self.sr = sr
+        self.recognizer = sr.Recognizer()
+
+    def _decode(self, pcm, final: bool) -> str:
+        try:
+            return self.recognizer.recognize_google(self.sr.AudioData(bytes(pcm), SAMPLE_RATE, 2))
+        except self.sr.UnknownValueError:
+            return ""
+
+    def stream(self):
+        return _BufferedStream(self._decode, partial_interval=0)
+
+
+class FakeTranscriber(Transcriber):
+    """
+    Reveals a scripted transcript at `words_per_second` of fed audio, so
+    partials grow like a real recognizer's. Transcripts are used in turn.
+    """
+    def __init__(self, transcripts, words_per_second: float = 2.5):
+        self.transcripts = [transcripts] if isinstance(transcripts, str) else list(transcripts)
+        self.words_per_second = words_per_second
+        self.utterances = 0
+
+    def stream(self):
+        text = self.transcripts[self.utterances % len(self.transcripts)]
+        self.utterances += 1
+        return _BufferedStream(lambda pcm, final: self._reveal(text, len(pcm), final))
+
+    def _reveal(self, text, n_bytes, final):
+        if final:
+            return text
+        words = text.split()
+        return " ".join(words[:int(n_bytes / 2 / SAMPLE_RATE * self.words_per_second)])
+
+
+BACKENDS = {
+    "faster-whisper": WhisperTranscriber,
+    "vosk": VoskTranscriber,
+    "google": GoogleTranscriber,
+}
+
+
+def create_transcriber(backend: str = STT_BACKEND, **kwargs) -> Transcriber:
+    if backend == "fake":
+        return FakeTranscriber(kwargs.pop("transcripts", ""), **kwargs)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown STT backend: {backend} (choose from {', '.join(BACKENDS)} or fake)")
+    return BACKENDS[backend](**kwargs)
@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+import chunk_store
+
+
+def test_append_store_keeps_survivors_and_appends(tmp_path):
+    out_dir = str(tmp_path)
+    rng = np.random.default_rng(0)
+    texts = [f"chunk {i} " + "é" * i for i in range(10)]
+    embeddings = rng.standard_normal((10, 8)).astype(np.float32)
+    chunk_store.write_store(out_dir, texts, embeddings, ids=np.arange(0, 20, 2))
+
+    keep = np.ones(10, dtype=bool)
+    keep[[0, 4, 5, 9]] = False
+    new_texts = ["new a", "new b"]
+    new_embeddings = rng.standard_normal((2, 8)).astype(np.float32)
+    chunk_store.append_store(out_dir, keep, new_texts, new_embeddings, np.array([20, 21]))
+
+    chunks = chunk_store.load_chunks(out_dir)
+    stored = chunk_store.load_embeddings(out_dir)
+    assert list(chunks) == [text for text, kept in zip(texts, keep) if kept] + new_texts
+    assert chunks.ids.tolist() == [2, 4, 6, 12, 14, 16, 20, 21]
+    assert np.array_equal(stored, np.concatenate([embeddings[keep], new_embeddings]))
+    assert chunks.by_id(14) == texts[7]
+    assert chunk_store.read_store_meta(out_dir)["count"] == 8
+    assert np.allclose(chunk_store.load_centroid(out_dir), chunk_store.centroid(stored))
+
+
+def test_store_appender_spools_batches(tmp_path):
+    out_dir = str(tmp_path / "product")
+    rng = np.random.default_rng(1)
+    batches = [([f"batch {b} chunk {i}" for i in range(3)], rng.standard_normal((3, 4)).astype(np.float32))
+               for b in range(3)]
+    with chunk_store.StoreAppender(out_dir) as appender:
+        for b, (texts, embeddings) in enumerate(batches):
+            appender.append(texts, embeddings, range(b * 3, b * 3 + 3))
+        assert list(appender.texts())[-1] == "batch 2 chunk 2"
+        appender.commit()
+
+    chunks = chunk_store.load_chunks(out_dir)
+    assert list(chunks) == [text for texts, _ in batches for text in texts]
+    assert chunks.ids.tolist() == list(range(9))
+    assert np.array_equal(chunk_store.load_embeddings(out_dir), np.concatenate([e for _, e in batches]))
+    assert not [name for name in os.listdir(out_dir) if name.endswith(".spool")]
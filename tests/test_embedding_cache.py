@@ -0,0 +1,85 @@
+import numpy as np
+
+from embedding_cache import QueryEmbeddingCache, normalize_query
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([np.full(4, len(text), dtype=np.float32) for text in texts])
+
+
+def test_normalized_queries_share_an_entry():
+    model = CountingModel()
+    cache = QueryEmbeddingCache(model, "m")
+    first = cache.encode("How  do I reset?")
+    second = cache.encode(" how do i RESET? ")
+    assert second is first
+    assert model.calls == [["how do i reset?"]]
+    assert not first.flags.writeable
+    assert normalize_query("  A\tB ") == "a b"
+
+
+def test_encode_many_encodes_misses_once():
+    model = CountingModel()
+    cache = QueryEmbeddingCache(model, "m")
+    cache.encode("cached")
+    vectors = cache.encode_many(["cached", "new", "NEW", "other"])
+    assert model.calls[1] == ["new", "other"]
+    assert vectors[1] is vectors[2]
+    assert cache.stats()["hits"] == 1
+
+
+def test_lru_bound_and_ttl():
+    model = CountingModel()
+    cache = QueryEmbeddingCache(model, "m", max_entries=2, ttl_seconds=10)
+    for query in ("a", "b", "c"):
+        cache.encode(query)
+    assert list(cache.entries) == [("m", "b"), ("m", "c")]
+    vector, created = cache.entries[("m", "c")]
+    cache.entries[("m", "c")] = (vector, created - 11)
+    cache.encode("c")
+    assert model.calls[-1] == ["c"]
+
+
+def test_model_is_loaded_on_first_miss():
+    loaded = []
+
+    def loader():
+        loaded.append(True)
+        return CountingModel()
+
+    cache = QueryEmbeddingCache(None, "m", loader=loader)
+    assert not loaded
+    cache.encode("q")
+    cache.encode("q")
+    assert loaded == [True]
+
+
+def test_sqlite_tier_is_shared_and_keyed_by_model(tmp_path):
+    db_path = str(tmp_path / "queries.db")
+    writer_model = CountingModel()
+    QueryEmbeddingCache(writer_model, "m", db_path=db_path).encode("shared query")
+
+    reader_model = CountingModel()
+    reader = QueryEmbeddingCache(reader_model, "m", db_path=db_path)
+    assert np.array_equal(reader.encode("Shared query"), writer_model.encode(["shared query"])[0])
+    assert reader_model.calls == []
+    assert reader.stats()["disk_hits"] == 1
+
+    other_model = CountingModel()
+    QueryEmbeddingCache(other_model, "other", db_path=db_path).encode("shared query")
+    assert other_model.calls == [["shared query"]]
+
+
+def test_expired_sqlite_rows_are_ignored(tmp_path):
+    db_path = str(tmp_path / "queries.db")
+    QueryEmbeddingCache(CountingModel(), "m", db_path=db_path).encode("q")
+    model = CountingModel()
+    cache = QueryEmbeddingCache(model, "m", db_path=db_path, ttl_seconds=10)
+    cache.db.execute("UPDATE query_embeddings SET created = created - 11")
+    cache.encode("q")
+    assert model.calls == [["q"]]
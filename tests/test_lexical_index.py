@@ -0,0 +1,40 @@
+import numpy as np
+
+import lexical_index
+
+
+def corpus(n, seed, extra=()):
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" for i in range(200)] + list(extra)
+    return [" ".join(rng.choice(words, rng.integers(5, 50))) for _ in range(n)]
+
+
+def test_update_matches_a_full_build():
+    old = corpus(300, 0)
+    keep = np.random.default_rng(1).random(len(old)) > 0.3
+    new = corpus(30, 2, extra=("fresh",))
+    updated = lexical_index.update(lexical_index.build(old), keep, new)
+    rebuilt = lexical_index.build([text for text, kept in zip(old, keep) if kept] + new)
+    assert updated.n_docs == rebuilt.n_docs
+    assert set(updated.vocab) == set(rebuilt.vocab)
+    for query in ("w1 w2 w3", "fresh w10", "w199"):
+        positions, scores = updated.search(query, 10)
+        expected_positions, expected_scores = rebuilt.search(query, 10)
+        assert np.array_equal(positions, expected_positions)
+        assert np.allclose(scores, expected_scores)
+
+
+def test_update_drops_terms_of_removed_chunks():
+    index = lexical_index.build(["alpha beta", "gamma"])
+    updated = lexical_index.update(index, np.array([False, True]), ["delta"])
+    assert "alpha" not in updated.vocab
+    assert updated.search("gamma", 5)[0].tolist() == [0]
+    assert updated.search("delta", 5)[0].tolist() == [1]
+
+
+def test_saved_index_round_trips_term_frequencies(tmp_path):
+    index = lexical_index.build(corpus(20, 3))
+    lexical_index.save(str(tmp_path), index)
+    loaded = lexical_index.load(str(tmp_path), 20)
+    assert np.array_equal(loaded.tfs, index.tfs)
+    assert lexical_index.update(loaded, np.ones(20, dtype=bool), []) is not None
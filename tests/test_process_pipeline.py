@@ -0,0 +1,59 @@
+import tracemalloc
+
+import pytest
+
+import chunking
+import process_pipeline
+from chunking import CharChunker, SentenceChunker, WhitespaceTokenCounter
+
+SENTENCE = "The quick brown fox jumps over the lazy dog near the river bank. "
+MB = 1024 * 1024
+FILE_MB = 4
+
+
+@pytest.fixture
+def big_file(tmp_path, monkeypatch):
+    # Smaller read blocks keep the test quick while the file stays many blocks long
+    monkeypatch.setattr(chunking, "READ_BLOCK_CHARS", 64 * 1024)
+    path = tmp_path / "big.txt"
+    with open(path, "w") as f:
+        for _ in range(FILE_MB):
+            f.write(SENTENCE * (MB // len(SENTENCE)))
+    return str(path)
+
+
+def consume(files, workers, chunker):
+    """Chunk count, last chunk and peak traced memory while reading `files`."""
+    count, last = 0, None
+    tracemalloc.start()
+    try:
+        for _, chunks in process_pipeline.read_documents(files, workers, chunker):
+            for chunk in chunks:
+                count += 1
+                last = chunk
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return count, last, peak
+
+
+@pytest.mark.parametrize("chunker", [CharChunker(), SentenceChunker(counter=WhitespaceTokenCounter())],
+                         ids=["chars", "sentences"])
+def test_large_file_is_chunked_in_bounded_memory(big_file, chunker):
+    count, last, peak = consume([big_file], 1, chunker)
+    assert count > 400
+    assert last.end >= FILE_MB * (MB // len(SENTENCE)) * len(SENTENCE) - 1
+    # Only a read block and the chunks in flight should be alive, not the file
+    assert peak < FILE_MB * MB / 4
+
+
+def test_workers_return_chunks_through_spool_files(big_file, tmp_path):
+    small = tmp_path / "small.txt"
+    small.write_text(SENTENCE * 100)
+    files = [big_file, str(small)]
+    chunker = CharChunker()
+    expected = {path: list(chunks) for path, chunks in process_pipeline.read_documents(files, 1, chunker)}
+    got = {path: list(chunks) for path, chunks in process_pipeline.read_documents(files, 2, chunker)}
+    assert got == expected
+    _, _, peak = consume(files, 2, chunker)
+    assert peak < FILE_MB * MB / 4
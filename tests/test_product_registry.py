@@ -0,0 +1,84 @@
+import os
+import shutil
+import time
+
+import numpy as np
+import pytest
+
+import chunk_store
+import vector_index
+from Chatbot import ProductRegistry
+
+
+def write_product(root, name, n_chunks=4, seed=0):
+    out_dir = os.path.join(root, name)
+    rng = np.random.default_rng(seed)
+    embeddings = rng.standard_normal((n_chunks, 8)).astype(np.float32)
+    ids = np.arange(n_chunks, dtype=np.int64)
+    index, params = vector_index.build_index(embeddings, ids, "flat-ip")
+    chunk_store.write_store(out_dir, [f"{name} chunk {i}" for i in range(n_chunks)], embeddings, index,
+                            ids=ids, index_params=params)
+    return out_dir
+
+
+@pytest.fixture
+def root(tmp_path):
+    for i, name in enumerate("ABC"):
+        write_product(str(tmp_path), name, seed=i)
+    return str(tmp_path)
+
+
+def test_products_load_on_first_get(root):
+    registry = ProductRegistry(data_root=root)
+    assert sorted(registry.names()) == ["A", "B", "C"]
+    assert not registry.resident
+    assert registry.get("A").chunks.by_id(1) == "A chunk 1"
+    assert list(registry.resident) == ["A"]
+    assert registry.get("missing") is None
+
+
+def test_evicts_least_recently_used_by_count(root):
+    registry = ProductRegistry(max_products=2, data_root=root)
+    registry.get("A")
+    registry.get("B")
+    registry.get("A")
+    registry.get("C")
+    assert list(registry.resident) == ["A", "C"]
+
+
+def test_evicts_by_bytes_but_keeps_the_newest(root):
+    registry = ProductRegistry(max_bytes=1, data_root=root)
+    registry.get("A")
+    registry.get("B")
+    assert list(registry.resident) == ["B"]
+    assert registry.resident_bytes == registry.meta["B"].size_bytes
+
+
+def test_rebuilt_product_is_reloaded(root):
+    registry = ProductRegistry(data_root=root)
+    assert len(registry.get("A").chunks) == 4
+    time.sleep(0.01)
+    write_product(root, "A", n_chunks=6)
+    assert len(registry.get("A").chunks) == 6
+
+
+def test_products_built_or_deleted_later_are_noticed(root):
+    registry = ProductRegistry(data_root=root, rescan_seconds=0)
+    invalidated = []
+    registry.add_invalidation_listener(invalidated.append)
+    write_product(root, "D", seed=3)
+    assert "D" in registry
+    assert registry.get("D") is not None
+    assert "D" in registry.route(np.ones(8, dtype=np.float32), max_products=4, margin=10)
+    shutil.rmtree(os.path.join(root, "B"))
+    registry.refresh()
+    assert "B" not in registry.names()
+    assert invalidated == ["D", "B"]
+
+
+def test_rescan_is_rate_limited(root):
+    registry = ProductRegistry(data_root=root, rescan_seconds=3600)
+    write_product(root, "D")
+    assert "D" not in registry
+    registry.refresh(force=True)
+    assert "D" in registry
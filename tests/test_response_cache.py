@@ -0,0 +1,59 @@
+import numpy as np
+
+import metrics
+from response_cache import SemanticResponseCache
+
+
+def counter(name):
+    return metrics.registry.counters.get((name, ()), 0)
+
+
+def vector(seed):
+    return np.random.default_rng(seed).standard_normal(16).astype(np.float32)
+
+
+def test_near_duplicate_hits_and_counts():
+    cache = SemanticResponseCache(threshold=0.95)
+    query = vector(0)
+    cache.store("A", query, [1, 2], "m", "answer")
+    hits, misses = counter("response_cache_hits_total"), counter("response_cache_misses_total")
+    assert cache.lookup("A", query + 0.01, [2, 1], "m") == "answer"
+    assert cache.lookup("A", vector(1), [1, 2], "m") is None
+    assert counter("response_cache_hits_total") == hits + 1
+    assert counter("response_cache_misses_total") == misses + 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_other_product_model_or_chunks_miss():
+    cache = SemanticResponseCache()
+    query = vector(0)
+    cache.store("A", query, [1, 2], "m", "answer")
+    assert cache.lookup("B", query, [1, 2], "m") is None
+    assert cache.lookup("A", query, [1, 2], "other") is None
+    assert cache.lookup("A", query, [1, 3], "m") is None
+
+
+def test_lru_eviction_keeps_buckets_in_step():
+    cache = SemanticResponseCache(max_entries=2)
+    for i in range(3):
+        cache.store("A", vector(i), [i], "m", f"answer {i}")
+    assert cache.lookup("A", vector(0), [0], "m") is None
+    assert cache.lookup("A", vector(2), [2], "m") == "answer 2"
+    assert len(cache.buckets) == 2
+
+
+def test_expired_entries_are_dropped():
+    cache = SemanticResponseCache(ttl_seconds=10)
+    cache.store("A", vector(0), [1], "m", "answer")
+    next(iter(cache.entries.values())).created -= 11
+    assert cache.lookup("A", vector(0), [1], "m") is None
+    assert cache.stats()["entries"] == 0 and not cache.buckets
+
+
+def test_invalidate_product():
+    cache = SemanticResponseCache()
+    cache.store("A", vector(0), [1], "m", "a")
+    cache.store("B", vector(0), [1], "m", "b")
+    cache.invalidate("A")
+    assert cache.lookup("A", vector(0), [1], "m") is None
+    assert cache.lookup("B", vector(0), [1], "m") == "b"
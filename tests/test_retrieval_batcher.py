@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import metrics
+from retrieval_batcher import RetrievalBatcher
+
+
+class Recorder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.encoded = []
+        self.lock = threading.Lock()
+
+    def retrieve_many(self, queries, product):
+        with self.lock:
+            self.calls.append((product, list(queries)))
+        if self.delay:
+            threading.Event().wait(self.delay)
+        return [(query, product) for query in queries]
+
+    def encode_many(self, queries):
+        self.encoded.append(list(queries))
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_queries_share_one_batch():
+    recorder = Recorder()
+    batcher = RetrievalBatcher(recorder.retrieve_many, recorder.encode_many, window_ms=50)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(f"q{i}", "A" if i % 2 else "B") for i in range(6)))
+
+    results = run(main())
+    assert results == [(f"q{i}", "A" if i % 2 else "B") for i in range(6)]
+    assert recorder.encoded == [[f"q{i}" for i in range(6)]]
+    assert sorted(recorder.calls) == [("A", ["q1", "q3", "q5"]), ("B", ["q0", "q2", "q4"])]
+    assert batcher.stats() == {"batches": 1, "queries": 6, "mean_batch_size": 6.0}
+
+
+def test_batches_are_capped():
+    recorder = Recorder()
+    batcher = RetrievalBatcher(recorder.retrieve_many, window_ms=50, max_batch=4)
+
+    async def main():
+        await asyncio.gather(*(batcher.submit(f"q{i}", "A") for i in range(10)))
+
+    run(main())
+    assert [len(queries) for _, queries in recorder.calls] == [4, 4, 2]
+
+
+def test_queries_queued_during_a_batch_form_the_next_one():
+    recorder = Recorder(delay=0.05)
+    batcher = RetrievalBatcher(recorder.retrieve_many, window_ms=0)
+
+    async def main():
+        first = asyncio.ensure_future(batcher.submit("first", "A"))
+        await asyncio.sleep(0.01)
+        rest = [batcher.submit(f"q{i}", "A") for i in range(3)]
+        await asyncio.gather(first, *rest)
+
+    run(main())
+    assert [queries for _, queries in recorder.calls] == [["first"], ["q0", "q1", "q2"]]
+
+
+def test_errors_reach_every_caller():
+    def fail(queries, product):
+        raise RuntimeError("index unavailable")
+
+    batcher = RetrievalBatcher(fail, window_ms=20)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(f"q{i}", "A") for i in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in run(main()))
+
+
+def test_batch_sizes_use_count_buckets():
+    batcher = RetrievalBatcher(Recorder().retrieve_many, window_ms=50)
+
+    async def main():
+        await asyncio.gather(*(batcher.submit(f"q{i}", "A") for i in range(3)))
+
+    run(main())
+    histogram = metrics.registry.histograms[("retrieval_batch_size", ())]
+    assert histogram.buckets == metrics.COUNT_BUCKETS
+    # 3 queries land in the le=4 bucket
+    assert histogram.counts[metrics.COUNT_BUCKETS.index(4)] >= 1
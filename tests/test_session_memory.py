@@ -0,0 +1,95 @@
+import session_memory
+from session_memory import ConversationSession, SessionStore, count_tokens
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_window_and_summary_stay_within_their_caps():
+    session = ConversationSession(window_tokens=50, summary_tokens=30)
+    for i in range(100):
+        session.add("user", f"question number {i} about the projects")
+        session.add("assistant", f"Answer {i} first sentence. More detail that the summary drops.")
+        assert session.turn_tokens <= 50
+        assert session.summary_used <= 30
+    assert session.turn_tokens == sum(tokens for _, _, tokens in session.turns)
+    history = session.history()
+    assert history.startswith("Earlier: ")
+    assert "question number 99" in history
+    assert "question number 0 " not in history
+
+
+def test_evicted_answers_keep_their_first_sentence():
+    session = ConversationSession(window_tokens=20, summary_tokens=100)
+    session.add("assistant", "He built a compiler. It took two years and many rewrites.")
+    session.add("user", "one two three four five six seven eight nine ten")
+    assert [line for line, _ in session.summary] == ["Assistant said: He built a compiler."]
+
+
+def test_oversized_turn_is_truncated():
+    session = ConversationSession(window_tokens=40, summary_tokens=20)
+    session.add("user", "word " * 500)
+    (_, text, tokens), = session.turns
+    assert text.endswith("...")
+    assert tokens <= 40 + count_tokens("...")
+
+
+def test_follow_up_is_reformulated_with_earlier_questions():
+    session = ConversationSession()
+    session.add("user", "Where did Ibrahim study?")
+    session.add("assistant", "He studied in Cairo.")
+    assert session.reformulate("What about his projects?") == "Where did Ibrahim study? What about his projects?"
+    # Short questions lean on context too
+    assert session.reformulate("Any awards?") == "Where did Ibrahim study? Any awards?"
+
+
+def test_standalone_question_is_unchanged():
+    session = ConversationSession()
+    assert session.reformulate("What about his projects?") == "What about his projects?"
+    session.add("user", "Where did Ibrahim study?")
+    query = "Which programming languages does Ibrahim know best?"
+    assert session.reformulate(query) == query
+
+
+def test_reformulation_is_capped():
+    session = ConversationSession(window_tokens=10000)
+    for i in range(20):
+        session.add("user", " ".join(f"w{i}_{j}" for j in range(10)))
+    words = session.reformulate("tell me more").split()
+    assert len(words) == session_memory.REFORMULATE_WORDS + 3
+    # The most recent question comes last, right before the follow-up
+    assert words[-4] == "w19_9"
+
+
+def test_store_returns_the_same_session_until_it_expires(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_memory.time, "monotonic", clock)
+    store = SessionStore(ttl_seconds=60, max_sessions=10)
+    first = store.get("a")
+    clock.now += 30
+    assert store.get("a") is first
+    clock.now += 61
+    assert store.get("a") is not first
+
+
+def test_store_expires_idle_sessions_and_caps_the_count(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_memory.time, "monotonic", clock)
+    store = SessionStore(ttl_seconds=60, max_sessions=3)
+    for name in "abcd":
+        store.get(name)
+        clock.now += 1
+    # Least recently used goes first
+    assert list(store.sessions) == ["b", "c", "d"]
+    store.get("b")
+    clock.now += 59.5
+    # c and d are idle past the TTL; b was touched more recently
+    assert len(store) == 1
+    assert list(store.sessions) == ["b"]
+    store.drop("b")
+    assert len(store) == 0
@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmark import HEAVY_MODULES, IMPORT_BUDGET_S
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = """
+import sys, time, json
+started = time.perf_counter()
+import Chatbot
+print(json.dumps({"import_s": time.perf_counter() - started,
+                  "heavy": [name for name in %r if name in sys.modules]}))
+"""
+
+
+def import_chatbot():
+    out = subprocess.run([sys.executable, "-c", SCRIPT % (HEAVY_MODULES,)],
+                         capture_output=True, text=True, cwd=ROOT, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_import_chatbot_is_cheap():
+    # The first run may compile bytecode; judge the best of three
+    runs = [import_chatbot() for _ in range(3)]
+    for run in runs:
+        assert run["heavy"] == [], f"imported at startup: {run['heavy']}"
+    assert min(run["import_s"] for run in runs) <= IMPORT_BUDGET_S
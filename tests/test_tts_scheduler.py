@@ -0,0 +1,91 @@
+import threading
+import time
+
+from tts_scheduler import FakeBackend, PhraseCache, TTSScheduler, split_sentences
+
+
+def make_scheduler(**kwargs):
+    backend = FakeBackend(synth_seconds_per_char=0.0005, play_seconds_per_char=0.002)
+    return backend, TTSScheduler(backend, **kwargs)
+
+
+def test_split_sentences():
+    assert split_sentences("Hi there.  How are you? Fine!") == ["Hi there.", "How are you?", "Fine!"]
+
+
+def test_plays_sentences_in_order():
+    backend, tts = make_scheduler()
+    tts.say("One. Two. Three.")
+    assert tts.wait_idle(5)
+    assert backend.played == ["One.", "Two.", "Three."]
+
+
+def test_cancel_drops_queued_and_stops_playing():
+    backend, tts = make_scheduler()
+    tts.say(" ".join(f"Sentence number {i} is long enough to take a while." for i in range(10)))
+    time.sleep(0.05)
+    tts.cancel()
+    assert tts.wait_idle(5)
+    # The sentence that was playing was stopped, not finished
+    assert backend.played == []
+    tts.say("After.")
+    assert tts.wait_idle(5)
+    assert backend.played == ["After."]
+
+
+def test_is_live_skips_stale_turns():
+    live = {"turn": 1}
+    backend, tts = make_scheduler(is_live=lambda turn: turn >= live["turn"])
+    gate = threading.Event()
+    backend_synthesize = backend.synthesize
+
+    def slow_synthesize(text):
+        gate.wait(5)
+        return backend_synthesize(text)
+
+    backend.synthesize = slow_synthesize
+    tts.say("Old one. Old two.", tag=1)
+    live["turn"] = 2
+    tts.say("New one.", tag=2)
+    gate.set()
+    assert tts.wait_idle(5)
+    assert backend.played == ["New one."]
+
+
+def test_repeated_sentence_is_synthesized_once():
+    backend, tts = make_scheduler()
+    tts.say("Hello there.")
+    assert tts.wait_idle(5)
+    tts.say("hello   THERE.")
+    assert tts.wait_idle(5)
+    assert backend.synthesized == ["Hello there."]
+    assert len(backend.played) == 2
+
+
+def test_phrase_cache_evicts_least_recently_used():
+    cache = PhraseCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_phrase_cache_keeps_pinned_phrases():
+    cache = PhraseCache(max_entries=1)
+    cache.put("Sorry, I did not catch that.", "fallback", pin=True)
+    for i in range(5):
+        cache.put(f"phrase {i}", i)
+    assert cache.get("sorry, i did not  catch that.") == "fallback"
+    assert cache.get("phrase 4") == 4
+    assert len(cache.entries) == 1
+
+
+def test_prewarm_pins_phrases():
+    backend, tts = make_scheduler(cache=PhraseCache(max_entries=1))
+    tts.prewarm(["Fallback one.", "Fallback two."])
+    tts.pool.shutdown(wait=True)
+    assert tts.cache.get("Fallback one.") == "Fallback one."
+    assert tts.cache.get("Fallback two.") == "Fallback two."
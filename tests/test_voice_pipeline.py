@@ -0,0 +1,53 @@
+import metrics
+from voice_pipeline import PartialStabilizer, VoicePipeline
+
+
+def barge_ins():
+    return metrics.registry.counters.get(("voice_barge_ins_total", ()), 0)
+
+
+def make_pipeline(playing):
+    cancelled = []
+    pipeline = VoicePipeline(transcriber=None, respond=lambda text, turn: None,
+                             on_barge_in=lambda: cancelled.append(True), barge_in=True,
+                             is_playing=lambda: playing[0])
+    return pipeline, cancelled
+
+
+def test_speech_after_the_answer_is_not_a_barge_in():
+    playing = [False]
+    pipeline, cancelled = make_pipeline(playing)
+    before = barge_ins()
+    assert pipeline.speech_started() == 1
+    assert pipeline.speech_started() == 2
+    assert cancelled == []
+    assert barge_ins() == before
+    assert pipeline.is_current(1)
+
+
+def test_speech_during_playback_interrupts():
+    playing = [True]
+    pipeline, cancelled = make_pipeline(playing)
+    pipeline.speech_started()
+    before = barge_ins()
+    turn = pipeline.speech_started()
+    assert cancelled == [True]
+    assert barge_ins() == before + 1
+    assert not pipeline.is_current(turn - 1)
+    assert pipeline.is_current(turn)
+
+
+def test_speech_while_answering_interrupts():
+    pipeline, cancelled = make_pipeline([False])
+    pipeline.speech_started()
+    pipeline.answering = True
+    pipeline.speech_started()
+    assert cancelled == [True]
+
+
+def test_partial_stabilizer_agreement():
+    stabilizer = PartialStabilizer(agreement=2)
+    assert stabilizer.update("how do") is None
+    assert stabilizer.update("how do I reset") == "how do"
+    assert stabilizer.update("how do I reset the") == "how do I reset"
+    assert stabilizer.update("how do I reset the") == "how do I reset the"
@@ -0,0 +1,201 @@
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Settings
+WHEEL_TICK_SECONDS = 1.0
+WHEEL_SLOTS = 512
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel on one daemon thread, shared by every store in the
+    process. schedule() and cancel() are O(1); each tick only looks at the
+    timers in one slot. Delays longer than a full turn wait extra rounds.
+    """
+    def __init__(self, tick: float = WHEEL_TICK_SECONDS, slots: int = WHEEL_SLOTS):
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self.position = 0
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def schedule(self, delay: float, callback) -> tuple:
+        """Run `callback()` on the wheel thread after about `delay` seconds; returns a handle for cancel()."""
+        ticks = max(1, int(-(-delay // self.tick)))
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True, name="timer-wheel")
+                self.thread.start()
+            slot = (self.position + ticks) % len(self.slots)
+            rounds = (ticks - 1) // len(self.slots)
+            self.next_id += 1
+            self.slots[slot][self.next_id] = [rounds, callback]
+            return slot, self.next_id
+
+    def cancel(self, handle: tuple):
+        slot, timer_id = handle
+        with self.lock:
+            self.slots[slot].pop(timer_id, None)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            due = []
+            with self.lock:
+                self.position = (self.position + 1) % len(self.slots)
+                slot = self.slots[self.position]
+                for timer_id, timer in list(slot.items()):
+                    if timer[0] == 0:
+                        due.append(slot.pop(timer_id)[1])
+                    else:
+                        timer[0] -= 1
+            for callback in due:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"Timer callback failed: {str(e)}")
+
+
+_shared_wheel = None
+_shared_wheel_lock = threading.Lock()
+
+
+def shared_wheel() -> TimerWheel:
+    global _shared_wheel
+    with _shared_wheel_lock:
+        if _shared_wheel is None:
+            _shared_wheel = TimerWheel()
+        return _shared_wheel
+
+
+class ExpiringLog:
+    """
+    Append-only log whose entries expire `ttl_seconds` after they were added.
+
+    Every entry has the same TTL, so insertion order is expiry order: entries
+    live in a deque (a ring when `max_entries` is set) and expiry only ever
+    pops from the left. Keys are monotonically increasing sequence numbers,
+    never reused, so an expired key can't alias a live one. Expiry runs
+    lazily on every access, plus one sweep on the shared timer wheel while
+    the log is non-empty so idle logs still let go of their memory.
+    """
+    def __init__(self, ttl_seconds: float, max_entries: int = None, wheel: TimerWheel = None,
+                 clock=time.monotonic, on_empty=None):
+        self.ttl_seconds = ttl_seconds
+        self.entries = deque(maxlen=max_entries)
+        self.next_seq = 0
+        self.clock = clock
+        self.wheel = wheel
+        self.on_empty = on_empty
+        self.sweep_handle = None
+        self.lock = threading.Lock()
+
+    def append(self, value) -> int:
+        """Add a value; returns its sequence key."""
+        with self.lock:
+            now = self.clock()
+            self._expire(now)
+            seq = self.next_seq
+            self.next_seq += 1
+            self.entries.append((seq, now + self.ttl_seconds, value))
+            self._schedule_sweep(now)
+            return seq
+
+    def _expire(self, now):
+        entries = self.entries
+        while entries and entries[0][1] <= now:
+            entries.popleft()
+
+    def _schedule_sweep(self, now):
+        if self.sweep_handle is None and self.entries and self.wheel is not None:
+            self.sweep_handle = self.wheel.schedule(self.entries[0][1] - now, self._sweep)
+
+    def _sweep(self):
+        with self.lock:
+            self.sweep_handle = None
+            now = self.clock()
+            self._expire(now)
+            self._schedule_sweep(now)
+            empty = not self.entries
+        if empty and self.on_empty is not None:
+            self.on_empty(self)
+
+    def get(self, seq: int, default=None):
+        """Look a value up by its sequence key."""
+        with self.lock:
+            self._expire(self.clock())
+            if not self.entries:
+                return default
+            # Live keys are contiguous: only the oldest ones ever leave
+            index = seq - self.entries[0][0]
+            if 0 <= index < len(self.entries):
+                return self.entries[index][2]
+            return default
+
+    def values(self) -> list:
+        with self.lock:
+            self._expire(self.clock())
+            return [value for _, _, value in self.entries]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.sweep_handle is not None:
+                self.wheel.cancel(self.sweep_handle)
+                self.sweep_handle = None
+
+    def __len__(self):
+        with self.lock:
+            self._expire(self.clock())
+            return len(self.entries)
+
+
+class ExpiringLogs:
+    """
+    One ExpiringLog per session id. A session disappears once all of its
+    entries have expired, so memory tracks live conversations only.
+    """
+    def __init__(self, ttl_seconds: float, max_entries_per_session: int = None, wheel: TimerWheel = None,
+                 clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries_per_session
+        self.wheel = wheel or shared_wheel()
+        self.clock = clock
+        self.logs = {}
+        self.lock = threading.Lock()
+
+    def _log(self, session_id) -> ExpiringLog:
+        log = self.logs.get(session_id)
+        if log is None:
+            log = self.logs[session_id] = ExpiringLog(
+                self.ttl_seconds, self.max_entries, self.wheel, self.clock,
+                on_empty=lambda emptied, key=session_id: self._drop_if_empty(key, emptied),
+            )
+        return log
+
+    def append(self, session_id, value) -> int:
+        # Under the store lock so a concurrent sweep can't drop the log between lookup and append
+        with self.lock:
+            return self._log(session_id).append(value)
+
+    def values(self, session_id) -> list:
+        with self.lock:
+            log = self.logs.get(session_id)
+        return log.values() if log is not None else []
+
+    def _drop_if_empty(self, session_id, log):
+        # Runs on the wheel thread after the log's own lock is released; lock order is store, then log
+        with self.lock:
+            if self.logs.get(session_id) is log and not len(log):
+                del self.logs[session_id]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.logs)
@@ -0,0 +1,238 @@
+"""
+Pipelined text-to-speech for the voice loop.
+
+Answers are split into sentences. A small worker pool synthesizes up to
+TTS_LOOKAHEAD sentences ahead of the one playing, so sentence N+1 is
+ready when sentence N ends. Audio for short, repeated sentences
+(greetings, the chatbot's fixed fallback messages) is kept in an LRU
+cache. cancel() drops everything queued and stops the sentence that is
+playing, which is what barge-in needs.
+
+Backends implement synthesize() and play(). speak() from Speak.py does
+both in one call, so SpeakBackend plays sentence by sentence but cannot
+synthesize ahead.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Settings
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "2"))
+# Sentences synthesized ahead of the one playing
+TTS_LOOKAHEAD = int(os.getenv("TTS_LOOKAHEAD", "3"))
+TTS_CACHE_ENTRIES = int(os.getenv("TTS_CACHE_ENTRIES", "128"))
+# Longer sentences are unlikely to repeat word for word
+TTS_CACHE_MAX_CHARS = 200
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text: str) -> list:
+    return [sentence.strip() for sentence in SENTENCE_END.split(text) if sentence.strip()]
+
+
+def _key(text):
+    return " ".join(text.lower().split())
+
+
+class TTSBackend:
+    """
+    synthesize() may run on several threads at once; play() runs on the
+    playback thread and should return early once `stop` is set.
+    """
+    # Whether synthesize() output is worth caching and preparing ahead
+    cacheable = True
+
+    def synthesize(self, text: str):
+        raise NotImplementedError
+
+    def play(self, audio, stop: threading.Event):
+        raise NotImplementedError
+
+
+class SpeakBackend(TTSBackend):
+    """The project's speak(text), which synthesizes and plays in one blocking call."""
+    cacheable = False
+
+    def __init__(self, speak):
+        self.speak = speak
+
+    def synthesize(self, text):
+        return text
+
+    def play(self, audio, stop):
+        self.speak(audio)
+
+
+class FakeBackend(TTSBackend):
+    """Takes time proportional to the text for both steps and records what was played; for tests and benchmarks."""
+    def __init__(self, synth_seconds_per_char: float = 0.002, play_seconds_per_char: float = 0.005):
+        self.synth_seconds_per_char = synth_seconds_per_char
+        self.play_seconds_per_char = play_seconds_per_char
+        self.synthesized = []
+        self.played = []
+
+    def synthesize(self, text):
+        time.sleep(len(text) * self.synth_seconds_per_char)
+        self.synthesized.append(text)
+        return text
+
+    def play(self, audio, stop):
+        if not stop.wait(len(audio) * self.play_seconds_per_char):
+            self.played.append(audio)
+
+
+class PhraseCache:
+    """LRU of synthesized audio by normalized text; pinned phrases are never evicted."""
+    def __init__(self, max_entries: int = TTS_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pinned = {}
+        self.lock = threading.Lock()
+
+    def get(self, text):
+        key = _key(text)
+        with self.lock:
+            if key in self.pinned:
+                return self.pinned[key]
+            audio = self.entries.get(key)
+            if audio is not None:
+                self.entries.move_to_end(key)
+            return audio
+
+    def put(self, text, audio, pin: bool = False):
+        key = _key(text)
+        with self.lock:
+            if pin:
+                self.pinned[key] = audio
+                self.entries.pop(key, None)
+                return
+            self.entries[key] = audio
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class _Sentence:
+    __slots__ = ("text", "tag", "stop", "future")
+
+    def __init__(self, text, tag, stop):
+        self.text = text
+        self.tag = tag
+        self.stop = stop
+        self.future = None
+
+
+class TTSScheduler:
+    """
+    One playback thread plus `workers` synthesis threads. `is_live(tag)`, if
+    given, is checked before synthesizing and before playing, so sentences
+    queued for an interrupted turn never make a sound.
+    """
+    def __init__(self, backend: TTSBackend, workers: int = TTS_WORKERS, lookahead: int = TTS_LOOKAHEAD,
+                 cache: PhraseCache = None, is_live=None):
+        self.backend = backend
+        self.lookahead = max(1, lookahead)
+        self.cache = cache if cache is not None else PhraseCache()
+        self.is_live = is_live
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self.queue = deque()
+        self.cond = threading.Condition()
+        # Replaced on every cancel(); setting the old one stops its sentences
+        self.stop = threading.Event()
+        self.playing = False
+        self.player = threading.Thread(target=self._play_loop, daemon=True, name="tts-player")
+        self.player.start()
+
+    def say(self, text: str, tag=None):
+        """Queue text for playback, split into sentences."""
+        with self.cond:
+            for sentence in split_sentences(text):
+                self.queue.append(_Sentence(sentence, tag, self.stop))
+            self._fill()
+            self.cond.notify_all()
+
+    def prewarm(self, phrases):
+        """Synthesize phrases now and keep them for good, e.g. the fixed fallback answers."""
+        if not self.backend.cacheable:
+            return
+        for phrase in phrases:
+            self.pool.submit(self._prewarm, phrase)
+
+    def _prewarm(self, phrase):
+        try:
+            self.cache.put(phrase, self.backend.synthesize(phrase), pin=True)
+        except Exception as e:
+            logger.error(f"TTS prewarm failed for {phrase!r}: {str(e)}")
+
+    def cancel(self):
+        """Drop every queued sentence and stop the one playing."""
+        with self.cond:
+            stop, self.stop = self.stop, threading.Event()
+            stop.set()
+            for sentence in self.queue:
+                if sentence.future is not None:
+                    sentence.future.cancel()
+            dropped = len(self.queue)
+            self.queue.clear()
+            self.cond.notify_all()
+        metrics.registry.inc("tts_sentences_cancelled_total", dropped, "Queued TTS sentences dropped by cancel()")
+
+    def _live(self, sentence):
+        return not sentence.stop.is_set() and (self.is_live is None or self.is_live(sentence.tag))
+
+    def _fill(self):
+        """Start synthesis for the next `lookahead` sentences (caller holds the lock)."""
+        for sentence in list(self.queue)[:self.lookahead]:
+            if sentence.future is None and self._live(sentence):
+                sentence.future = self.pool.submit(self._synthesize, sentence)
+
+    def _synthesize(self, sentence):
+        if not self.backend.cacheable:
+            return self.backend.synthesize(sentence.text)
+        audio = self.cache.get(sentence.text)
+        if audio is not None:
+            metrics.registry.inc("tts_cache_hits_total", 1, "TTS sentences served from the phrase cache")
+            return audio
+        with metrics.span("tts_synthesize", pipeline="voice"):
+            audio = self.backend.synthesize(sentence.text)
+        if len(sentence.text) <= TTS_CACHE_MAX_CHARS:
+            self.cache.put(sentence.text, audio)
+        return audio
+
+    def _play_loop(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.playing = False
+                    self.cond.notify_all()
+                    self.cond.wait()
+                self.playing = True
+                sentence = self.queue.popleft()
+                if sentence.future is None and self._live(sentence):
+                    sentence.future = self.pool.submit(self._synthesize, sentence)
+                self._fill()
+            if sentence.future is None or not self._live(sentence):
+                continue
+            try:
+                audio = sentence.future.result()
+                if not self._live(sentence):
+                    continue
+                with metrics.span("tts", pipeline="voice"):
+                    self.backend.play(audio, sentence.stop)
+            except Exception as e:
+                if not sentence.future.cancelled():
+                    logger.error(f"TTS failed: {str(e)}")
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """Block until everything queued has been played or dropped."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.queue and not self.playing, timeout)
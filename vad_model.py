@@ -0,0 +1,152 @@
+"""
+Silero VAD loading, shared by the live loop (main.py) and offline_voice.py.
+
+The model is found without the network when possible, in this order:
+  1. VAD_MODEL_PATH, a TorchScript (.jit) or ONNX (.onnx) file, e.g. a copy
+     vendored into the deployment,
+  2. the copy bundled with the silero-vad pip package,
+  3. the torch hub cache from an earlier torch.hub.load,
+  4. torch.hub from GitHub, as before.
+A file at VAD_MODEL_PATH still needs silero's utils_vad (VADIterator and
+friends) from the package or the hub cache.
+VAD_ONNX=1 runs the model through onnxruntime, which costs less CPU per
+frame than TorchScript for a model this small. warm_up() loads and exercises
+the model on a background thread so the microphone can start right away.
+"""
+import os
+import time
+import logging
+import threading
+import importlib.util
+
+logger = logging.getLogger(__name__)
+
+# Settings
+VAD_ONNX = os.getenv("VAD_ONNX", "0") not in ("0", "false", "False")
+# The extension picks the runtime: .onnx runs on onnxruntime, anything else is TorchScript
+VAD_MODEL_PATH = os.getenv("VAD_MODEL_PATH", "models/silero_vad.onnx" if VAD_ONNX else "models/silero_vad.jit")
+HUB_REPO = "snakers4/silero-vad"
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = 512
+WARM_UP_FRAMES = 8
+
+
+def _hub_repo_dir():
+    import torch
+    return os.path.join(torch.hub.get_dir(), HUB_REPO.replace("/", "_") + "_master")
+
+
+def _utils_module():
+    """silero's utils_vad (get_speech_timestamps, VADIterator, ...) from the package or the hub cache."""
+    try:
+        from silero_vad import utils_vad
+        return utils_vad
+    except ImportError:
+        pass
+    repo = _hub_repo_dir()
+    for path in (os.path.join(repo, "src", "silero_vad", "utils_vad.py"), os.path.join(repo, "utils_vad.py")):
+        if os.path.exists(path):
+            spec = importlib.util.spec_from_file_location("utils_vad", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+    return None
+
+
+def _utils_tuple(utils_vad):
+    return (utils_vad.get_speech_timestamps, utils_vad.save_audio, utils_vad.read_audio,
+            utils_vad.VADIterator, utils_vad.collect_chunks)
+
+
+class VADModel:
+    """Loads the Silero model once, from the first source that has it; thread-safe."""
+    def __init__(self, path: str = VAD_MODEL_PATH, onnx: bool = VAD_ONNX):
+        self.path = path
+        self.onnx = onnx
+        self.lock = threading.Lock()
+        self.loaded = None
+        self.source = None
+        self.load_seconds = None
+        self.warmup_thread = None
+        self.in_use = False
+
+    def _load_file(self, utils_vad):
+        if self.path.endswith(".onnx"):
+            return utils_vad.OnnxWrapper(self.path, force_onnx_cpu=True)
+        import torch
+        model = torch.jit.load(self.path, map_location="cpu")
+        model.eval()
+        return model
+
+    def _load(self):
+        import torch
+        utils_vad = _utils_module()
+        if self.path and os.path.exists(self.path) and utils_vad is not None:
+            return self._load_file(utils_vad), _utils_tuple(utils_vad), self.path
+        try:
+            from silero_vad import load_silero_vad
+            return load_silero_vad(onnx=self.onnx), _utils_tuple(utils_vad), "silero-vad package"
+        except ImportError:
+            pass
+        repo = _hub_repo_dir()
+        if os.path.isdir(repo):
+            model, utils = torch.hub.load(repo_or_dir=repo, model="silero_vad", source="local", onnx=self.onnx)
+            return model, utils, repo
+        logger.warning(f"No local Silero VAD (VAD_MODEL_PATH={self.path}); downloading from torch hub")
+        model, utils = torch.hub.load(repo_or_dir=HUB_REPO, model="silero_vad", force_reload=False, onnx=self.onnx)
+        return model, utils, HUB_REPO
+
+    def _ensure_loaded(self):
+        if self.loaded is None:
+            started = time.perf_counter()
+            model, utils, self.source = self._load()
+            self.load_seconds = time.perf_counter() - started
+            self.loaded = (model, utils)
+            logger.info(f"Loaded Silero VAD from {self.source} in {self.load_seconds:.2f}s")
+        return self.loaded
+
+    def get(self):
+        """(model, utils) as torch.hub returns them; loads on first call, and waits for a running warm-up."""
+        with self.lock:
+            self.in_use = True
+            return self._ensure_loaded()
+
+    def _warm_up(self):
+        try:
+            import torch
+            # Under the lock: the model is stateful, nobody may use it until it has been reset
+            with self.lock:
+                model, _ = self._ensure_loaded()
+                if self.in_use:
+                    # Someone got the model first; running it here would corrupt their state
+                    return
+                # The first calls pay for graph optimization and allocator growth
+                frame = torch.zeros(FRAME_SAMPLES)
+                for _ in range(WARM_UP_FRAMES):
+                    model(frame, SAMPLE_RATE)
+                model.reset_states()
+        except Exception as e:
+            logger.error(f"VAD warm-up failed: {str(e)}")
+
+    def warm_up(self, background: bool = True):
+        """Load and exercise the model now; returns the warm-up thread when backgrounded."""
+        if not background:
+            self._warm_up()
+            return None
+        with self.lock:
+            if self.warmup_thread is None:
+                self.warmup_thread = threading.Thread(target=self._warm_up, daemon=True, name="vad-warmup")
+                self.warmup_thread.start()
+            return self.warmup_thread
+
+
+_default = VADModel()
+
+
+def load_silero():
+    """(model, utils) of the default VADModel."""
+    return _default.get()
+
+
+def warm_up(background: bool = True):
+    return _default.warm_up(background)
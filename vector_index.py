@@ -0,0 +1,162 @@
+import os
+import json
+import math
+import faiss
+import numpy as np
+
+# Settings
+INDEX_TYPES = ("flat-l2", "flat-ip", "ivf-flat", "ivf-pq", "hnsw")
+INDEX_PARAMS_FILE = os.path.join("faiss_store", "index.json")
+# Corpus sizes at which the automatic choice moves to an approximate index
+HNSW_MIN_VECTORS = 20000
+IVF_PQ_MIN_VECTORS = 500000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# IVF-PQ codes are lossy; fetch this many times k candidates and re-rank them exactly
+RERANK_FACTOR = 4
+# Stores written before index.json existed hold an IndexFlatL2 over raw vectors
+LEGACY_PARAMS = {"type": "flat-l2", "normalized": False}
+
+
+def choose_index_type(n_vectors: int) -> str:
+    """Exact search while it is cheap, graph search for mid-size, compressed IVF for large corpora."""
+    if n_vectors < HNSW_MIN_VECTORS:
+        return "flat-ip"
+    if n_vectors < IVF_PQ_MIN_VECTORS:
+        return "hnsw"
+    return "ivf-pq"
+
+
+def normalize(vectors) -> np.ndarray:
+    vectors = np.array(vectors, dtype="float32", copy=True).reshape(-1, np.shape(vectors)[-1])
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def prepare(vectors, params) -> np.ndarray:
+    """Shape vectors for an index: float32 rows, unit length for inner-product indexes."""
+    if params.get("normalized"):
+        return normalize(vectors)
+    return np.ascontiguousarray(np.reshape(vectors, (-1, np.shape(vectors)[-1])), dtype="float32")
+
+
+def supports_removal(params) -> bool:
+    return params["type"] != "hnsw"
+
+
+def build_index(embeddings, ids, index_type=None):
+    """Build and fill an index of the given (or automatically chosen) type. Returns (index, params)."""
+    embeddings = np.asarray(embeddings, dtype="float32")
+    ids = np.asarray(ids, dtype=np.int64)
+    n, dim = embeddings.shape
+    index_type = index_type or choose_index_type(n)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type}, expected one of {INDEX_TYPES}")
+
+    params = {"type": index_type, "dim": dim, "normalized": index_type != "flat-l2", "trained_on": n}
+    vectors = prepare(embeddings, params)
+
+    if index_type == "flat-l2":
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(dim))
+    elif index_type == "flat-ip":
+        index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+    elif index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap(inner)
+        params.update(m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+    else:
+        # ~4*sqrt(n) lists, but keep at least 39 training points per centroid
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf-flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            # 4 dimensions per sub-quantizer (96 bytes per MiniLM vector)
+            pq_m = next(m for m in range(max(1, dim // 4), 0, -1) if dim % m == 0)
+            nbits = 8 if n >= 256 * 39 else max(1, int(math.log2(max(n // 39, 2))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, nbits, faiss.METRIC_INNER_PRODUCT)
+            params.update(pq_m=pq_m, pq_nbits=nbits, rerank=True)
+        index.train(vectors)
+        params["nlist"] = nlist
+        # IVF indexes store ids natively and support remove_ids without an IDMap wrapper
+
+    index.add_with_ids(vectors, ids)
+    return index, params
+
+
+def search_parameters(params, nprobe=None, ef_search=None):
+    """Per-query search knobs, so concurrent searches don't mutate shared index state."""
+    if params["type"] in ("ivf-flat", "ivf-pq"):
+        return faiss.SearchParametersIVF(nprobe=min(nprobe or DEFAULT_NPROBE, params.get("nlist", 1)))
+    if params["type"] == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or DEFAULT_EF_SEARCH)
+    return None
+
+
+def rerank(queries, indices, k, vectors_for_ids):
+    """Exact inner-product re-ranking of approximate candidates using the stored embeddings."""
+    out_scores = np.full((len(queries), k), -np.inf, dtype="float32")
+    out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(queries, indices)):
+        candidates = candidates[candidates >= 0]
+        if not len(candidates):
+            continue
+        scores = normalize(vectors_for_ids(candidates)) @ query
+        order = np.argsort(-scores)[:k]
+        out_scores[row, :len(order)] = scores[order]
+        out_ids[row, :len(order)] = candidates[order]
+    return out_scores, out_ids
+
+
+def search(index, params, queries, k, nprobe=None, ef_search=None, vectors_for_ids=None):
+    """
+    Search with per-query knobs. `vectors_for_ids` maps ids to their stored
+    float32 embeddings; when given, lossy indexes are re-ranked exactly.
+    """
+    search_params = search_parameters(params, nprobe, ef_search)
+    vectors = prepare(queries, params)
+    use_rerank = params.get("rerank") and vectors_for_ids is not None
+    fetch = k * RERANK_FACTOR if use_rerank else k
+    if search_params is None:
+        distances, indices = index.search(vectors, fetch)
+    else:
+        distances, indices = index.search(vectors, fetch, params=search_params)
+    if use_rerank:
+        return rerank(vectors, indices, k, vectors_for_ids)
+    return distances, indices
+
+
+def similarity(distances, params) -> np.ndarray:
+    """
+    Search results as cosine similarities, comparable across indexes. Legacy
+    flat-l2 stores hold raw MiniLM vectors, which the model already emits at
+    unit length, so their squared L2 distance d maps to 1 - d / 2.
+    """
+    if params.get("normalized"):
+        return distances
+    return 1.0 - distances / 2.0
+
+
+def save_params(data_dir, params):
+    # Imported here: chunk_store imports this module
+    from chunk_store import replace_file
+
+    path = os.path.join(data_dir, INDEX_PARAMS_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(params, f)
+
+    replace_file(path, write)
+
+
+def load_params(data_dir):
+    path = os.path.join(data_dir, INDEX_PARAMS_FILE)
+    if not os.path.exists(path):
+        return dict(LEGACY_PARAMS)
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,153 @@
+"""
+Streaming turn handling for the voice loop.
+
+The listener pushes (kind, turn, audio) events while the user speaks instead
+of one clip per utterance; audio is PCM bytes, or a frame number in an
+AudioRing when the pipeline has one, so no audio is copied on the way.
+VoicePipeline transcribes them as they arrive, starts retrieval as soon as
+the partial transcript settles, and only waits for the final decode at end
+of speech. New speech while an answer is still being
+generated or spoken is a barge-in: the old turn is cancelled and whatever of
+it is still queued for TTS is dropped.
+"""
+import os
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Settings
+# Partials that must agree on a prefix before it is treated as final
+STABLE_PARTIAL_AGREEMENT = 2
+# Shorter stable prefixes are too vague to retrieve for
+MIN_PREFETCH_WORDS = 3
+VOICE_BARGE_IN = os.getenv("VOICE_BARGE_IN", "1") not in ("0", "false", "False")
+
+SPEECH_START = "start"
+SPEECH_AUDIO = "audio"
+SPEECH_END = "end"
+
+
+class PartialStabilizer:
+    """
+    Local agreement over partial transcripts: the words that the last
+    `agreement` partials share as a prefix are unlikely to change again.
+    """
+    def __init__(self, agreement: int = STABLE_PARTIAL_AGREEMENT):
+        self.recent = deque(maxlen=agreement)
+        self.stable = []
+
+    def update(self, partial: str):
+        """Returns the stable prefix when it grew with this partial, else None."""
+        self.recent.append(partial.split())
+        if len(self.recent) < self.recent.maxlen:
+            return None
+        common = []
+        for words in zip(*self.recent):
+            if any(word != words[0] for word in words):
+                break
+            common.append(words[0])
+        if len(common) <= len(self.stable):
+            return None
+        self.stable = common
+        return " ".join(common)
+
+
+class VoicePipeline:
+    """
+    Consumes listener events on one thread. `respond(text, turn)` produces and
+    queues the answer for a finished utterance and should stop once
+    is_current(turn) turns false; `prefetch(text)` warms retrieval for a
+    stable partial on a side thread; `on_barge_in()` stops playback;
+    `is_playing()` says whether the last answer is still being spoken.
+    """
+    def __init__(self, transcriber, respond, prefetch=None, on_barge_in=None, barge_in: bool = VOICE_BARGE_IN,
+                 ring=None, is_playing=None):
+        self.transcriber = transcriber
+        self.ring = ring
+        self.respond = respond
+        self.prefetch = prefetch
+        self.on_barge_in = on_barge_in
+        self.is_playing = is_playing
+        self.barge_in = barge_in
+        self.lock = threading.Lock()
+        self.turn = 0
+        # Turns before this one have been interrupted
+        self.live_from = 0
+        # Set while respond() runs for a turn
+        self.answering = False
+        self.prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voice-prefetch")
+        self.prefetching = None
+
+    def speech_started(self) -> int:
+        """Called from the listener when VAD hears speech; returns the new turn's number."""
+        with self.lock:
+            self.turn += 1
+            # Speech after the answer has finished is just the next question
+            interrupted = self.barge_in and self.turn > 1 and (
+                self.answering or (self.is_playing is not None and self.is_playing()))
+            if interrupted:
+                self.live_from = self.turn
+        if interrupted:
+            metrics.registry.inc("voice_barge_ins_total", 1, "Utterances that started a new turn over the old one")
+            if self.on_barge_in is not None:
+                self.on_barge_in()
+        return self.turn
+
+    def is_current(self, turn: int) -> bool:
+        return turn >= self.live_from
+
+    def _prefetch(self, text):
+        # One in flight at a time; a newer stable prefix can wait for the next partial
+        if self.prefetch is None or (self.prefetching is not None and not self.prefetching.done()):
+            return
+        metrics.registry.inc("voice_prefetches_total", 1, "Retrievals started from stable partial transcripts")
+        self.prefetching = self.prefetcher.submit(self._run_prefetch, text)
+
+    def _run_prefetch(self, text):
+        try:
+            self.prefetch(text)
+        except Exception as e:
+            logger.error(f"Prefetch failed: {str(e)}")
+
+    def run(self, audio_queue):
+        stream = stabilizer = None
+        turn = 0
+        while True:
+            kind, event_turn, audio = audio_queue.get()
+            if kind == SPEECH_START:
+                stream, stabilizer, turn = self.transcriber.stream(), PartialStabilizer(), event_turn
+            if stream is None:
+                continue
+            try:
+                if audio is not None:
+                    with metrics.span("stt_partial", pipeline="voice"):
+                        partial = stream.feed(self.ring.pcm(audio) if self.ring is not None else audio)
+                    if self.ring is not None and not self.ring.valid(audio):
+                        # The microphone lapped us while we read; this utterance is garbage
+                        raise RuntimeError("audio ring overrun, dropping the utterance")
+                    if partial:
+                        logger.debug(f"Partial transcript: {partial}")
+                        stable = stabilizer.update(partial)
+                        if stable and len(stable.split()) >= MIN_PREFETCH_WORDS:
+                            self._prefetch(stable)
+                if kind == SPEECH_END:
+                    finished, stream = stream, None
+                    with metrics.request_trace("voice"):
+                        with metrics.span("stt", pipeline="voice"):
+                            text = finished.finish()
+                        if not text:
+                            print("Could not understand audio")
+                            continue
+                        self.answering = True
+                        try:
+                            self.respond(text, turn)
+                        finally:
+                            self.answering = False
+            except Exception as e:
+                stream = None
+                logger.error(f"Voice turn failed: {str(e)}")